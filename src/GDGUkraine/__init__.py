@@ -1,7 +1,13 @@
 from .lib.plugins import register_plugins
 from .lib.tools import register_tools
+from .lib.utils.hierarchy import register as register_place_hierarchy
+from .lib.utils.timing import register as register_query_timing
+from .lib.utils.versions import register as register_version_tracking
 
 __version__ = '1.0'
 
 register_plugins()
 register_tools()
+register_version_tracking()
+register_place_hierarchy()
+register_query_timing()
@@ -1,17 +1,192 @@
+import hashlib
 import logging
+import os
+import threading
 
 from GDGUkraine.model import (
     Admin, User,
-    Event, EventParticipant,
-    Place, Invite, WPPost,
+    Event, EventParticipant, EventStats, RegistrationTombstone,
+    Place, PlaceClosure, Invite, WPPost,
 )
-from datetime import date
+from datetime import date, datetime, time, timedelta
+from itertools import islice
 
-from sqlalchemy.sql.expression import false
+from sqlalchemy.exc import CompileError, IntegrityError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session, joinedload, load_only, undefer
+from sqlalchemy.sql.expression import (
+    Insert, and_, case, func, or_, select, update,
+)
+
+from .lib.utils import metrics
+from .lib.utils.bloom import BloomFilter
+from .lib.utils.cache import LRUCache
+from .lib.utils.places import PlaceRegistry
+from .lib.utils.roster import Roster
+from .lib.utils.versions import (
+    get_shared_version, get_version, get_versions, touch,
+)
 
 
 logger = logging.getLogger(__name__)
 
+# Holds one date-ordered list of upcoming events per (day, versions) pair
+_upcoming_events = LRUCache(maxsize=4)
+
+_place_registries = LRUCache(maxsize=2)
+
+# Check-in rosters by (event id, registrations and users versions)
+_rosters = LRUCache(maxsize=16)
+
+EVENT_STATS_COUNTERS = ('registered', 'accepted', 'confirmed', 'visited')
+
+# Breakdowns of participants by (event id, status, registrations and users
+# versions)
+_aggregates = LRUCache(maxsize=64)
+
+AGGREGATED_USER_FIELDS = (
+    't_shirt_size', 'experience_level', 'english_knowledge', 'gender',
+    'hometown',
+)
+REGISTRATION_STATUSES = ('all', 'approved', 'waiting')
+
+# Bloom filters of issued invite codes: event id -> (codes version, filter)
+_invite_filters = {}
+# Version stamp of the set of issued codes. Unlike the Invite one, it isn't
+# bumped when invites get used, which happens on every invitee registration
+INVITE_CODES_VERSION = 'invite_codes'
+_invite_filters_lock = threading.Lock()
+
+INVITE_FILTER_ERROR_RATE = 0.01
+INVITE_FILTER_MIN_CAPACITY = 256
+
+# Rows per executemany of bulk invite inserts
+INVITE_CHUNK_SIZE = 1000
+
+
+class Upsert(Insert):
+    """``INSERT ... ON DUPLICATE KEY UPDATE`` statement (MySQL only)
+
+    A row conflicting by ``key`` columns gets ``update_columns`` overwritten
+    with inserted values. A conflict on any other unique key leaves the row
+    untouched. ``lastrowid`` of the result holds the id of the inserted row,
+    the id of the updated one if ``report_updates`` is set, or 0 otherwise.
+    """
+    def __init__(self, table, key, update_columns, report_updates=True,
+                 **kwargs):
+        super().__init__(table, **kwargs)
+        self.key = tuple(key)
+        self.update_columns = tuple(update_columns)
+        self.report_updates = report_updates
+
+
+@compiles(Upsert)
+def _compile_upsert(element, compiler, **kw):
+    raise CompileError(
+        'Upsert is not supported by {} dialect'.format(compiler.dialect.name))
+
+
+@compiles(Upsert, 'mysql')
+def _compile_upsert_mysql(element, compiler, **kw):
+    quote = compiler.preparer.quote
+    pk, = (quote(c.name) for c in element.table.primary_key)
+
+    # Matches only conflicts on our key, not on other unique ones
+    is_key_conflict = ' AND '.join(
+        '{0} = VALUES({0})'.format(quote(c)) for c in element.key)
+    assignments = [
+        '{0} = IF({1}, VALUES({0}), {0})'.format(quote(c), is_key_conflict)
+        for c in element.update_columns
+    ]
+
+    # LAST_INSERT_ID(expr) makes expr the statement's lastrowid
+    if element.report_updates:
+        assignments.append(
+            '{0} = IF({1}, LAST_INSERT_ID({0}), {0} + LAST_INSERT_ID(0))'
+            .format(pk, is_key_conflict))
+    else:
+        assignments.append('{0} = {0} + LAST_INSERT_ID(0)'.format(pk))
+
+    return '{} ON DUPLICATE KEY UPDATE {}'.format(
+        compiler.visit_insert(element, **kw), ', '.join(assignments))
+
+
+def _is_mysql(session, model):
+    return session.get_bind(model).dialect.name == 'mysql'
+
+
+def upsert_user(session, values):
+    """Inserts a user or updates the one with the same email
+
+    Only keys present in ``values`` are overwritten on update.
+
+    Returns:
+        (int): user id or None if values conflict with unique fields
+               of another user
+    """
+    users = User.__table__
+    update_columns = [k for k in values if k not in ('id', 'email')]
+    touch(session, User)
+
+    if _is_mysql(session, User):
+        res = session.execute(
+            Upsert(users, key=['email'], update_columns=update_columns)
+            .values(**values)
+        )
+        return res.lastrowid or None
+
+    # Emulation for other dialects, e.g. SQLite in tests
+    try:
+        if update_columns:
+            session.execute(
+                update(users)
+                .where(users.c.email == values['email'])
+                .values(**{k: values[k] for k in update_columns})
+            )
+        user = find_user_by_email(session, values['email'])
+        if user is not None:
+            return user.id
+        return session.execute(
+            users.insert().values(**values)).inserted_primary_key[0]
+    except IntegrityError:
+        return None
+
+
+def upsert_registration(session, values):
+    """Registers a user at an event or updates the existing registration
+
+    Args:
+        values (dict): must contain ``googler_id`` and ``event_id``
+    Returns:
+        (bool): True if a new registration was created
+    """
+    regs = EventParticipant.__table__
+    key = ('googler_id', 'event_id')
+    # Upsert updates only listed columns, so onupdate is applied here
+    values = dict(values, updated_at=datetime.utcnow(),
+                  change_seq=next_change_seq(session, values['event_id']))
+    update_columns = [k for k in values if k not in key and k != 'id']
+    touch(session, EventParticipant)
+
+    if _is_mysql(session, EventParticipant):
+        res = session.execute(
+            Upsert(regs, key=key, update_columns=update_columns,
+                   report_updates=False)
+            .values(**values)
+        )
+        return bool(res.lastrowid)
+
+    # Emulation for other dialects, e.g. SQLite in tests
+    res = session.execute(
+        update(regs)
+        .where(and_(*(regs.c[k] == values[k] for k in key)))
+        .values(**{k: values[k] for k in update_columns})
+    )
+    if res.rowcount:
+        return False
+    session.execute(regs.insert().values(**values))
+    return True
+
 
 def get_all_posts(session, offset=0, lim=10):
     q = session.query(WPPost).order_by(-WPPost.post_date)
@@ -23,9 +198,52 @@ def get_place_by_id(session, id):
     return session.query(Place).get(id)
 
 
-def find_user_by_id(session, id):
+def get_admin_place(admin):
+    """Returns place, whose data the admin is restricted to
+
+    Admins with ``filter_place`` see its events and participants, including
+    ones of its subdivisions. Godmode ones see everything.
+
+    Args:
+        admin (dict): admin user from HTTP session
+    Returns:
+        (int): place id or None if admin is not restricted
+    """
+    if admin.get('godmode') or not admin.get('filter_place'):
+        return None
+    return admin['filter_place']
+
+
+def _scope_events(q, place):
+    if place is None:
+        return q
+    return q.join(PlaceClosure,
+                  PlaceClosure.descendant_id == Event.host_gdg_id)\
+        .filter(PlaceClosure.ancestor_id == place)
+
+
+def _scope_users(session, q, place):
+    # Users from the places or registered to events hosted there
+    if place is None:
+        return q
+    places = session.query(PlaceClosure.descendant_id)\
+        .filter(PlaceClosure.ancestor_id == place)
+    registered = _scope_events(
+        session.query(EventParticipant.googler_id)
+        .join(Event, EventParticipant.event_id == Event.id),
+        place)
+    return q.filter(or_(
+        User.local_gdg_id.in_(places.subquery()),
+        User.id.in_(registered.subquery()),
+    ))
+
+
+def find_user_by_id(session, id, place=None):
     id = int(id)
-    return session.query(User).get(id)
+    if place is None:
+        return session.query(User).get(id)
+    q = session.query(User).filter(User.id == id)
+    return _scope_users(session, q, place).first()
 
 
 def find_user_by_email(session, email):
@@ -49,13 +267,58 @@ def get_all_users(session):
     return session.query(User).all()
 
 
+def list_users(session, after=None, limit=None, fields=None, filters=None,
+               place=None):
+    """Lists users ordered by id, page by page
+
+    Pages are selected by id of the last user on the previous one (keyset
+    pagination), so deep pages cost as much as the first one.
+
+    Args:
+        session: ORM session
+        after (int) [Optional]: id of the last user on the previous page
+        limit (int) [Optional]: max number of users to return
+        fields (list) [Optional]: column names to load, besides ``id``
+        filters (dict) [Optional]: values of columns to match
+        place (int) [Optional]: id of place to restrict users to, along
+                                with its subdivisions, see
+                                ``get_admin_place``
+    Returns:
+        (list): users
+    """
+    q = _scope_users(session, session.query(User), place)
+    if fields:
+        q = q.options(load_only(*(getattr(User, f) for f in fields)))
+    for name, value in (filters or {}).items():
+        q = q.filter(getattr(User, name) == value)
+    if after is not None:
+        q = q.filter(User.id > after)
+    q = q.order_by(User.id)
+    if limit:
+        q = q.limit(limit)
+    return q.all()
+
+
 def get_users_by_ids(session, ids):
     return session.query(User).filter(User.id.in_(ids)).all()
 
 
-def get_event_registrations_by_ids(session, reg_ids):
-    return session.query(EventParticipant)\
-        .filter(EventParticipant.id.in_(reg_ids)).all()
+def get_event_registrations_by_ids(session, reg_ids, event_id=None):
+    """Finds registrations by ids
+
+    Args:
+        session: ORM session
+        reg_ids (iterable): ids of registrations
+        event_id (int) [Optional]: event, ids of other events' registrations
+            are skipped
+    Returns:
+        (list): registrations
+    """
+    q = session.query(EventParticipant)\
+        .filter(EventParticipant.id.in_(reg_ids))
+    if event_id is not None:
+        q = q.filter(EventParticipant.event_id == event_id)
+    return q.all()
 
 
 def get_event_registration_by_id(session, reg_id):
@@ -69,9 +332,20 @@ def get_all_gdg_places(session, filtered=False):
     return q.order_by(Place.city).all()
 
 
-def find_event_by_id(session, id_):
+def get_place_registry(session):
+    """Returns snapshot of all places, rebuilt on every place write"""
+    return _place_registries.get_or_set(
+        get_version(Place),
+        lambda: PlaceRegistry(get_all_gdg_places(session, filtered=False)),
+    )
+
+
+def find_event_by_id(session, id_, place=None):
     # correctness of id_ is a matter of the caller
-    return session.query(Event).get(id_)
+    if place is None:
+        return session.query(Event).get(id_)
+    q = session.query(Event).filter(Event.id == id_)
+    return _scope_events(q, place).first()
 
 
 def find_host_gdg_by_event(session, event):
@@ -82,31 +356,584 @@ def find_host_gdg_by_event(session, event):
         return None
 
 
+def _seconds_till_midnight():
+    now = datetime.now()
+    midnight = datetime.combine(now.date() + timedelta(days=1), time.min)
+    return (midnight - now).total_seconds()
+
+
+def _load_upcoming_events(session, today):
+    """Loads events, which are either upcoming or still open for registration
+
+    Events are loaded through a separate session and detached from it with
+    all attributes, used in templates, so they can be shared across requests.
+    """
+    index_session = Session(bind=session.get_bind(Event))
+    try:
+        events = (
+            index_session.query(Event)
+            .options(joinedload(Event.host_gdg),
+                     undefer(Event.desc), undefer(Event.google_map_iframe))
+            .filter(or_(Event.date >= today, Event.closereg > today))
+            .order_by(Event.date.asc(), Event.id.asc())
+            .all()
+        )
+        index_session.expunge_all()
+        return events
+    finally:
+        index_session.close()
+
+
+def get_upcoming_events_index(session):
+    """Returns cached date-ordered list of upcoming events
+
+    The list expires at the next local midnight or as soon as any event or
+    place gets changed. Returned events are detached and read-only.
+    """
+    today = date.today()
+    return _upcoming_events.get_or_set(
+        (today, get_versions(Event, Place)),
+        lambda: _load_upcoming_events(session, today),
+        ttl=_seconds_till_midnight(),
+    )
+
+
+def _slice_events(events, lim):
+    return events[:lim] if lim else events
+
+
 def get_all_events(session, lim=None, hide_closed=False):
-    q = session.query(Event).order_by(Event.date)
     if hide_closed:
-        q = q.filter(Event.closereg > date.today())
+        today = date.today()
+        return _slice_events([
+            e for e in get_upcoming_events_index(session)
+            if e.closereg is not None and e.closereg > today
+        ], lim)
+
+    q = session.query(Event).order_by(Event.date)
     if lim:
         q = q.limit(lim)
     return q.all()
 
 
-def get_n_upcoming_events(session, limit=None, hide_closed=False):
-    q = (
-        session.query(Event)
-        .filter(Event.testing == false())
-        .filter(Event.date >= date.today())
-        .order_by(Event.date.asc())
-    )
-    if hide_closed:
-        q = q.filter(Event.closereg > date.today())
+def list_events(session, after=None, limit=None, fields=None,
+                host_gdg_id=None, since=None, until=None, testing=None,
+                place=None):
+    """Lists events ordered by date and id, page by page
+
+    Events without date go first, as MySQL sorts NULLs first.
+
+    Args:
+        session: ORM session
+        after (tuple) [Optional]: (date, id) of the last event on the
+                                  previous page
+        limit (int) [Optional]: max number of events to return
+        fields (list) [Optional]: column names to load, besides ``id``
+        host_gdg_id (int) [Optional]: id of hosting place
+        since (date) [Optional]: earliest date of event
+        until (date) [Optional]: latest date of event
+        testing (bool) [Optional]: whether event is a testing one
+        place (int) [Optional]: id of place to restrict hosts to, along
+                                with its subdivisions, see
+                                ``get_admin_place``
+    Returns:
+        (list): events
+    """
+    q = _scope_events(session.query(Event), place)
+    if fields:
+        q = q.options(load_only(*(getattr(Event, f) for f in fields)))
+    if host_gdg_id is not None:
+        q = q.filter(Event.host_gdg_id == host_gdg_id)
+    if since is not None:
+        q = q.filter(Event.date >= since)
+    if until is not None:
+        q = q.filter(Event.date <= until)
+    if testing is not None:
+        q = q.filter(Event.testing == testing)
+    if after is not None:
+        after_date, after_id = after
+        if after_date is None:
+            q = q.filter(or_(
+                Event.date.isnot(None),
+                and_(Event.date.is_(None), Event.id > after_id),
+            ))
+        else:
+            q = q.filter(or_(
+                Event.date > after_date,
+                and_(Event.date == after_date, Event.id > after_id),
+            ))
+    q = q.order_by(Event.date, Event.id)
     if limit:
         q = q.limit(limit)
     return q.all()
 
 
+def get_n_upcoming_events(session, limit=None, hide_closed=False):
+    today = date.today()
+    return _slice_events([
+        e for e in get_upcoming_events_index(session)
+        if not e.testing and e.date is not None and e.date >= today and (
+            not hide_closed or
+            e.closereg is not None and e.closereg > today
+        )
+    ], limit)
+
+
+def next_change_seq(session, event_id):
+    """Takes the next number of a registration change at the event
+
+    The event's counter is incremented by an UPDATE, which locks the event
+    row till the end of transaction, so numbers get committed in the order
+    they were taken: a change never becomes visible after a higher numbered
+    one. It must be the first lock taken by registration writes, before the
+    rows they change, their counters and seats, to never deadlock with
+    other writes.
+
+    Args:
+        session: ORM session
+        event_id (int): event, which registrations are about to change
+    Returns:
+        (int): change number or None if there's no such event
+    """
+    events = Event.__table__
+    res = session.execute(
+        update(events)
+        .where(events.c.id == event_id)
+        .values(change_seq=events.c.change_seq + 1)
+    )
+    if not res.rowcount:
+        return None
+    # The transaction sees its own write, and no one else can change it
+    return session.execute(
+        select([events.c.change_seq]).where(events.c.id == event_id)
+    ).scalar()
+
+
+def reserve_seat(session, event_id, force=False):
+    """Atomically takes a seat at the event
+
+    The counter is checked and incremented by a single conditional UPDATE,
+    so concurrent registrations can't oversubscribe ``max_regs``. It locks
+    the event row till the end of transaction, which registration writes
+    have done already, see ``next_change_seq``.
+
+    Being a plain counter, it is not tracked by model version stamps.
+
+    Args:
+        session: ORM session
+        event_id (int): event to take a seat at
+        force (bool): whether to ignore ``max_regs`` (e.g. for invitees)
+    Returns:
+        (bool): True if seat was taken, False if event is full
+    """
+    events = Event.__table__
+    stmt = (
+        update(events)
+        .where(events.c.id == event_id)
+        .values(seats_taken=events.c.seats_taken + 1)
+    )
+    if not force:
+        stmt = stmt.where(or_(events.c.max_regs.is_(None),
+                              events.c.seats_taken < events.c.max_regs))
+    return session.execute(stmt).rowcount == 1
+
+
+def release_seat(session, event_id):
+    """Atomically frees a seat taken by a removed registration
+
+    Args:
+        session: ORM session
+        event_id (int): event to free a seat at
+    """
+    events = Event.__table__
+    session.execute(
+        update(events)
+        .where(events.c.id == event_id)
+        .where(events.c.seats_taken > 0)
+        .values(seats_taken=events.c.seats_taken - 1)
+    )
+
+
+def delete_registration(session, registration):
+    """Deletes registration, freeing its seat and counters
+
+    Flags to uncount are read with a locking read right before the delete,
+    so they include ones set by concurrent commits, and flags can't be set
+    by others till this transaction ends. A tombstone is left for clients
+    syncing registration changes.
+
+    Args:
+        session: ORM session
+        registration (EventParticipant): registration to delete
+    Returns:
+        (bool): False if it was already deleted
+    """
+    regs = EventParticipant.__table__
+    flags = ('accepted', 'confirmed', 'visited')
+    change_seq = next_change_seq(session, registration.event_id)
+    row = session.execute(
+        select([regs.c[flag] for flag in flags])
+        .where(regs.c.id == registration.id)
+        .with_for_update()
+    ).first()
+    if row is None:
+        return False
+
+    session.delete(registration)
+    session.add(RegistrationTombstone(event_id=registration.event_id,
+                                      change_seq=change_seq,
+                                      registration_id=registration.id))
+    session.flush()
+    release_seat(session, registration.event_id)
+    update_event_stats(session, registration.event_id, registered=-1, **{
+        flag: -1 for flag, value in zip(flags, row) if value
+    })
+    return True
+
+
+def delete_user_registrations(session, user_id):
+    """Deletes all registrations of the user, see delete_registration
+
+    Args:
+        session: ORM session
+        user_id (int): user to unregister
+    """
+    # Events get locked in the same order by concurrent calls
+    for registration in session.query(EventParticipant)\
+            .filter(EventParticipant.googler_id == user_id)\
+            .order_by(EventParticipant.event_id).all():
+        delete_registration(session, registration)
+
+
+def count_event_registrations(session, event_ids):
+    """Counts registrations at events from scratch
+
+    Args:
+        session: ORM session
+        event_ids (iterable): ids of events
+    Returns:
+        (dict): event id -> dict of ``EVENT_STATS_COUNTERS`` values
+    """
+    event_ids = list(event_ids)
+    counts = {id_: dict.fromkeys(EVENT_STATS_COUNTERS, 0)
+              for id_ in event_ids}
+    if not event_ids:
+        return counts
+
+    def number_of(flag):
+        return func.sum(case([(flag.is_(True), 1)], else_=0))
+
+    rows = (
+        session.query(EventParticipant.event_id,
+                      func.count(EventParticipant.id),
+                      number_of(EventParticipant.accepted),
+                      number_of(EventParticipant.confirmed),
+                      number_of(EventParticipant.visited))
+        .filter(EventParticipant.event_id.in_(event_ids))
+        .group_by(EventParticipant.event_id)
+    )
+    for event_id, *values in rows:
+        # MySQL sums up to decimals
+        counts[event_id] = dict(zip(EVENT_STATS_COUNTERS,
+                                    (int(v or 0) for v in values)))
+    return counts
+
+
+def recount_event_stats(session, event_id):
+    """Recomputes stored registration counters of the event
+
+    Args:
+        session: ORM session
+        event_id (int): event to recount
+    Returns:
+        (dict): ``EVENT_STATS_COUNTERS`` values
+    """
+    counts = count_event_registrations(session, [event_id])[event_id]
+    _upsert_event_stats(session, event_id, counts, overwrite=True)
+    return counts
+
+
+def _upsert_event_stats(session, event_id, counts, overwrite):
+    """Stores counters of the event, unless ``overwrite`` is unset and
+    there are some already"""
+    stats = EventStats.__table__
+    if _is_mysql(session, EventStats):
+        session.execute(
+            Upsert(stats, key=['event_id'],
+                   update_columns=EVENT_STATS_COUNTERS if overwrite else (),
+                   report_updates=False)
+            .values(event_id=event_id, **counts)
+        )
+        return
+
+    # Emulation for other dialects, e.g. SQLite in tests
+    exists = session.query(
+        session.query(EventStats).filter(EventStats.event_id == event_id)
+        .exists()).scalar()
+    if not exists:
+        session.execute(stats.insert().values(event_id=event_id, **counts))
+    elif overwrite:
+        session.execute(
+            update(stats).where(stats.c.event_id == event_id).values(**counts))
+
+
+def update_event_stats(session, event_id, **deltas):
+    """Adds deltas to registration counters of the event
+
+    It should be called in the same transaction as the registration write
+    it accounts for, after that write. Counters of events, which have none
+    stored yet, are counted as of before the write first, so concurrent
+    first writers each add their deltas to the same row.
+
+    Args:
+        session: ORM session
+        event_id (int): event, which registrations changed
+        **deltas: increments of ``EVENT_STATS_COUNTERS``
+    """
+    stats = EventStats.__table__
+    values = {k: stats.c[k] + v for k, v in deltas.items() if v}
+    if not values:
+        return
+    stmt = update(stats).where(stats.c.event_id == event_id).values(**values)
+    if session.execute(stmt).rowcount:
+        return
+
+    counts = count_event_registrations(session, [event_id])[event_id]
+    _upsert_event_stats(session, event_id, {
+        k: v - deltas.get(k, 0) for k, v in counts.items()
+    }, overwrite=False)
+    session.execute(stmt)
+
+
+def set_registration_flag(session, registration, flag):
+    """Atomically sets the flag of registration and its event counter
+
+    The flag is flipped by a conditional UPDATE, so of concurrent calls
+    only one finds it unset and increments the counter.
+
+    Args:
+        session: ORM session
+        registration (EventParticipant): registration to update
+        flag (str): ``accepted``, ``confirmed`` or ``visited``
+    Returns:
+        (bool): True if the flag was set by this call
+    """
+    regs = EventParticipant.__table__
+    column = regs.c[flag]
+    change_seq = next_change_seq(session, registration.event_id)
+    res = session.execute(
+        update(regs)
+        .where(regs.c.id == registration.id)
+        .where(or_(column.is_(None), column.is_(False)))
+        .values({flag: True, 'change_seq': change_seq})
+    )
+    # Reloaded on access, along with the new updated_at and change_seq
+    session.expire(registration, [flag, 'updated_at', 'change_seq'])
+    if res.rowcount != 1:
+        return False
+
+    touch(session, EventParticipant)
+    update_event_stats(session, registration.event_id, **{flag: 1})
+    return True
+
+
+def get_event_stats(session, event_ids):
+    """Returns registration counters of events
+
+    Args:
+        session: ORM session
+        event_ids (iterable): ids of events
+    Returns:
+        (dict): event id -> dict of ``EVENT_STATS_COUNTERS`` values
+    """
+    event_ids = list(event_ids)
+    if not event_ids:
+        return {}
+
+    columns = [getattr(EventStats, k) for k in EVENT_STATS_COUNTERS]
+    stats = {
+        event_id: dict(zip(EVENT_STATS_COUNTERS, values))
+        for event_id, *values in session.query(EventStats.event_id, *columns)
+        .filter(EventStats.event_id.in_(event_ids))
+    }
+    missing = [id_ for id_ in event_ids if id_ not in stats]
+    if missing:
+        stats.update(count_event_registrations(session, missing))
+    return stats
+
+
+class InviteCodes:
+    """Sized iterable of invite codes derived from a random seed
+
+    Codes are recomputed on every iteration, so any number of them can be
+    inserted and then sent to the client without holding them in memory.
+
+    Usage:
+        >>> codes = InviteCodes(100000)
+        >>> len(codes), next(iter(codes)) == next(iter(codes))
+        (100000, True)
+    """
+    def __init__(self, number, seed=None):
+        self.number = number
+        self.seed = seed or os.urandom(32)
+
+    def __len__(self):
+        return self.number
+
+    def __iter__(self):
+        for i in range(self.number):
+            yield hashlib.sha256(
+                self.seed + i.to_bytes(8, 'big')).hexdigest()[:32]
+
+
+def insert_invites(session, event_id, codes, chunk_size=INVITE_CHUNK_SIZE):
+    """Bulk inserts invites in chunks, each being a single executemany
+
+    It bypasses the ORM and doesn't commit.
+
+    Args:
+        session: ORM session
+        event_id (int): event to invite to
+        codes (iterable): invite codes
+        chunk_size (int): rows per executemany
+    Returns:
+        (int): number of inserted invites
+    """
+    stmt = Invite.__table__.insert()
+    touch(session, Invite, INVITE_CODES_VERSION)
+    codes = iter(codes)
+    count = 0
+    while True:
+        chunk = [{'code': code, 'event_id': event_id, 'email': None,
+                  'used': False}
+                 for code in islice(codes, chunk_size)]
+        if not chunk:
+            return count
+        session.execute(stmt, chunk)
+        count += len(chunk)
+
+
+def _build_invite_filter(event_id, codes):
+    codes = list(codes)
+    invite_filter = BloomFilter(
+        capacity=max(INVITE_FILTER_MIN_CAPACITY, 2 * len(codes)),
+        error_rate=INVITE_FILTER_ERROR_RATE,
+    )
+    invite_filter.update(codes)
+    _report_invite_filter(event_id, invite_filter)
+    return invite_filter
+
+
+def _report_invite_filter(event_id, invite_filter):
+    metrics.set_gauge('invite_filter_bytes', invite_filter.size,
+                      event=event_id)
+    metrics.set_gauge('invite_filter_false_positive_rate',
+                      invite_filter.false_positive_rate(), event=event_id)
+
+
+def load_invite_filters(session):
+    """Builds invite code filters of all events with a single query"""
+    # Version is taken first, so writes racing with the query outdate it
+    version = get_version(INVITE_CODES_VERSION)
+    codes_by_event = {}
+    for event_id, code in session.query(Invite.event_id, Invite.code):
+        codes_by_event.setdefault(event_id, []).append(code)
+
+    filters = {
+        event_id: (version, _build_invite_filter(event_id, codes))
+        for event_id, codes in codes_by_event.items()
+    }
+    with _invite_filters_lock:
+        _invite_filters.clear()
+        _invite_filters.update(filters)
+    return len(filters)
+
+
+def get_invite_filter(session, event_id):
+    """Returns Bloom filter of codes issued for the event
+
+    Filter is rebuilt from the database once codes are issued in any
+    process.
+    """
+    version = get_version(INVITE_CODES_VERSION)
+    with _invite_filters_lock:
+        cached_version, invite_filter = _invite_filters.get(
+            event_id, (None, None))
+    if cached_version == version:
+        return invite_filter
+
+    codes = session.query(Invite.code).filter(Invite.event_id == event_id)
+    invite_filter = _build_invite_filter(event_id, (c for c, in codes))
+    with _invite_filters_lock:
+        _invite_filters[event_id] = (version, invite_filter)
+    return invite_filter
+
+
+def add_invite_codes(event_id, codes, version):
+    """Adds just committed codes to the event's filter
+
+    Args:
+        event_id (int): event, the codes were issued for
+        codes (list): committed invite codes
+        version (str): ``get_version(INVITE_CODES_VERSION)`` taken before
+                       the commit, the filter is only updated if it was up
+                       to date then
+    """
+    with _invite_filters_lock:
+        cached_version, invite_filter = _invite_filters.pop(
+            event_id, (None, None))
+        if cached_version != version or \
+                len(invite_filter) + len(codes) > invite_filter.capacity:
+            # Rebuilt on the next lookup
+            return
+        invite_filter.update(codes)
+        _invite_filters[event_id] = (
+            get_version(INVITE_CODES_VERSION), invite_filter)
+    _report_invite_filter(event_id, invite_filter)
+
+
+def find_event_invitation(session, event_id, code):
+    """Finds invitation to the event by its code
+
+    Codes, which were definitely not issued for the event, are rejected by
+    its Bloom filter without querying the database. The filter is only
+    trusted while version stamps are shared between app processes (i.e.
+    kept in memcached): otherwise codes issued by other processes may be
+    missing from it, so the database is queried anyway. Shared stamps are
+    cached for ``SHARED_STAMP_TTL`` seconds, but codes are never used that
+    soon after being issued.
+
+    Returns:
+        (Invite): invitation or None if there's no such code for the event
+    """
+    filtered = code in get_invite_filter(session, event_id)
+    if not filtered and \
+            get_shared_version(INVITE_CODES_VERSION) is not None:
+        metrics.inc('invite_filter_lookups_total', result='rejected')
+        return None
+
+    invitation = find_invitation_by_code(session, code)
+    if invitation is None or invitation.event_id != event_id:
+        metrics.inc('invite_filter_lookups_total',
+                    result='false_positive' if filtered else 'missing')
+        return None
+
+    if not filtered:
+        # Issued by another process, the filter gets rebuilt
+        metrics.inc('invite_filter_lookups_total', result='stale')
+        with _invite_filters_lock:
+            _invite_filters.pop(event_id, None)
+        return invitation
+
+    metrics.inc('invite_filter_lookups_total', result='found')
+    return invitation
+
+
 def delete_event_by_id(session, id):
     id = int(id)
+    session.query(EventStats).filter(EventStats.event_id == id).delete()
+    session.query(RegistrationTombstone)\
+        .filter(RegistrationTombstone.event_id == id).delete()
     return session.query(Event).filter(Event.id == id).delete()
 
 
@@ -120,10 +947,11 @@ def find_participants_by_event(session, e):
     )
 
 
-def find_events_by_user(session, u):
-    return session.query(Event)\
+def find_events_by_user(session, u, place=None):
+    q = session.query(Event)\
         .join(EventParticipant.events).join(EventParticipant.users)\
-        .filter(u.id == EventParticipant.googler_id).all()
+        .filter(u.id == EventParticipant.googler_id)
+    return _scope_events(q, place).all()
 
 
 def get_event_registration(session, uid, eid):
@@ -133,9 +961,196 @@ def get_event_registration(session, uid, eid):
     return q.first()
 
 
-def get_event_registrations(session, event_id):
-    return session.query(EventParticipant)\
-        .filter(event_id == EventParticipant.event_id).all()
+def check_in_registrations(session, event_id, scans):
+    """Marks registrations at the event as visited, idempotently
+
+    All scans are applied by a single UPDATE. Check-in time of each
+    registration is the earliest scan time ever submitted for it.
+
+    Args:
+        session: ORM session
+        event_id (int): event to check in at
+        scans (dict): registration id -> scan time (naive UTC datetime)
+    Returns:
+        (dict): registration id -> True if it got checked in by this call
+                or False if it was already checked in; ids of registrations
+                to other events or missing ones are left out
+    """
+    if not scans:
+        return {}
+
+    regs = EventParticipant.__table__
+    in_event = and_(regs.c.event_id == event_id, regs.c.id.in_(list(scans)))
+    change_seq = next_change_seq(session, event_id)
+    # Locks the rows, so concurrent syncs report every check-in once
+    visited = dict(
+        session.query(regs.c.id, regs.c.visited)
+        .filter(in_event)
+        .with_for_update()
+    )
+    if not visited:
+        return {}
+
+    scanned_at = case({id_: scans[id_] for id_ in visited}, value=regs.c.id)
+    session.execute(
+        update(regs)
+        .where(and_(regs.c.event_id == event_id,
+                    regs.c.id.in_(list(visited))))
+        .values(
+            visited=True,
+            change_seq=change_seq,
+            visited_at=case(
+                [(or_(regs.c.visited_at.is_(None),
+                      regs.c.visited_at > scanned_at), scanned_at)],
+                else_=regs.c.visited_at,
+            ),
+        )
+    )
+    touch(session, EventParticipant)
+    return {id_: not was_visited for id_, was_visited in visited.items()}
+
+
+def _load_roster(session, event_id):
+    rows = (
+        session.query(EventParticipant.id, User.name, User.surname,
+                      User.email, EventParticipant.confirmed,
+                      EventParticipant.visited)
+        .join(User, EventParticipant.googler_id == User.id)
+        .filter(EventParticipant.event_id == event_id)
+        .filter(EventParticipant.accepted.is_(True))
+    )
+    return Roster(rows)
+
+
+def get_event_roster(session, event_id):
+    """Returns roster of accepted registrations at the event
+
+    It's rebuilt on first request after any registration or user change,
+    e.g. a check-in.
+    """
+    return _rosters.get_or_set(
+        (event_id, get_versions(EventParticipant, User)),
+        lambda: _load_roster(session, event_id),
+    )
+
+
+def _load_event_aggregates(session, event_id, status):
+    accepted = EventParticipant.accepted
+    aggregates = {}
+    for name in AGGREGATED_USER_FIELDS:
+        column = getattr(User, name)
+        q = (
+            session.query(column, func.count(EventParticipant.id))
+            .join(EventParticipant, EventParticipant.googler_id == User.id)
+            .filter(EventParticipant.event_id == event_id)
+        )
+        if status == 'approved':
+            q = q.filter(accepted.is_(True))
+        elif status == 'waiting':
+            q = q.filter(or_(accepted.is_(None), accepted.is_(False)))
+        rows = q.group_by(column).all()
+        rows.sort(key=lambda r: (-r[1], r[0] is None, r[0] or ''))
+        aggregates[name] = [{'value': value, 'count': count}
+                            for value, count in rows]
+    return aggregates
+
+
+def get_event_aggregates(session, event_id, status='all'):
+    """Returns breakdowns of event participants by their profile fields
+
+    Each of ``AGGREGATED_USER_FIELDS`` is counted by a GROUP BY query, so it
+    costs as much as there are distinct values. Results are cached till any
+    registration or user change.
+
+    Args:
+        session: ORM session
+        event_id (int): event to count participants of
+        status (str): one of ``REGISTRATION_STATUSES``
+    Returns:
+        (dict): field name -> list of ``{"value": ..., "count": ...}``,
+                most frequent values first
+    """
+    if status not in REGISTRATION_STATUSES:
+        raise ValueError('Unknown registration status {}'.format(status))
+    return _aggregates.get_or_set(
+        (event_id, status, get_versions(EventParticipant, User)),
+        lambda: _load_event_aggregates(session, event_id, status),
+    )
+
+
+def get_registrations_changed_since(session, event_id, since=None,
+                                    limit=None):
+    """Lists changes of registrations at the event after the cursor
+
+    Every registration write takes the next ``change_seq`` of its event, so
+    changes are ordered by (``change_seq``, id) of registrations and
+    tombstones of deleted ones, and a client passes the key of the last
+    seen change to get only newer ones. Numbers get committed in order, see
+    ``next_change_seq``, so changes committed later are never skipped.
+
+    Args:
+        session: ORM session
+        event_id (int): event to list registrations of
+        since (tuple) [Optional]: (change_seq, id) of the last seen change
+        limit (int) [Optional]: max number of changes to return
+    Returns:
+        (list): (change_seq, registration id, registration) tuples, where
+                registration is None if it was deleted, or has user loaded
+    """
+    regs = EventParticipant
+    tombstones = RegistrationTombstone
+    q = (
+        session.query(regs)
+        .options(undefer(regs.fields), joinedload(regs.user))
+        .filter(regs.event_id == event_id)
+    )
+    deleted = (
+        session.query(tombstones.change_seq, tombstones.registration_id)
+        .filter(tombstones.event_id == event_id)
+    )
+    if since is not None:
+        change_seq, id_ = since
+        q = q.filter(or_(
+            regs.change_seq > change_seq,
+            and_(regs.change_seq == change_seq, regs.id > id_),
+        ))
+        deleted = deleted.filter(or_(
+            tombstones.change_seq > change_seq,
+            and_(tombstones.change_seq == change_seq,
+                 tombstones.registration_id > id_),
+        ))
+    q = q.order_by(regs.change_seq, regs.id)
+    deleted = deleted.order_by(tombstones.change_seq,
+                               tombstones.registration_id)
+    if limit:
+        q = q.limit(limit)
+        deleted = deleted.limit(limit)
+
+    changes = [(reg.change_seq, reg.id, reg) for reg in q]
+    changes.extend((change_seq, id_, None) for change_seq, id_ in deleted)
+    changes.sort(key=lambda change: change[:2])
+    return changes[:limit] if limit else changes
+
+
+def get_event_registrations(session, event_id, with_users=False):
+    """Lists registrations at the event
+
+    Args:
+        session: ORM session
+        event_id (int): event to list registrations of
+        with_users (bool) [Optional]: load registrations fully, with users,
+            in the same query
+    Returns:
+        (list): registrations
+    """
+    q = session.query(EventParticipant)\
+        .filter(event_id == EventParticipant.event_id)
+    if with_users:
+        q = q.options(
+            undefer(EventParticipant.fields),
+            joinedload(EventParticipant.user).undefer(User.additional_info),
+        )
+    return q.all()
 
 
 def find_invitation_by_code(session, code):
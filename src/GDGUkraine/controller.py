@@ -6,6 +6,7 @@ from blueberrypy.template_engine import get_template
 
 from .auth_controller import AuthController
 from .blog_controller import BlogController
+from .lib.utils.signals import notify
 from .lib.utils.vcard import make_vcard, aes_decrypt
 from . import api
 
@@ -37,18 +38,10 @@ class Root:
     @cherrypy.expose
     def index(self, **kwargs):
         req = cherrypy.request
-        places = []
-        for place in api.get_all_gdg_places(req.orm_session, filtered=True):
-            lat, lng = place.geo.split(',')
-            places.append({
-                'name': place.name,
-                'lat': lat,
-                'lng': lng,
-                'url': place.url,
-            })
+        registry = api.get_place_registry(req.orm_session)
 
         tmpl = get_template('index.html')
-        return tmpl.render(places=places)
+        return tmpl.render(places=registry.markers)
 
     @cherrypy.expose
     def admin(self, **kwargs):
@@ -63,9 +56,12 @@ class Root:
             registration_id = aes_decrypt(aes_hash)
             user_reg = api.get_event_registration_by_id(orm_session,
                                                         registration_id)
-            user_reg.confirmed = True
-            orm_session.merge(user_reg)
+            newly_confirmed = api.set_registration_flag(
+                orm_session, user_reg, 'confirmed')
             orm_session.commit()
+            if newly_confirmed:
+                notify('event-delta', user_reg.event_id, 'confirmed',
+                       {'registrations': [user_reg.id]})
             logger.debug(user_reg)
         except:
             raise cherrypy.HTTPError(400, 'Invalid confirmation number')
@@ -6,7 +6,7 @@ from blueberrypy.template_engine import get_template
 
 from .api import (
     get_n_upcoming_events,
-    find_invitation_by_code, find_user_by_email,
+    find_event_invitation, find_user_by_email,
     find_event_by_id, find_host_gdg_by_event
 )
 from .lib.forms import RegistrationForm
@@ -56,8 +56,8 @@ class Events:
             raise HTTPError(404)
 
         if kwargs.get('code'):
-            i = find_invitation_by_code(orm_session, kwargs['code'])
-            if i is None or i.used or i.event_id != event.id:
+            i = find_event_invitation(orm_session, event.id, kwargs['code'])
+            if i is None or i.used:
                 # Again it is not an error but a wrong URL param
                 logger.info(
                     'Invalid invite code: %(code)s for event %(eid)s',
@@ -1,10 +1,11 @@
 from .registration_forms import (
     RegistrationForm, get_additional_fields_form_cls,
 )
+from .compiled import CompiledForm, compile_form
 from .util import InputDict
 
 
 __all__ = [
     'RegistrationForm', 'get_additional_fields_form_cls',
-    'InputDict',
+    'CompiledForm', 'compile_form', 'InputDict',
 ]
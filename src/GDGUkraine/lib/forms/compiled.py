@@ -0,0 +1,361 @@
+"""Validation of plain dicts against WTForms form declarations
+
+WTForms builds a form with bound fields, labels, widgets and meta on every
+instantiation, which is wasted work for JSON API, which never renders HTML.
+``CompiledForm`` reads field and validator declarations of a form class once
+and then validates dicts directly, producing exactly the same ``errors``
+dict as ``form_cls(InputDict(data)).validate()`` would.
+
+Usage:
+    >>> errors = compile_form(RegistrationForm).validate(request.json)
+"""
+
+import threading
+import weakref
+
+from wtforms.fields import (
+    BooleanField, Field, SelectField, SelectMultipleField, StringField,
+)
+from wtforms.fields.core import UnboundField
+from wtforms.validators import (
+    DataRequired, Email, Length, Optional, Required, StopValidation, URL,
+)
+
+
+__all__ = ['CompiledForm', 'compile_form']
+
+
+_compiled_forms = weakref.WeakKeyDictionary()
+_compiled_forms_lock = threading.Lock()
+
+
+def compile_form(form_cls):
+    """Returns ``CompiledForm`` of form class, compiling it only once"""
+    with _compiled_forms_lock:
+        compiled = _compiled_forms.get(form_cls)
+        if compiled is None:
+            compiled = _compiled_forms[form_cls] = CompiledForm(form_cls)
+        return compiled
+
+
+def _unbound_fields(form_cls):
+    # Mirrors the order fields get bound in by wtforms.form.FormMeta
+    fields = []
+    for name in dir(form_cls):
+        if not name.startswith('_'):
+            unbound = getattr(form_cls, name)
+            if isinstance(unbound, UnboundField):
+                if hasattr(form_cls, 'validate_{}'.format(name)):
+                    raise TypeError(
+                        'Inline validator of {} cannot be compiled'.format(
+                            name))
+                fields.append((name, unbound))
+    fields.sort(key=lambda f: (f[1].creation_counter, f[0]))
+    return fields
+
+
+def _ngettext(singular, plural, n):
+    return singular if n == 1 else plural
+
+
+class _FieldState:
+    """Minimal stand-in for a bound field, passed to WTForms callables,
+    which have no compiled counterpart
+    """
+    __slots__ = ('data', 'raw_data', 'errors', 'choices')
+
+    def __init__(self, data, raw_data, errors, choices):
+        self.data = data
+        self.raw_data = raw_data
+        self.errors = errors
+        self.choices = choices
+
+    @staticmethod
+    def gettext(string):
+        return string
+
+    @staticmethod
+    def ngettext(singular, plural, n):
+        return _ngettext(singular, plural, n)
+
+
+def _compile_data_required(validator):
+    message = validator.message or 'This field is required.'
+
+    def check(state):
+        data = state.data
+        if not data or isinstance(data, str) and not data.strip():
+            state.errors[:] = []
+            raise StopValidation(message)
+    return check
+
+
+def _compile_optional(validator):
+    string_check = validator.string_check
+
+    def check(state):
+        raw_data = state.raw_data
+        if not raw_data or (isinstance(raw_data[0], str) and
+                            not string_check(raw_data[0])):
+            state.errors[:] = []
+            raise StopValidation()
+    return check
+
+
+def _compile_length(validator):
+    min_, max_ = validator.min, validator.max
+    message = validator.message
+    if message is None:
+        if max_ == -1:
+            message = _ngettext(
+                'Field must be at least %(min)d character long.',
+                'Field must be at least %(min)d characters long.', min_)
+        elif min_ == -1:
+            message = _ngettext(
+                'Field cannot be longer than %(max)d character.',
+                'Field cannot be longer than %(max)d characters.', max_)
+        else:
+            message = 'Field must be between %(min)d and %(max)d ' \
+                      'characters long.'
+
+    def check(state):
+        length = state.data and len(state.data) or 0
+        if length < min_ or max_ != -1 and length > max_:
+            raise ValueError(
+                message % dict(min=min_, max=max_, length=length))
+    return check
+
+
+def _compile_hostname_regexp(validator, default_message, host_group):
+    regex = validator.regex
+    validate_hostname = validator.validate_hostname
+    message = validator.message or default_message
+
+    def check(state):
+        match = regex.match(state.data or '')
+        if not match or not validate_hostname(match.group(host_group)):
+            raise ValueError(message)
+    return check
+
+
+def _compile_validator(validator):
+    # Exact types only: subclasses may redefine the behaviour
+    type_ = type(validator)
+    if type_ in (DataRequired, Required):
+        return _compile_data_required(validator)
+    if type_ is Optional:
+        return _compile_optional(validator)
+    if type_ is Length:
+        return _compile_length(validator)
+    if type_ is Email:
+        return _compile_hostname_regexp(
+            validator, 'Invalid email address.', 1)
+    if type_ is URL:
+        return _compile_hostname_regexp(validator, 'Invalid URL.', 'host')
+
+    def check(state):
+        validator(None, state)
+    return check
+
+
+class CompiledField:
+    def __init__(self, name, unbound):
+        self.name = name
+        self.field_cls = field_cls = unbound.field_class
+        kwargs = dict(zip(('label', 'validators'), unbound.args))
+        kwargs.update(unbound.kwargs)
+
+        self.default = kwargs.get('default')
+        self.filters = tuple(kwargs.get('filters') or ())
+        self.coerce = kwargs.get('coerce', str)
+        self.choices = kwargs.get('choices')
+        self.false_values = kwargs.get('false_values') or \
+            getattr(field_cls, 'false_values', None)
+
+        if self.choices is not None:
+            try:
+                self.choice_values = frozenset(c[0] for c in self.choices)
+            except TypeError:
+                # Unhashable choices
+                self.choice_values = tuple(c[0] for c in self.choices)
+
+        self.process_formdata = self._compile_processing(field_cls)
+        self.pre_validate = self._compile_pre_validate(field_cls)
+        self.validators = tuple(
+            _compile_validator(v) for v in kwargs.get('validators') or ())
+
+    def _compile_processing(self, field_cls):
+        # (process_data, process_formdata) implementations by their origin
+        known = {
+            StringField.process_formdata: (
+                self._process_data_plain, self._process_formdata_string),
+            BooleanField.process_formdata: (
+                self._process_data_boolean, self._process_formdata_boolean),
+            SelectField.process_formdata: (
+                self._process_data_select, self._process_formdata_select),
+            SelectMultipleField.process_formdata: (
+                self._process_data_multiple, self._process_formdata_multiple),
+        }
+        try:
+            self.process_data, process_formdata = known[
+                field_cls.process_formdata]
+        except KeyError:
+            raise TypeError('Cannot compile field {} of {}'.format(
+                self.name, field_cls.__name__))
+        return process_formdata
+
+    def _compile_pre_validate(self, field_cls):
+        pre_validate = field_cls.pre_validate
+        if pre_validate is Field.pre_validate:
+            return None
+        if pre_validate is SelectField.pre_validate:
+            return self._pre_validate_select
+        if pre_validate is SelectMultipleField.pre_validate:
+            return self._pre_validate_multiple
+
+        def check(state):
+            pre_validate(state, None)
+        return check
+
+    def _process_data_plain(self, value):
+        return value
+
+    def _process_data_boolean(self, value):
+        return bool(value)
+
+    def _process_data_select(self, value):
+        try:
+            return self.coerce(value)
+        except (ValueError, TypeError):
+            return None
+
+    def _process_data_multiple(self, value):
+        try:
+            return list(self.coerce(v) for v in value)
+        except (ValueError, TypeError):
+            return None
+
+    def _process_formdata_string(self, data, raw_data):
+        return raw_data[0] if raw_data else ''
+
+    def _process_formdata_boolean(self, data, raw_data):
+        return not (not raw_data or raw_data[0] in self.false_values)
+
+    def _process_formdata_select(self, data, raw_data):
+        if raw_data:
+            try:
+                return self.coerce(raw_data[0])
+            except ValueError:
+                raise ValueError('Invalid Choice: could not coerce')
+        return data
+
+    def _process_formdata_multiple(self, data, raw_data):
+        try:
+            return list(self.coerce(x) for x in raw_data)
+        except ValueError:
+            raise ValueError('Invalid choice(s): one or more data inputs '
+                             'could not be coerced')
+
+    def _pre_validate_select(self, state):
+        if state.data not in self.choice_values:
+            raise ValueError('Not a valid choice')
+
+    def _pre_validate_multiple(self, state):
+        if state.data:
+            for d in state.data:
+                if d not in self.choice_values:
+                    raise ValueError(
+                        "'%(value)s' is not a valid choice for this field" %
+                        dict(value=d))
+
+    def process(self, formdata):
+        """Mirrors ``Field.process`` for formdata wrapped into ``InputDict``
+
+        Returns:
+            (_FieldState): processed field data with processing errors
+        """
+        errors = []
+        default = self.default
+        try:
+            data = default()
+        except TypeError:
+            data = default
+
+        try:
+            data = self.process_data(data)
+        except ValueError as e:
+            errors.append(e.args[0])
+
+        raw_data = None
+        if formdata:
+            try:
+                if self.name in formdata:
+                    value = formdata[self.name]
+                    raw_data = value if isinstance(value, list) else [value]
+                else:
+                    raw_data = []
+                data = self.process_formdata(data, raw_data)
+            except ValueError as e:
+                errors.append(e.args[0])
+
+        try:
+            for filter_ in self.filters:
+                data = filter_(data)
+        except ValueError as e:
+            errors.append(e.args[0])
+
+        return _FieldState(data, raw_data, errors, self.choices)
+
+    def validate(self, formdata):
+        """Mirrors ``Field.validate``
+
+        Returns:
+            (list): error messages
+        """
+        state = self.process(formdata)
+
+        stop_validation = False
+        if self.pre_validate is not None:
+            try:
+                self.pre_validate(state)
+            except StopValidation as e:
+                if e.args and e.args[0]:
+                    state.errors.append(e.args[0])
+                stop_validation = True
+            except ValueError as e:
+                state.errors.append(e.args[0])
+
+        if not stop_validation:
+            for check in self.validators:
+                try:
+                    check(state)
+                except StopValidation as e:
+                    if e.args and e.args[0]:
+                        state.errors.append(e.args[0])
+                    break
+                except ValueError as e:
+                    state.errors.append(e.args[0])
+
+        return state.errors
+
+
+class CompiledForm:
+    """Plain dict validator, compiled from WTForms form class"""
+    def __init__(self, form_cls):
+        self.fields = tuple(
+            CompiledField(name, unbound)
+            for name, unbound in _unbound_fields(form_cls)
+        )
+
+    def validate(self, data):
+        """Validates dict, e.g. parsed JSON request body
+
+        Returns:
+            (dict): lists of error messages by field names, empty if valid
+        """
+        errors = {}
+        for field in self.fields:
+            field_errors = field.validate(data)
+            if field_errors:
+                errors[field.name] = field_errors
+        return errors
@@ -1,3 +1,5 @@
+import hashlib
+import json
 import logging
 
 from wtforms.form import Form
@@ -13,11 +15,16 @@ from GDGUkraine.model import (
     GENDER_CHOICES, TSHIRT_CHOICES,
 )
 
+from GDGUkraine.lib.utils.cache import LRUCache
+
 from .widgets import InlineWidget
 
 
 logger = logging.getLogger(__name__)
 
+# Form classes of additional fields by hash of their definitions
+_additional_fields_forms = LRUCache(maxsize=64)
+
 
 class RegistrationForm(Form):
 
@@ -186,10 +193,29 @@ class RegistrationForm(Form):
             delattr(self, name)
 
 
+def _definitions_hash(definitions):
+    return hashlib.sha1(
+        json.dumps(definitions, sort_keys=True).encode('utf-8'),
+    ).hexdigest()
+
+
 def get_additional_fields_form_cls(definitions):
+    """Returns form class for event's additional fields definitions
+
+    Classes are cached by definitions content, so each distinct schema is
+    built once per process. Editing event fields yields a new hash, while
+    classes of outdated schemas get evicted as least recently used.
+    """
     if definitions is None:
         definitions = []
 
+    return _additional_fields_forms.get_or_set(
+        _definitions_hash(definitions),
+        lambda: _build_additional_fields_form_cls(definitions),
+    )
+
+
+def _build_additional_fields_form_cls(definitions):
     class AdditionalFieldsForm(Form):
         pass
 
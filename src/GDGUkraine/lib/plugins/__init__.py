@@ -1,8 +1,12 @@
 from .urlmap import register as register_urlmap_plugin
 from .oauth import register as register_oauth_plugin
+from .invites import register as register_invite_filters_plugin
+from .streams import register as register_event_streams_plugin
 
 
 def register_plugins():
     # Register the plugin in CherryPy:
     register_urlmap_plugin()
     register_oauth_plugin()
+    register_invite_filters_plugin()
+    register_event_streams_plugin()
@@ -0,0 +1,40 @@
+import cherrypy
+from cherrypy.process.plugins import SimplePlugin
+
+from sqlalchemy.orm import Session
+
+
+class InviteFiltersPlugin(SimplePlugin):
+    """InviteFiltersPlugin is a CherryPy plugin, that prebuilds Bloom
+    filters of issued invite codes, so lookups of bogus codes never hit DB
+    """
+    def __init__(self, *args, **kwargs):
+        super(InviteFiltersPlugin, self).__init__(*args, **kwargs)
+
+    def start(self):
+        # Imported here to avoid circular import on package init
+        from ...api import load_invite_filters
+
+        try:
+            session = Session(bind=self.bus.sqlalchemy.engine)
+            try:
+                count = load_invite_filters(session)
+            finally:
+                session.close()
+            self.bus.log('Invite filters of {} events have been built.'
+                         .format(count))
+        except:
+            self.bus.log('Building of invite filters failed! '
+                         'They will be built on first use.')
+            self.bus.log(traceback=True)
+    # Runs after SQLAlchemy plugin has configured the engine
+    start.priority = 70
+
+
+def register():
+    # Register the plugin in CherryPy:
+    if not hasattr(cherrypy.engine, 'invite_filters'):
+        cherrypy.engine.invite_filters = InviteFiltersPlugin(cherrypy.engine)
+# Enable InviteFilters plugin as follows:
+# global:
+#   engine.invite_filters.on: true
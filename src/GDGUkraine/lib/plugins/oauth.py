@@ -8,6 +8,7 @@ from cherrypy.process.plugins import SimplePlugin
 
 from requests_oauthlib import OAuth2Session
 
+from ..utils.timing import timed
 from ..utils.url import url_for_class
 
 __all__ = ['OAuthEnginePlugin']
@@ -34,8 +35,9 @@ class GoogleAPI(OAuth2Session):
                 endpoint_uri=endpoint_uri)
 
         # Do request
-        return super().request(http_method,
-                               endpoint_uri, *args, **kwargs)
+        with timed('google_api'):
+            return super().request(http_method,
+                                   endpoint_uri, *args, **kwargs)
 
 
 class OAuthEnginePlugin(SimplePlugin):
@@ -0,0 +1,146 @@
+import queue
+import threading
+
+import cherrypy
+from cherrypy.process.plugins import SimplePlugin
+
+from ..utils import metrics
+
+
+__all__ = ['EventStreamsPlugin', 'Subscription']
+
+
+class Subscription:
+    """Queue of deltas of one event for one client
+
+    It gets closed when the client goes away, the plugin stops or the client
+    falls more than ``maxsize`` deltas behind: then it should reconnect and
+    resync instead of getting a gap.
+    """
+    _CLOSED = object()
+
+    def __init__(self, event_id, maxsize, on_close):
+        self.event_id = event_id
+        self.closed = False
+        self._queue = queue.Queue(maxsize)
+        self._on_close = on_close
+
+    def put(self, delta):
+        try:
+            self._queue.put_nowait(delta)
+        except queue.Full:
+            self.close()
+
+    def get(self, timeout):
+        """Waits for the next delta
+
+        Returns:
+            (tuple): (kind, data) delta or None on timeout or if closed
+        """
+        try:
+            delta = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        return None if delta is self._CLOSED else delta
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._on_close(self)
+        try:
+            # Wakes up the waiting consumer
+            self._queue.put_nowait(self._CLOSED)
+        except queue.Full:
+            pass
+
+
+class EventStreamsPlugin(SimplePlugin):
+    """EventStreamsPlugin is a CherryPy plugin, that fans out deltas of
+    event registrations published to ``event-delta`` bus channel to
+    subscriptions of connected clients
+
+    CherryPy serves each connection by a thread of its pool till the end of
+    response, so every streaming client holds one. Streams are capped at
+    ``max_streams`` and ``max_streams_per_event``, which are kept small, so
+    that dashboards can't starve the public site of threads.
+    """
+    _channels = {
+        'event-delta': 'publish',
+        'event-stream-subscribe': 'add_subscription',
+    }
+
+    max_streams = 4
+    max_streams_per_event = 2
+    queue_size = 100
+
+    def __init__(self, bus):
+        super(EventStreamsPlugin, self).__init__(bus)
+        self._subscriptions = {}
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.bus.log('Starting event streams plugin, up to {} streams'
+                     .format(self.max_streams))
+        for channel, handler in self._channels.items():
+            self.bus.subscribe(channel, getattr(self, handler))
+
+    def stop(self):
+        self.bus.log('Stopping event streams plugin')
+        for channel, handler in self._channels.items():
+            self.bus.unsubscribe(channel, getattr(self, handler))
+        with self._lock:
+            subscriptions = [s for subs in self._subscriptions.values()
+                             for s in subs]
+        for subscription in subscriptions:
+            subscription.close()
+
+    def add_subscription(self, event_id):
+        """Returns a new subscription to deltas of the event
+
+        Returns:
+            (Subscription): subscription or None if all stream slots are
+                            taken, it's not an exception as those get
+                            logged by the bus as failures
+        """
+        with self._lock:
+            if (self._count >= self.max_streams or
+                    len(self._subscriptions.get(event_id, ())) >=
+                    self.max_streams_per_event):
+                return None
+            subscription = Subscription(event_id, self.queue_size,
+                                        self._remove)
+            self._subscriptions.setdefault(event_id, set()).add(subscription)
+            self._count += 1
+            count = self._count
+        metrics.set_gauge('event_streams', count)
+        return subscription
+
+    def _remove(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.event_id, ())
+            if subscription not in subscriptions:
+                return
+            subscriptions.remove(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.event_id]
+            self._count -= 1
+            count = self._count
+        metrics.set_gauge('event_streams', count)
+
+    def publish(self, event_id, kind, data):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(event_id, ()))
+        for subscription in subscriptions:
+            subscription.put((kind, data))
+
+
+def register():
+    # Register the plugin in CherryPy:
+    if not hasattr(cherrypy.engine, 'event_streams'):
+        cherrypy.engine.event_streams = EventStreamsPlugin(cherrypy.engine)
+# Enable EventStreams plugin as follows:
+# global:
+#   engine.event_streams.on: true
+#   engine.event_streams.max_streams: 4
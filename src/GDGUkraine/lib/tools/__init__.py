@@ -1,7 +1,19 @@
 import cherrypy
 from .authorize import AuthorizeTool
+from .idempotency import IdempotencyTool
+from .instrument import InstrumentTool
+from .ratelimit import RateLimitTool
+from .static import StaticAssetsTool
 
 
 def register_tools():
     if not hasattr(cherrypy.tools, 'authorize'):
         cherrypy.tools.authorize = AuthorizeTool()
+    if not hasattr(cherrypy.tools, 'assets'):
+        cherrypy.tools.assets = StaticAssetsTool()
+    if not hasattr(cherrypy.tools, 'idempotency'):
+        cherrypy.tools.idempotency = IdempotencyTool()
+    if not hasattr(cherrypy.tools, 'ratelimit'):
+        cherrypy.tools.ratelimit = RateLimitTool()
+    if not hasattr(cherrypy.tools, 'instrument'):
+        cherrypy.tools.instrument = InstrumentTool()
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import cherrypy
+from cherrypy.lib import httputil
+
+from ..utils.cache import LRUCache, get_shared_backend, make_backend_key
+
+
+__all__ = ['IdempotencyTool', 'ResponseStore']
+
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class ResponseStore:
+    """Short-lived store of responses by idempotency key
+
+    Only one request per key is let through at a time. Duplicates arriving
+    meanwhile wait for it to complete: on the in-process event or, when
+    memcached is configured, by polling the shared lock.
+    """
+    def __init__(self, maxsize=10000, poll_interval=0.1):
+        self.poll_interval = poll_interval
+        self._responses = LRUCache(maxsize=maxsize, namespace='idempotency',
+                                   shared=True)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _lock_key(self, key):
+        return make_backend_key('idempotency-lock', key)
+
+    def acquire(self, key, timeout):
+        """Waits for stored response or claims the key
+
+        Returns:
+            (dict): stored response or None if key was claimed by the caller,
+                    who must either ``complete`` or ``release`` it
+        Raises:
+            TimeoutError: if the key holder didn't finish in time
+        """
+        deadline = time.monotonic() + timeout
+        backend = get_shared_backend()
+        while True:
+            entry = self._responses.get(key)
+            if entry is not None:
+                return entry
+
+            with self._lock:
+                pending = self._pending.get(key)
+                if pending is None and (
+                    backend is None or
+                    backend.add(self._lock_key(key), 1, int(timeout) + 1)
+                ):
+                    self._pending[key] = threading.Event()
+                    return None
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(key)
+            if pending is not None:
+                pending.wait(remaining)
+            else:
+                time.sleep(min(self.poll_interval, remaining))
+
+    def complete(self, key, entry, ttl):
+        self._responses.set(key, entry, ttl=ttl)
+        self.release(key)
+
+    def release(self, key):
+        with self._lock:
+            pending = self._pending.pop(key, None)
+        if pending is None:
+            return
+
+        backend = get_shared_backend()
+        if backend is not None:
+            backend.delete(self._lock_key(key))
+        pending.set()
+
+
+def _fingerprint(request):
+    payload = getattr(request, 'json', None)
+    return hashlib.sha256(json.dumps(
+        [request.method, request.path_info, payload], sort_keys=True,
+    ).encode('utf-8')).hexdigest()
+
+
+class IdempotencyTool(cherrypy.Tool):
+    """Replays stored responses to requests with the same Idempotency-Key
+
+    Requests without the header are handled as usual. Responses with 5xx
+    status are never stored, so such requests may be retried.
+    """
+    def __init__(self):
+        super().__init__('before_handler', self._replay_or_claim, priority=5)
+        self.store = ResponseStore()
+
+    def _replay_or_claim(self, ttl=600, wait_timeout=30):
+        request = cherrypy.serving.request
+        idempotency_key = request.headers.get(HEADER)
+        if not idempotency_key:
+            return
+        if len(idempotency_key) > MAX_KEY_LENGTH:
+            raise cherrypy.HTTPError(400, 'Invalid {} header'.format(HEADER))
+
+        key = (request.path_info, idempotency_key)
+        fingerprint = _fingerprint(request)
+        try:
+            entry = self.store.acquire(key, wait_timeout)
+        except TimeoutError:
+            raise cherrypy.HTTPError(
+                409, 'Request with this {} is still in progress'.format(
+                    HEADER))
+
+        if entry is None:
+            request.hooks.attach('before_finalize', self._store_response,
+                                 priority=90, key=key,
+                                 fingerprint=fingerprint, ttl=ttl)
+            # Frees waiters if the handler crashed before finalizing
+            request.hooks.attach('on_end_request', self.store.release,
+                                 failsafe=True, key=key)
+            return
+
+        if entry['fingerprint'] != fingerprint:
+            raise cherrypy.HTTPError(
+                422, '{} was already used with another payload'.format(
+                    HEADER))
+
+        logger.debug('Replaying response to %s %s', request.method, key)
+        response = cherrypy.serving.response
+        response.status = entry['status']
+        response.headers['Content-Type'] = entry['content_type']
+        response.headers['Idempotent-Replayed'] = 'true'
+        response.body = entry['body']
+        # Tells the rest of tools, that the response is already there
+        request.handler = None
+
+    def _store_response(self, key, fingerprint, ttl):
+        response = cherrypy.serving.response
+        status, _, _ = httputil.valid_status(response.status)
+        if status >= 500:
+            return
+
+        self.store.complete(key, {
+            'fingerprint': fingerprint,
+            'status': status,
+            'content_type': response.headers.get('Content-Type'),
+            'body': response.collapse_body(),
+        }, ttl)
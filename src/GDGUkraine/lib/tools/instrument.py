@@ -0,0 +1,61 @@
+import time
+
+import cherrypy
+
+from ..utils import metrics, timing
+from ..utils.url import current_route_name
+
+
+__all__ = ['InstrumentTool']
+
+
+# Upper bounds of buckets of ORM queries per request
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class InstrumentTool(cherrypy.Tool):
+    """Records where request time goes into histograms by Routes route name
+
+    Per request it observes ``http_handler_seconds`` and
+    ``db_queries_per_request``, and, if there were any,
+    ``db_query_seconds``, ``template_render_seconds`` and
+    ``google_api_seconds`` totals. Requests not matching any route are
+    skipped, so series can't be made up by clients.
+    """
+    def __init__(self):
+        super().__init__('before_handler', self._start, priority=0)
+
+    def _start(self):
+        request = cherrypy.serving.request
+        request.handler_started = time.perf_counter()
+        request.handler_finished = None
+        timing.start()
+        request.hooks.attach('before_finalize', self._finish_handler,
+                             priority=0)
+        request.hooks.attach('on_end_request', self._record, failsafe=True)
+
+    def _finish_handler(self):
+        cherrypy.serving.request.handler_finished = time.perf_counter()
+
+    def _record(self):
+        request = cherrypy.serving.request
+        route = current_route_name()
+        if route is None:
+            return
+
+        # Handlers failed with errors never get finalized
+        finished = request.handler_finished or time.perf_counter()
+        metrics.observe('http_handler_seconds',
+                        finished - request.handler_started, route=route)
+
+        queries, query_time = request.timings['db']
+        metrics.observe('db_queries_per_request', queries,
+                        buckets=QUERY_COUNT_BUCKETS, route=route)
+        if queries:
+            metrics.observe('db_query_seconds', query_time, route=route)
+
+        for kind, name in (('template', 'template_render_seconds'),
+                           ('google_api', 'google_api_seconds')):
+            calls, seconds = request.timings[kind]
+            if calls:
+                metrics.observe(name, seconds, route=route)
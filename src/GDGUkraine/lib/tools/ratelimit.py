@@ -0,0 +1,189 @@
+import logging
+import math
+import threading
+import time
+
+from collections import OrderedDict
+
+import cherrypy
+
+from ..utils import metrics
+from ..utils.cache import get_shared_backend, make_backend_key
+from ..utils.url import current_route_name
+
+
+__all__ = ['RateLimitTool', 'TokenBucketLimiter', 'TooManyRequestsError']
+
+
+logger = logging.getLogger(__name__)
+
+
+class TooManyRequestsError(cherrypy.HTTPError):
+    def __init__(self, retry_after):
+        self.retry_after = int(math.ceil(retry_after))
+        super().__init__(429, 'Too many requests, slow down')
+
+    def set_response(self):
+        super().set_response()
+        # Error responses get Retry-After stripped, so it's set afterwards
+        cherrypy.serving.response.headers['Retry-After'] = str(
+            self.retry_after)
+
+
+class TokenBucketLimiter:
+    """Thread-safe token buckets by arbitrary hashable keys
+
+    Each bucket holds up to ``burst`` tokens and is refilled with ``rate``
+    tokens per second. Least recently used buckets are dropped once there
+    are more than ``maxsize`` of them, which is the same as refilling them.
+
+    Usage:
+        >>> limiter = TokenBucketLimiter()
+        >>> limiter.consume(('ip', '127.0.0.1'), rate=1, burst=1)
+        0.0
+        >>> limiter.consume(('ip', '127.0.0.1'), rate=1, burst=1) > 0
+        True
+    """
+    def __init__(self, maxsize=65536, clock=time.monotonic):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, burst):
+        """Takes a token from the bucket
+
+        Returns:
+            (float): 0 if token was taken or seconds till the next one
+        """
+        now = self._clock()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+def _consume_shared(backend, key, rate, burst):
+    """Counts request in memcached, shared between app processes
+
+    memcached has no atomic read-modify-write for a token bucket, so it's
+    approximated by a fixed window of ``burst / rate`` seconds, which lets
+    ``burst`` requests through. The average rate is the same.
+
+    Returns:
+        (float): 0 if request is allowed, seconds till the next window if
+                 not or None if memcached is unavailable
+    """
+    window = burst / rate
+    now = time.time()
+    window_id = int(now // window)
+    backend_key = make_backend_key('ratelimit', (key, window_id))
+
+    backend.add(backend_key, 0, int(math.ceil(window)) + 1)
+    count = backend.incr(backend_key)
+    if count is None:
+        return None
+    if count <= burst:
+        return 0.0
+    return (window_id + 1) * window - now
+
+
+def _event_id(request):
+    event_id = request.params.get('id')
+    if event_id is None:
+        payload = getattr(request, 'json', None)
+        if isinstance(payload, dict):
+            event_id = payload.get('event')
+    return None if event_id is None else str(event_id)
+
+
+def _attendee(request):
+    # Attendees behind one venue NAT share the ip, but not the email
+    email = None
+    payload = getattr(request, 'json', None)
+    if isinstance(payload, dict) and isinstance(payload.get('user'), dict):
+        email = payload['user'].get('email')
+    if not isinstance(email, str) or not email.strip():
+        return None
+    return (request.remote.ip, email.strip().lower())
+
+
+_SUBJECTS = {
+    'ip': lambda request: request.remote.ip,
+    'attendee': _attendee,
+    'event': _event_id,
+    'route': lambda request: '',
+}
+
+
+class RateLimitTool(cherrypy.Tool):
+    """Rejects requests exceeding limits with 429 Too Many Requests
+
+    Limits are set per Routes route name in ``ratelimit`` global config
+    option. Each rule applies to requests from one client ip, by one
+    attendee (client ip and registrant's email), to one event or to the
+    route as a whole:
+
+        ratelimit:
+          add_participant:
+            - {per: attendee, rate: 0.1, burst: 5}
+            - {per: ip, rate: 1, burst: 500}
+            - {per: event, rate: 20, burst: 200}
+
+    Many attendees may share one ip, e.g. a venue NAT, so per ip rules
+    should only stop floods.
+
+    Rules with ``shared: true`` are counted in memcached (if configured),
+    i.e. across all app processes. It runs before any other handler tool,
+    so rejected requests cost no database queries.
+    """
+    def __init__(self):
+        super().__init__('before_handler', self._check, priority=1)
+        self.limiter = TokenBucketLimiter()
+
+    def _check(self):
+        request = cherrypy.serving.request
+        route = current_route_name()
+        rules = cherrypy.config.get('ratelimit', {}).get(route)
+        if not rules:
+            return
+
+        wait = 0.0
+        for rule in rules:
+            subject = _SUBJECTS[rule['per']](request)
+            if subject is None:
+                continue
+
+            key = (route, rule['per'], subject)
+            rate, burst = float(rule['rate']), float(rule['burst'])
+            rule_wait = None
+            backend = get_shared_backend() if rule.get('shared') else None
+            if backend is not None:
+                rule_wait = _consume_shared(backend, key, rate, burst)
+            if rule_wait is None:
+                rule_wait = self.limiter.consume(key, rate, burst)
+            wait = max(wait, rule_wait)
+
+        if not wait:
+            metrics.inc('ratelimit_requests_total', route=route,
+                        result='allowed')
+            return
+
+        metrics.inc('ratelimit_requests_total', route=route,
+                    result='rejected')
+        logger.info('Rate limit of %s exceeded by %s', route,
+                    request.remote.ip)
+        raise TooManyRequestsError(wait)
@@ -0,0 +1,91 @@
+import mimetypes
+import os
+import urllib.parse
+
+import cherrypy
+from cherrypy.lib.static import serve_file
+
+from ..utils.assets import is_fingerprinted
+
+
+__all__ = ['StaticAssetsTool']
+
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Preferred first
+PRECOMPRESSED_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _accepted_encodings(request):
+    return {
+        el.value.lower()
+        for el in request.headers.elements('Accept-Encoding')
+        if el.qvalue > 0
+    }
+
+
+def serve_asset(section, dir, root=None, max_age=3600):
+    """Serves static file, preferring its precompressed sibling
+
+    Works as a drop-in replacement of ``tools.staticdir``, but picks
+    ``.br``/``.gz`` siblings written by assets build if client accepts them,
+    and marks fingerprinted files as immutable.
+
+    Args:
+        section (str): config section, tool is enabled in, e.g. /css
+        dir (str): directory to serve files from
+        root (str) [Optional]: root for dir, staticdir's one by default
+        max_age (int) [Optional]: cache lifetime of not fingerprinted files
+    Returns:
+        (bool): True if the file was served
+    """
+    request = cherrypy.serving.request
+    response = cherrypy.serving.response
+
+    if request.method not in ('GET', 'HEAD'):
+        return False
+
+    if root is None:
+        root = request.config.get('tools.staticdir.root', '')
+    base_dir = os.path.abspath(os.path.join(root, dir))
+
+    branch = request.path_info[len(section) + 1:]
+    branch = urllib.parse.unquote(branch.lstrip(r'\/'))
+    filename = os.path.normpath(os.path.join(base_dir, branch))
+    if not filename.startswith(base_dir + os.sep):
+        raise cherrypy.HTTPError(403)
+
+    if not os.path.isfile(filename):
+        return False
+
+    content_type, _ = mimetypes.guess_type(filename)
+    accepted = _accepted_encodings(request)
+    served_path, encoding, compressed = filename, None, False
+    for enc, ext in PRECOMPRESSED_ENCODINGS:
+        if os.path.isfile(filename + ext):
+            compressed = True
+            if enc in accepted and encoding is None:
+                served_path, encoding = filename + ext, enc
+
+    if compressed:
+        response.headers['Vary'] = 'Accept-Encoding'
+
+    if is_fingerprinted(branch):
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response.headers['Cache-Control'] = 'public, max-age={}'.format(
+            max_age)
+
+    serve_file(served_path, content_type=content_type)
+
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+
+    return True
+
+
+class StaticAssetsTool(cherrypy._cptools.HandlerTool):
+
+    def __init__(self):
+        super().__init__(serve_asset)
@@ -0,0 +1,177 @@
+"""Static assets fingerprinting and precompression
+
+Build stage copies every static file to a content-hashed name
+(``css/style.css`` -> ``css/style.0123456789.css``), writes ``.gz`` and
+``.br`` siblings for compressible ones and dumps a manifest, mapping source
+paths to fingerprinted ones. ``url_for_static`` resolves through that
+manifest, if it's configured under ``assets.manifest`` option.
+
+Usage:
+    build_gdg_assets static css js img libs
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import threading
+
+import cherrypy as cp
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'assets-manifest.json'
+
+DEFAULT_DIRS = ('css', 'js', 'img', 'libs')
+
+COMPRESSIBLE_EXTENSIONS = {
+    '.css', '.js', '.json', '.svg', '.html', '.txt', '.xml', '.ico',
+    '.map', '.eot', '.ttf', '.otf',
+}
+
+HASH_LENGTH = 10
+
+FINGERPRINT_RE = re.compile(
+    r'\.[0-9a-f]{{{}}}(\.[^./]+)?$'.format(HASH_LENGTH))
+
+_manifest = None
+_manifest_path = None
+_manifest_lock = threading.Lock()
+
+
+def fingerprint(path, content):
+    """Inserts content hash into the file name, right before extension"""
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    base, ext = os.path.splitext(path)
+    return '{}.{}{}'.format(base, digest, ext)
+
+
+def _is_build_output(path, known_outputs):
+    return (path.endswith(('.gz', '.br')) or
+            path in known_outputs or
+            FINGERPRINT_RE.search(path) is not None)
+
+
+def _write_compressed(path, content):
+    """Writes precompressed siblings of a file, if they are worth it"""
+    gz_content = gzip.compress(content, compresslevel=9)
+    if len(gz_content) < len(content):
+        with open(path + '.gz', 'wb') as f:
+            f.write(gz_content)
+
+    if brotli is not None:
+        br_content = brotli.compress(content)
+        if len(br_content) < len(content):
+            with open(path + '.br', 'wb') as f:
+                f.write(br_content)
+
+
+def _remove_output(static_dir, rel_path):
+    for path in (rel_path, rel_path + '.gz', rel_path + '.br'):
+        try:
+            os.remove(os.path.join(static_dir, path))
+        except FileNotFoundError:
+            pass
+
+
+def read_manifest(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def build_assets(static_dir, dirs=DEFAULT_DIRS):
+    """Fingerprints and precompresses static files
+
+    Args:
+        static_dir (str): static files root
+        dirs (iterable): subdirectories of static_dir to process
+    Returns:
+        (dict): manifest, mapping source paths to fingerprinted ones
+    """
+    manifest_path = os.path.join(static_dir, MANIFEST_NAME)
+    old_manifest = read_manifest(manifest_path)
+    known_outputs = set(old_manifest.values())
+
+    manifest = {}
+    for dir_ in dirs:
+        for dirpath, _, filenames in os.walk(os.path.join(static_dir, dir_)):
+            for filename in sorted(filenames):
+                full_path = os.path.join(dirpath, filename)
+                rel_path = os.path.relpath(full_path, static_dir)
+                rel_path = rel_path.replace(os.sep, '/')
+                if _is_build_output(rel_path, known_outputs):
+                    continue
+
+                with open(full_path, 'rb') as f:
+                    content = f.read()
+
+                out_path = fingerprint(rel_path, content)
+                full_out_path = os.path.join(static_dir, out_path)
+                if not os.path.exists(full_out_path):
+                    shutil.copy2(full_path, full_out_path)
+
+                ext = os.path.splitext(rel_path)[1].lower()
+                if ext in COMPRESSIBLE_EXTENSIONS:
+                    _write_compressed(full_out_path, content)
+
+                manifest[rel_path] = out_path
+
+    for stale_output in known_outputs - set(manifest.values()):
+        _remove_output(static_dir, stale_output)
+
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+def get_manifest():
+    """Returns manifest configured under ``assets.manifest`` option"""
+    global _manifest, _manifest_path
+
+    path = cp.config.get('assets', {}).get('manifest')
+    if not path:
+        return {}
+
+    if path != _manifest_path:
+        with _manifest_lock:
+            _manifest = read_manifest(path)
+            _manifest_path = path
+            if not _manifest:
+                logger.warning('Assets manifest %s is missing or empty', path)
+    return _manifest
+
+
+def resolve_asset(path):
+    """Returns fingerprinted path of static asset or path itself"""
+    return get_manifest().get(path.lstrip('/'), path)
+
+
+def is_fingerprinted(path):
+    """Checks whether static path points to an immutable build output"""
+    return FINGERPRINT_RE.search(path) is not None
+
+
+def main():
+    static_dir, *dirs = sys.argv[1:] or ['static']
+
+    logging.basicConfig(level=logging.INFO)
+    manifest = build_assets(static_dir, dirs or DEFAULT_DIRS)
+    logger.info('Built %d assets into %s', len(manifest), static_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Bloom filter: compact set, which answers "definitely not" or "maybe"
+"""
+
+import hashlib
+import math
+
+
+__all__ = ['BloomFilter']
+
+
+class BloomFilter:
+    """Bloom filter of strings
+
+    Usage:
+        >>> codes = BloomFilter(capacity=1000, error_rate=0.01)
+        >>> codes.add('f1d2d2f924e9')
+        >>> 'f1d2d2f924e9' in codes
+        True
+        >>> 'nope' in codes  # with 1% chance of being True
+        False
+    """
+    def __init__(self, capacity, error_rate=0.01):
+        """Creates an empty filter
+
+        Args:
+            capacity (int): number of items, which keep false positive rate
+                            within ``error_rate``
+            error_rate (float): desired false positive rate
+        """
+        self.capacity = max(1, capacity)
+        self.num_bits = int(math.ceil(
+            -self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(
+            1, int(round(self.num_bits / self.capacity * math.log(2))))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self._count = 0
+
+    def __len__(self):
+        """Returns number of added items"""
+        return self._count
+
+    def _positions(self, item):
+        # Double hashing: k positions out of two independent 64-bit hashes
+        digest = hashlib.sha1(item.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:16], 'little') | 1
+        return ((h1 + i * h2) % self.num_bits
+                for i in range(self.num_hashes))
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self._count += 1
+
+    def update(self, items):
+        for item in items:
+            self.add(item)
+
+    def __contains__(self, item):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7))
+                   for pos in self._positions(item))
+
+    @property
+    def size(self):
+        """Returns memory taken by bits in bytes"""
+        return len(self._bits)
+
+    def false_positive_rate(self):
+        """Estimates current false positive rate by share of set bits"""
+        set_bits = sum(bin(byte).count('1') for byte in self._bits)
+        return (set_bits / self.num_bits) ** self.num_hashes
@@ -0,0 +1,165 @@
+"""In-process caching primitives with optional memcached write-through"""
+
+import hashlib
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+
+import cherrypy as cp
+
+try:
+    import memcache
+except ImportError:
+    memcache = None
+
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+_shared_backend = None
+_shared_backend_servers = None
+
+
+def get_shared_backend():
+    """Returns memcached client shared between app processes
+
+    Servers are taken from ``cache.memcached_servers`` global config option.
+
+    Returns:
+        (memcache.Client): client instance or None if it's not configured
+    """
+    global _shared_backend, _shared_backend_servers
+
+    servers = cp.config.get('cache', {}).get('memcached_servers')
+    if not servers:
+        return None
+
+    servers = tuple(servers)
+    if servers != _shared_backend_servers:
+        if memcache is None:
+            logger.warning('Shared cache is configured, but python-memcached '
+                           'is not installed. Falling back to local cache.')
+            return None
+        _shared_backend = memcache.Client(list(servers))
+        _shared_backend_servers = servers
+
+    return _shared_backend
+
+
+def make_backend_key(namespace, key):
+    """Builds memcached-safe key out of arbitrary hashable key"""
+    digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+    return 'gdg:{}:{}'.format(namespace, digest)
+
+
+class LRUCache:
+    """Thread-safe LRU mapping with optional per-entry expiration
+
+    Usage:
+        >>> cache = LRUCache(maxsize=2, ttl=60)
+        >>> cache.set('a', 1)
+        >>> cache.get('a')
+        1
+
+    When ``shared`` is set and memcached is configured, local misses fall
+    through to memcached and every write is propagated there as well.
+    """
+    def __init__(self, maxsize=128, ttl=None, namespace=None, shared=False):
+        """Creates a new LRUCache
+
+        Args:
+            maxsize (int): max number of entries kept in memory
+            ttl (float) [Optional]: default entry lifetime in seconds
+            namespace (str) [Optional]: prefix of keys in shared storage
+            shared (bool) [Optional]: whether to use shared storage
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.namespace = namespace or 'default'
+        self.shared = shared
+
+        self.hits = 0
+        self.misses = 0
+
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def _backend(self):
+        return get_shared_backend() if self.shared else None
+
+    def _expires_at(self, ttl):
+        if ttl is None:
+            ttl = self.ttl
+        return None if ttl is None else time.monotonic() + ttl
+
+    def _set_local(self, key, value, expires_at):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                value, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+
+        backend = self._backend()
+        if backend is not None:
+            value = backend.get(make_backend_key(self.namespace, key))
+            if value is not None:
+                with self._lock:
+                    self.hits += 1
+                self._set_local(key, value, self._expires_at(None))
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        self._set_local(key, value, self._expires_at(ttl))
+
+        backend = self._backend()
+        if backend is not None:
+            if ttl is None:
+                ttl = self.ttl
+            backend.set(make_backend_key(self.namespace, key), value,
+                        int(ttl or 0))
+
+    def get_or_set(self, key, factory, ttl=None):
+        """Returns cached value or stores the one produced by ``factory()``"""
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = factory()
+            self.set(key, value, ttl=ttl)
+        return value
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+
+        backend = self._backend()
+        if backend is not None:
+            backend.delete(make_backend_key(self.namespace, key))
+
+        return default if entry is _MISSING else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,54 @@
+"""Columnar encoding of uniform records
+
+Large lists of objects repeat every key in every item, so they are sent
+as one array per column instead: records ``{'id': 1, 'size': 'm'}`` and
+``{'id': 2, 'size': 'm'}`` become ``{'id': [1, 2], 'size': [0, 0]}`` with
+``{'size': ['m']}`` dictionary.
+
+Dictionary-encoded columns hold indices into the column's dictionary,
+which suits low-cardinality values like enums. Nulls stay nulls.
+"""
+
+from datetime import date, datetime
+
+
+__all__ = ['to_columns']
+
+
+def _plain(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def to_columns(records, columns, dictionary_encoded=()):
+    """Converts records to columns
+
+    Args:
+        records (iterable): dicts, having all of the columns as keys
+        columns (list): names of columns in the result
+        dictionary_encoded (iterable) [Optional]: names of columns to encode
+            with indices of dictionary values
+    Returns:
+        (dict): count of records, columns and dictionaries
+    """
+    dictionary_encoded = set(dictionary_encoded)
+    result = {name: [] for name in columns}
+    indices = {name: {} for name in columns if name in dictionary_encoded}
+    count = 0
+    for record in records:
+        count += 1
+        for name in columns:
+            value = _plain(record[name])
+            if name in indices and value is not None:
+                value = indices[name].setdefault(value, len(indices[name]))
+            result[name].append(value)
+
+    return {
+        'count': count,
+        'columns': result,
+        'dictionaries': {
+            name: sorted(index, key=index.get)
+            for name, index in indices.items()
+        },
+    }
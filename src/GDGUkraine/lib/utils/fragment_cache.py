@@ -0,0 +1,67 @@
+"""Jinja2 extension for caching of rendered template fragments
+
+Enable it in ``jinja2.extensions`` config section and wrap expensive
+template blocks as follows::
+
+    {% cache ('event-card', event.id) %}
+        ...
+    {% endcache %}
+
+    {% cache ('event-card', event.id), 600 %}
+        ...
+    {% endcache %}
+
+The first argument is a fragment key, the second one is an optional TTL in
+seconds. Version stamps of ``Event`` and ``Place`` models are always mixed
+into the key, so fragments are re-rendered once those get changed.
+"""
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+
+from .cache import LRUCache
+from .versions import get_versions
+
+
+__all__ = ['FragmentCacheExtension']
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    versioned_models = ('Event', 'Place')
+
+    def __init__(self, environment):
+        super().__init__(environment)
+
+        environment.extend(
+            fragment_cache=LRUCache(
+                maxsize=1024, ttl=3600,
+                namespace='fragments', shared=True,
+            ),
+        )
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+
+        # Fragment location makes keys unique across templates and blocks
+        args = [nodes.Const(parser.name), nodes.Const(lineno),
+                parser.parse_expression()]
+
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+
+        return nodes.CallBlock(
+            self.call_method('_cache_support', args),
+            [], [], body,
+        ).set_lineno(lineno)
+
+    def _cache_support(self, template_name, lineno, key, ttl, caller):
+        cache = self.environment.fragment_cache
+        cache_key = (template_name, lineno, key,
+                     get_versions(*self.versioned_models))
+        return cache.get_or_set(cache_key, caller, ttl=ttl)
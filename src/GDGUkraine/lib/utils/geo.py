@@ -0,0 +1,131 @@
+"""Geographic helpers: great-circle distances and nearest neighbour search
+
+Points are indexed as 3-d unit vectors, so the tree has no trouble with
+poles and the antimeridian, and euclidean (chord) distance between vectors
+grows monotonically with the great-circle one.
+"""
+
+import heapq
+import math
+
+from itertools import count
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vector(lat, lng):
+    """Converts coordinates in degrees into a point on the unit sphere"""
+    lat, lng = math.radians(lat), math.radians(lng)
+    cos_lat = math.cos(lat)
+    return (cos_lat * math.cos(lng), cos_lat * math.sin(lng), math.sin(lat))
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """Returns great-circle distance between two points in kilometers"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _sq_dist(a, b):
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+
+class KDTree:
+    """Static k-d tree over points on the Earth surface
+
+    Usage:
+        >>> tree = KDTree([(50.45, 30.52, 'Kyiv'), (49.84, 24.03, 'Lviv')])
+        >>> [item for _, item in tree.nearest(49.5, 25.0)]
+        ['Lviv']
+    """
+    def __init__(self, points):
+        """Builds a tree
+
+        Args:
+            points (iterable): (lat, lng, item) triples
+        """
+        points = [(to_unit_vector(lat, lng), (lat, lng), item)
+                  for lat, lng, item in points]
+        # Nodes are kept in flat lists, tree links are indices in them
+        self._vectors = []
+        self._coords = []
+        self._items = []
+        self._axes = []
+        self._left = []
+        self._right = []
+        self._root = self._build(points)
+
+    def __len__(self):
+        return len(self._items)
+
+    def _build(self, points):
+        if not points:
+            return None
+
+        # Split along the axis of the largest spread
+        axis = max(range(3), key=lambda i: (
+            max(p[0][i] for p in points) - min(p[0][i] for p in points)))
+        points.sort(key=lambda p: p[0][axis])
+        median = len(points) // 2
+        vector, coords, item = points[median]
+
+        node = len(self._items)
+        self._vectors.append(vector)
+        self._coords.append(coords)
+        self._items.append(item)
+        self._axes.append(axis)
+        self._left.append(None)
+        self._right.append(None)
+
+        self._left[node] = self._build(points[:median])
+        self._right[node] = self._build(points[median + 1:])
+        return node
+
+    def nearest(self, lat, lng, k=1):
+        """Finds k points closest to the given one
+
+        Returns:
+            (list): (distance in km, item) pairs, closest first
+        """
+        if k < 1 or self._root is None:
+            return []
+
+        target = to_unit_vector(lat, lng)
+        # Max-heap of the best candidates so far by negated chord distance,
+        # counter breaks ties without comparing items
+        best = []
+        tie = count()
+
+        # Each entry holds a subtree and the squared distance to the plane,
+        # which separates it from the target
+        stack = [(self._root, 0.0)]
+        while stack:
+            node, plane_dist = stack.pop()
+            if node is None:
+                continue
+            # Subtree can only help if its plane is closer than the worst
+            # candidate found so far
+            if len(best) == k and plane_dist >= -best[0][0]:
+                continue
+
+            vector = self._vectors[node]
+            dist = _sq_dist(target, vector)
+            if len(best) < k:
+                heapq.heappush(best, (-dist, next(tie), node))
+            elif dist < -best[0][0]:
+                heapq.heapreplace(best, (-dist, next(tie), node))
+
+            axis = self._axes[node]
+            diff = target[axis] - vector[axis]
+            near, far = ((self._left[node], self._right[node]) if diff < 0
+                         else (self._right[node], self._left[node]))
+            stack.append((far, diff * diff))
+            stack.append((near, plane_dist))
+
+        result = [(haversine(lat, lng, *self._coords[node]), self._items[node])
+                  for _, _, node in best]
+        result.sort(key=lambda r: r[0])
+        return result
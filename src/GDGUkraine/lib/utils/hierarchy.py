@@ -0,0 +1,119 @@
+"""Closure table of GDG places hierarchy
+
+``PlaceClosure`` holds a row for every (place, its subdivision at any depth)
+pair, so "this GDG and all its sub-chapters" is a single indexed lookup
+instead of walking ``Place.master`` recursively. The rows are kept in sync
+by mapper events of ``Place``, which run inside the same flush.
+
+The hierarchy is small and rarely changes, so maintenance favours simple
+statements over clever ones: MySQL can't select from the table it deletes
+from, which is why affected ids are read first.
+"""
+
+import logging
+
+from sqlalchemy import event
+
+from ...model import Place, PlaceClosure
+
+
+__all__ = ['closure_rows', 'register']
+
+
+logger = logging.getLogger(__name__)
+
+closure = PlaceClosure.__table__
+
+
+def closure_rows(places):
+    """Computes closure of hierarchy
+
+    Args:
+        places (iterable): (id, master id) pairs
+    Returns:
+        (list): dicts of closure table rows
+    Raises:
+        ValueError: if hierarchy has a cycle
+    """
+    masters = dict(places)
+    rows = []
+    for place_id in masters:
+        ancestor_id, depth = place_id, 0
+        while ancestor_id is not None:
+            rows.append({'ancestor_id': ancestor_id,
+                         'descendant_id': place_id, 'depth': depth})
+            ancestor_id, depth = masters.get(ancestor_id), depth + 1
+            if depth > len(masters):
+                raise ValueError(
+                    'Place {} is its own subdivision'.format(place_id))
+    return rows
+
+
+def _ancestors(connection, place_id):
+    # (ancestor id, depth) pairs including the place itself
+    return [(r.ancestor_id, r.depth) for r in connection.execute(
+        closure.select().where(closure.c.descendant_id == place_id))]
+
+
+def _descendants(connection, place_id):
+    # (descendant id, depth) pairs including the place itself
+    return [(r.descendant_id, r.depth) for r in connection.execute(
+        closure.select().where(closure.c.ancestor_id == place_id))]
+
+
+def _attach(connection, subtree, master_id):
+    # Links every place of subtree to master and all its ancestors
+    if master_id is None:
+        return
+    subtree_ids = {id_ for id_, _ in subtree}
+    ancestors = _ancestors(connection, master_id)
+    if any(id_ in subtree_ids for id_, _ in ancestors):
+        raise ValueError('Place cannot be a subdivision of its subdivision')
+    connection.execute(closure.insert(), [
+        {'ancestor_id': ancestor_id, 'descendant_id': descendant_id,
+         'depth': ancestor_depth + depth + 1}
+        for ancestor_id, ancestor_depth in ancestors
+        for descendant_id, depth in subtree
+    ])
+
+
+def _after_insert(mapper, connection, place):
+    connection.execute(closure.insert(), [
+        {'ancestor_id': place.id, 'descendant_id': place.id, 'depth': 0},
+    ])
+    _attach(connection, [(place.id, 0)], place.master_id)
+
+
+def _after_update(mapper, connection, place):
+    # Comparing with the stored parent also catches master_id, which was
+    # synced from the relationship rather than set directly
+    ancestors = _ancestors(connection, place.id)
+    master_id = next((id_ for id_, depth in ancestors if depth == 1), None)
+    if master_id == place.master_id:
+        return
+
+    subtree = _descendants(connection, place.id)
+    old_ancestor_ids = [id_ for id_, depth in ancestors if depth > 0]
+    if old_ancestor_ids:
+        connection.execute(closure.delete().where(
+            closure.c.ancestor_id.in_(old_ancestor_ids)).where(
+            closure.c.descendant_id.in_([id_ for id_, _ in subtree])))
+    _attach(connection, subtree, place.master_id)
+    logger.debug('Moved place %s from %s to %s',
+                 place.id, master_id, place.master_id)
+
+
+def _before_delete(mapper, connection, place):
+    connection.execute(closure.delete().where(
+        (closure.c.ancestor_id == place.id) |
+        (closure.c.descendant_id == place.id)))
+
+
+def register():
+    """Subscribes to ``Place`` mapper events to maintain closure table"""
+    if event.contains(Place, 'after_insert', _after_insert):
+        return
+
+    event.listen(Place, 'after_insert', _after_insert)
+    event.listen(Place, 'after_update', _after_update)
+    event.listen(Place, 'before_delete', _before_delete)
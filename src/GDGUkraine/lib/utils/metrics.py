@@ -0,0 +1,156 @@
+"""Process-wide registry of counters, gauges and histograms
+
+Usage:
+    >>> inc('ratelimit_rejected_total', route='add_participant')
+    >>> set_gauge('invite_filter_bits', 8192, event='42')
+    >>> observe('http_handler_seconds', 0.042, route='add_participant')
+    >>> snapshot()['counters']['ratelimit_rejected_total']
+    {(('route', 'add_participant'),): 1}
+"""
+
+import math
+import threading
+
+from bisect import bisect_left
+
+
+__all__ = [
+    'DEFAULT_BUCKETS', 'inc', 'set_gauge', 'observe', 'snapshot',
+    'exposition', 'reset',
+]
+
+
+# Upper bounds of histogram buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+# Histogram name to (bucket bounds, series), where every series is a list
+# of counts per bucket, then of values over the last bound, then the sum
+_histograms = {}
+
+
+def _labels_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Increments counter identified by name and labels"""
+    key = _labels_key(labels)
+    with _lock:
+        series = _counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Sets current value of gauge identified by name and labels"""
+    key = _labels_key(labels)
+    with _lock:
+        _gauges.setdefault(name, {})[key] = value
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS, **labels):
+    """Adds value to histogram identified by name and labels
+
+    Buckets are fixed by the first observation of the histogram, so it's
+    cheap: a binary search and two additions.
+    """
+    key = _labels_key(labels)
+    with _lock:
+        bounds, series = _histograms.setdefault(name, (tuple(buckets), {}))
+        counts = series.get(key)
+        if counts is None:
+            counts = series[key] = [0] * (len(bounds) + 1) + [0]
+        counts[bisect_left(bounds, value)] += 1
+        counts[-1] += value
+
+
+def _histogram_snapshot(bounds, counts):
+    cumulative, buckets = 0, []
+    for bound, count in zip(bounds + (math.inf,), counts):
+        cumulative += count
+        buckets.append((bound, cumulative))
+    return {'buckets': buckets, 'count': cumulative, 'sum': counts[-1]}
+
+
+def snapshot():
+    """Returns copy of all metrics
+
+    Returns:
+        (dict): ``counters``, ``gauges`` and ``histograms``, each mapping
+                metric name to values by sorted tuples of (label, value)
+                pairs. Histogram values are dicts of cumulative
+                ``buckets`` as (upper bound, count) pairs, ``count`` and
+                ``sum``
+    """
+    with _lock:
+        return {
+            'counters': {k: dict(v) for k, v in _counters.items()},
+            'gauges': {k: dict(v) for k, v in _gauges.items()},
+            'histograms': {
+                k: {labels: _histogram_snapshot(bounds, counts)
+                    for labels, counts in series.items()}
+                for k, (bounds, series) in _histograms.items()
+            },
+        }
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(label, value.replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for label, value in labels
+    ))
+
+
+def exposition():
+    """Renders all metrics in Prometheus text format
+
+    Returns:
+        (str): metrics in text exposition format, version 0.0.4
+    """
+    metrics = snapshot()
+    lines = []
+    for kind, metric_type in (('counters', 'counter'), ('gauges', 'gauge')):
+        for name, series in sorted(metrics[kind].items()):
+            lines.append('# TYPE {} {}'.format(name, metric_type))
+            lines.extend(
+                '{}{} {}'.format(name, _format_labels(labels),
+                                 _format_value(value))
+                for labels, value in sorted(series.items())
+            )
+
+    for name, series in sorted(metrics['histograms'].items()):
+        lines.append('# TYPE {} histogram'.format(name))
+        for labels, histogram in sorted(series.items()):
+            lines.extend(
+                '{}_bucket{} {}'.format(name, _format_labels(
+                    labels + (('le', _format_value(bound)),)), count)
+                for bound, count in histogram['buckets']
+            )
+            lines.append('{}_sum{} {}'.format(
+                name, _format_labels(labels),
+                _format_value(histogram['sum'])))
+            lines.append('{}_count{} {}'.format(
+                name, _format_labels(labels), histogram['count']))
+
+    return '\n'.join(lines + [''])
+
+
+def reset():
+    """Drops all metrics, meant for tests"""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
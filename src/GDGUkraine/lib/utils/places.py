@@ -0,0 +1,95 @@
+"""Read-only in-memory snapshot of GDG places
+
+It is built once per ``Place`` version stamp (see
+:mod:`GDGUkraine.lib.utils.versions`), so all the parsing and serialization
+happens on place writes instead of every request.
+"""
+
+import hashlib
+import json
+import logging
+
+from collections import namedtuple
+
+from blueberrypy.util import to_collection
+
+from .geo import KDTree
+
+
+logger = logging.getLogger(__name__)
+
+
+PlaceInfo = namedtuple('PlaceInfo', [
+    'id', 'city', 'name', 'url', 'logo', 'show', 'master_id', 'lat', 'lng',
+])
+
+
+def parse_geo(geo):
+    """Parses ``'lat,lng'`` string into a pair of floats
+
+    Returns:
+        (tuple): (lat, lng) or (None, None) if geo is empty or malformed
+    """
+    try:
+        lat, lng = map(float, geo.split(','))
+    except (AttributeError, ValueError):
+        return None, None
+    return lat, lng
+
+
+class PlaceRegistry:
+    """Snapshot of places with parsed coordinates and prerendered JSON
+
+    Attributes:
+        places (tuple): ``PlaceInfo`` records in the original order
+        by_id (dict): place id -> ``PlaceInfo``
+        markers (tuple): homepage map markers of shown places
+        spatial_index (KDTree): shown places with known coordinates
+        json (bytes): JSON representation of all places for the REST API
+        etag (str): strong ETag of ``json``
+    """
+    def __init__(self, places):
+        places = list(places)
+        self.places = tuple(
+            PlaceInfo(p.id, p.city, p.name, p.url, p.logo, p.show,
+                      p.master_id, *parse_geo(p.geo))
+            for p in places
+        )
+        self.by_id = {p.id: p for p in self.places}
+
+        markers = []
+        for p in self.places:
+            if p.show != '1':
+                continue
+            if p.lat is None:
+                logger.warning('Place %s has malformed geo, skipping marker',
+                               p.id)
+                continue
+            markers.append({
+                'name': p.name,
+                'lat': p.lat,
+                'lng': p.lng,
+                'url': p.url,
+            })
+        self.markers = tuple(markers)
+
+        self.spatial_index = KDTree(
+            (p.lat, p.lng, p) for p in self.places
+            if p.show == '1' and p.lat is not None
+        )
+
+        self.json = json.dumps(
+            [to_collection(p, sort_keys=True) for p in places],
+        ).encode('utf-8')
+        self.etag = '"{}"'.format(hashlib.sha1(self.json).hexdigest())
+
+    def __len__(self):
+        return len(self.places)
+
+    def nearest(self, lat, lng, k=1):
+        """Returns up to k shown places closest to the point
+
+        Returns:
+            (list): (distance in km, PlaceInfo) pairs, closest first
+        """
+        return self.spatial_index.nearest(lat, lng, k)
@@ -0,0 +1,100 @@
+"""Read-only snapshot of an event's accepted registrations for check-in
+
+It is built once per version stamps of registrations and users (see
+:mod:`GDGUkraine.lib.utils.versions`), so door lookups never touch DB.
+"""
+
+import hashlib
+import json
+
+from bisect import bisect_left
+from collections import namedtuple
+
+
+RosterEntry = namedtuple('RosterEntry', [
+    'id', 'name', 'surname', 'email_hash', 'confirmed', 'visited',
+])
+
+
+def hash_email(email):
+    """Returns hex digest, which identifies email without disclosing it"""
+    return hashlib.sha256(
+        (email or '').strip().lower().encode('utf-8')).hexdigest()
+
+
+def _normalize(text):
+    return ' '.join(str(text).lower().split())
+
+
+class Roster:
+    """Accepted registrations with a prefix index over their search terms
+
+    Every entry is found by prefixes of its registration id, name, surname,
+    full name in both orders and email.
+
+    Usage:
+        >>> roster = Roster([(1, 'Alice', 'Johns', 'alice@wonderland.com',
+        ...                   True, False)])
+        >>> [e.id for e in roster.search('johns al')]
+        [1]
+
+    Attributes:
+        entries (tuple): ``RosterEntry`` records ordered by surname and name
+        json (bytes): JSON representation of all entries for the REST API
+        etag (str): strong ETag of ``json``
+    """
+    def __init__(self, rows):
+        """Builds a roster
+
+        Args:
+            rows (iterable): (registration id, name, surname, email,
+                             confirmed, visited) tuples
+        """
+        rows = sorted(rows, key=lambda r: (_normalize(r[2]),
+                                           _normalize(r[1]), r[0]))
+        self.entries = tuple(
+            RosterEntry(id_, name, surname, hash_email(email),
+                        bool(confirmed), bool(visited))
+            for id_, name, surname, email, confirmed, visited in rows
+        )
+
+        # Sorted (term, entry index) pairs: all terms with a common prefix
+        # are adjacent, so a lookup is a binary search plus a short scan
+        index = set()
+        for i, (id_, name, surname, email, _, _) in enumerate(rows):
+            for term in (id_, name, surname, email,
+                         '{} {}'.format(name, surname),
+                         '{} {}'.format(surname, name)):
+                term = _normalize(term or '')
+                if term:
+                    index.add((term, i))
+        index = sorted(index)
+        self._terms = [term for term, _ in index]
+        self._positions = [i for _, i in index]
+
+        self.json = json.dumps(
+            [entry._asdict() for entry in self.entries],
+            sort_keys=True,
+        ).encode('utf-8')
+        self.etag = '"{}"'.format(hashlib.sha1(self.json).hexdigest())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, query, limit=20):
+        """Finds entries with any search term starting with the query
+
+        Returns:
+            (list): up to ``limit`` ``RosterEntry`` records in roster order
+        """
+        query = _normalize(query)
+        if not query:
+            return []
+
+        found = set()
+        terms = self._terms
+        for j in range(bisect_left(terms, query), len(terms)):
+            if not terms[j].startswith(query):
+                break
+            found.add(self._positions[j])
+        return [self.entries[i] for i in sorted(found)[:limit]]
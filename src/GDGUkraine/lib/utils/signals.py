@@ -8,3 +8,15 @@ def pub(channel, *args, **kwargs):
     except ChannelFailures as cf:
         # Unwrap exception, which happened in channel
         raise cf.get_instances()[0] from cf
+
+
+def notify(channel, *args, **kwargs):
+    """Publishes to channel, whether anybody listens or not
+
+    Failures of listeners are already logged by the bus and don't concern
+    the publisher.
+    """
+    try:
+        cp.engine.publish(channel, *args, **kwargs)
+    except ChannelFailures:
+        pass
@@ -0,0 +1,88 @@
+"""Per-request accounting of time spent in ORM queries, templates and
+Google API calls
+
+``InstrumentTool`` starts accounting for a request and reports the totals
+to ``metrics`` when it ends. Everything recorded outside of instrumented
+requests, e.g. in background threads, is ignored.
+"""
+
+import time
+
+from contextlib import contextmanager
+
+import cherrypy
+
+from jinja2 import Template
+from jinja2.ext import Extension
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+__all__ = ['KINDS', 'TimingExtension', 'record', 'register', 'start',
+           'timed']
+
+
+KINDS = ('db', 'template', 'google_api')
+
+
+def start():
+    """Starts accounting for the current request"""
+    cherrypy.serving.request.timings = {kind: [0, 0.0] for kind in KINDS}
+
+
+def record(kind, seconds):
+    """Adds a call taken seconds to the current request's totals"""
+    timings = getattr(cherrypy.serving.request, 'timings', None)
+    if timings is not None:
+        totals = timings[kind]
+        totals[0] += 1
+        totals[1] += seconds
+
+
+@contextmanager
+def timed(kind):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(kind, time.perf_counter() - started)
+
+
+class TimedTemplate(Template):
+    def render(self, *args, **kwargs):
+        with timed('template'):
+            return super().render(*args, **kwargs)
+
+
+class TimingExtension(Extension):
+    """Makes Jinja2 environment account template render time
+
+    Enable it in ``jinja2.extensions`` config option.
+    """
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.template_class = TimedTemplate
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if context is not None:
+        context.timing_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    started = getattr(context, 'timing_started', None)
+    if started is not None:
+        record('db', time.perf_counter() - started)
+
+
+def register():
+    """Subscribes to events of all SQLAlchemy engines to time queries"""
+    if event.contains(Engine, 'before_cursor_execute',
+                      _before_cursor_execute):
+        return
+
+    event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
@@ -5,6 +5,8 @@ import urllib
 import cherrypy as cp
 import routes
 
+from .assets import resolve_asset
+
 logger = logging.getLogger(__name__)
 
 url_resolve_map = None
@@ -198,6 +200,21 @@ def build_url_map(force=False):
     return urls
 
 
+def current_route_name():
+    """Returns name of the Routes route matching current request
+
+    Returns:
+        (str): route name or None if request isn't dispatched by Routes
+    """
+    request = cp.serving.request
+    mapper = getattr(getattr(request, 'dispatch', None), 'mapper', None)
+    if mapper is None:
+        return None
+    match = mapper.routematch(request.path_info,
+                              environ={'REQUEST_METHOD': request.method})
+    return match[1].name if match else None
+
+
 def url_for_class(handler, url_args=[], url_params={}):
     app_name = __name__.split('.')[0].lower()
     handler = handler.lower()
@@ -266,6 +283,7 @@ def url_for_cp(handler):
 
 
 def url_for_static(handler):
+    handler = resolve_asset(handler)
     if not handler.startswith('/'):
         handler = '/'.join(['', handler])
     return cp.url(handler,
@@ -0,0 +1,154 @@
+"""Version stamps of ORM models, used to build cache keys
+
+Every committed ORM write bumps the stamp of the model it touched, so any
+cache key containing :func:`get_version` of that model changes together
+with the underlying rows.
+"""
+
+import logging
+import threading
+import time
+
+from uuid import uuid4
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .cache import get_shared_backend
+
+
+logger = logging.getLogger(__name__)
+
+# Stamps read from memcached are trusted for that long before re-reading
+SHARED_STAMP_TTL = 1.0
+
+_TOUCHED_KEY = 'gdg_touched_models'
+
+_lock = threading.Lock()
+_stamps = {}
+_shared_stamps = {}
+
+
+def _new_stamp():
+    return uuid4().hex[:16]
+
+
+def _model_name(model):
+    if isinstance(model, str):
+        return model
+    if not isinstance(model, type):
+        model = type(model)
+    return model.__name__
+
+
+def _backend_key(name):
+    return 'gdg:version:{}'.format(name)
+
+
+def _get_shared_version(backend, name):
+    now = time.monotonic()
+    with _lock:
+        stamp, expires_at = _shared_stamps.get(name, (None, 0))
+    if stamp is not None and expires_at > now:
+        return stamp
+
+    key = _backend_key(name)
+    stamp = backend.get(key)
+    if stamp is None:
+        backend.add(key, _new_stamp())
+        stamp = backend.get(key)
+
+    if stamp is not None:
+        with _lock:
+            _shared_stamps[name] = (stamp, now + SHARED_STAMP_TTL)
+    return stamp
+
+
+def get_version(model):
+    """Returns current version stamp of model
+
+    Args:
+        model (type|object|str): model class, its instance or name
+    Returns:
+        (str): opaque stamp, which changes on every committed model write
+    """
+    stamp = get_shared_version(model)
+    if stamp is not None:
+        return stamp
+
+    with _lock:
+        return _stamps.setdefault(_model_name(model), _new_stamp())
+
+
+def get_shared_version(model):
+    """Returns version stamp of model, shared between app processes
+
+    Returns:
+        (str): stamp or None if memcached isn't configured or available, so
+               writes of other processes can't be told
+    """
+    backend = get_shared_backend()
+    if backend is None:
+        return None
+    return _get_shared_version(backend, _model_name(model))
+
+
+def get_versions(*models):
+    return tuple(get_version(model) for model in models)
+
+
+def bump_version(*models):
+    """Invalidates current version stamps of given models"""
+    backend = get_shared_backend()
+    for name in set(map(_model_name, models)):
+        stamp = _new_stamp()
+        with _lock:
+            _stamps[name] = stamp
+            _shared_stamps.pop(name, None)
+        if backend is not None:
+            backend.set(_backend_key(name), stamp)
+        logger.debug('Bumped version of %s to %s', name, stamp)
+
+
+def touch(session, *models):
+    """Schedules version bump of models for when session commits
+
+    Use it after writes, which bypass the ORM unit of work
+    (e.g. Core statements executed through the session).
+    """
+    session.info.setdefault(_TOUCHED_KEY, set()).update(
+        map(_model_name, models))
+
+
+def _after_flush(session, flush_context):
+    touch(session, *(type(obj)
+                     for objs in (session.new, session.dirty, session.deleted)
+                     for obj in objs))
+
+
+def _after_bulk_operation(context):
+    mapper = getattr(context, 'mapper', None)
+    if mapper is not None:
+        touch(context.session, mapper.class_)
+
+
+def _after_commit(session):
+    touched = session.info.pop(_TOUCHED_KEY, None)
+    if touched:
+        bump_version(*touched)
+
+
+def _after_rollback(session):
+    session.info.pop(_TOUCHED_KEY, None)
+
+
+def register():
+    """Subscribes to SQLAlchemy session events to track model writes"""
+    if event.contains(Session, 'after_commit', _after_commit):
+        return
+
+    event.listen(Session, 'after_flush', _after_flush)
+    event.listen(Session, 'after_bulk_update', _after_bulk_operation)
+    event.listen(Session, 'after_bulk_delete', _after_bulk_operation)
+    event.listen(Session, 'after_commit', _after_commit)
+    event.listen(Session, 'after_rollback', _after_rollback)
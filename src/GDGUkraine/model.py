@@ -1,18 +1,20 @@
 import json
-from datetime import date
+from datetime import date, datetime
 
 from sqlalchemy import (
-    Column, UnicodeText, Date, String,
+    Column, UnicodeText, Date, DateTime, String,
     Enum, Boolean, ForeignKey
 )
 
 from sqlalchemy.types import TypeDecorator, VARCHAR
 
-from sqlalchemy.dialects.mysql import BIGINT as BigInteger, INTEGER as Integer
+from sqlalchemy.dialects.mysql import (
+    BIGINT as BigInteger, DATETIME, INTEGER as Integer,
+)
 from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.ext.declarative import declarative_base
 
-from sqlalchemy.schema import UniqueConstraint
+from sqlalchemy.schema import Index, UniqueConstraint
 
 Base = declarative_base()
 metadata = Base.metadata
@@ -41,8 +43,9 @@ class JSONEncodedDict(TypeDecorator):
 
 __all__ = [
     'WPPost', 'Admin',
-    'User', 'Event', 'EventParticipant',
-    'Place', 'Invite',
+    'User', 'Event', 'EventStats', 'EventParticipant',
+    'RegistrationTombstone',
+    'Place', 'PlaceClosure', 'Invite',
     'EXPERIENCE_CHOICES', 'ENGLISH_CHOICES', 'TSHIRT_CHOICES',
     'GENDER_CHOICES',
 ]
@@ -112,6 +115,8 @@ class EventParticipant(Base):
     __table_args__ = (
         UniqueConstraint('googler_id', 'event_id',
                          name='unique_participation'),
+        Index('ix_gdg_events_participation_event_id_change_seq',
+              'event_id', 'change_seq'),
     )
 
     def __init__(self, **kwargs):
@@ -127,7 +132,18 @@ class EventParticipant(Base):
 
     accepted = Column(Boolean, default=None)
     visited = Column(Boolean, default=None)
+    # Time of the earliest check-in scan, UTC
+    visited_at = Column(DateTime, default=None)
     confirmed = Column(Boolean, nullable=False, default=False)
+    # Time of the last write, UTC
+    updated_at = Column(
+        DateTime().with_variant(DATETIME(fsp=6), 'mysql'),
+        default=datetime.utcnow, onupdate=datetime.utcnow,
+    )
+    # Number of the last write among the event's registration changes,
+    # taken by api.next_change_seq, for clients syncing changes only
+    change_seq = Column(Integer, nullable=False, default=0,
+                        server_default='0')
 
     fields = deferred(Column(JSONEncodedDict(512)))
 
@@ -226,6 +242,12 @@ class Event(Base):
     # crutch for olostan's code
     background = Column(String(255), nullable=True)
     max_regs = Column(Integer, nullable=True, default=None)
+    # Counter of registrations, maintained by api.reserve_seat
+    seats_taken = Column(Integer, nullable=False, default=0,
+                         server_default='0')
+    # Counter of registration changes, maintained by api.next_change_seq
+    change_seq = Column(Integer, nullable=False, default=0,
+                        server_default='0')
     google_map_iframe = deferred(Column(UnicodeText, nullable=True,
                                         default=None))
 
@@ -241,7 +263,8 @@ class Event(Base):
         Returns:
             (bool): True if there are free spots at event otherwise False
         """
-        return self.max_regs is None or self.max_regs > len(self.participants)
+        return (self.max_regs is None or
+                self.max_regs > (self.seats_taken or 0))
 
     def is_registration_overdue(self):
         """ Checks whether the event registration is overdue
@@ -266,6 +289,47 @@ class Event(Base):
         return self.has_spots() and not self.is_registration_overdue()
 
 
+class EventStats(Base):
+    """
+    Class represents counters of registrations at an event.
+
+    They are incremented along with every registration write, see
+    ``api.update_event_stats``, so dashboards never count registrations.
+    """
+
+    __tablename__ = 'gdg_event_stats'
+
+    def __init__(self, **kwargs):
+        super(EventStats, self).__init__(**kwargs)
+
+    event_id = Column(Integer, ForeignKey('gdg_events.id'), primary_key=True,
+                      autoincrement=False)
+    registered = Column(Integer, nullable=False, default=0,
+                        server_default='0')
+    accepted = Column(Integer, nullable=False, default=0, server_default='0')
+    confirmed = Column(Integer, nullable=False, default=0, server_default='0')
+    visited = Column(Integer, nullable=False, default=0, server_default='0')
+
+
+class RegistrationTombstone(Base):
+    """
+    Class represents a deleted event registration.
+
+    Clients syncing registration changes learn about deletions from them,
+    see ``api.get_registrations_changed_since``.
+    """
+
+    __tablename__ = 'gdg_events_participation_tombstones'
+
+    def __init__(self, **kwargs):
+        super(RegistrationTombstone, self).__init__(**kwargs)
+
+    event_id = Column(Integer, ForeignKey('gdg_events.id'), primary_key=True,
+                      autoincrement=False)
+    change_seq = Column(Integer, primary_key=True, autoincrement=False)
+    registration_id = Column(Integer, primary_key=True, autoincrement=False)
+
+
 class Invite(Base):
     """
     Class represents an event registration invitation code.
@@ -308,3 +372,21 @@ class Place(Base):
                        default=None)
     master = relationship('Place', remote_side='Place.id',
                           backref='subdivisions')
+
+
+class PlaceClosure(Base):
+    """
+    Class represents a path between place and its (sub)subdivision.
+
+    Every place has a path of depth 0 to itself, so all places of a GDG
+    hierarchy are found by single ``ancestor_id`` lookup. Rows are
+    maintained on place writes, see :mod:`GDGUkraine.lib.utils.hierarchy`.
+    """
+
+    __tablename__ = 'gdg_place_closure'
+
+    ancestor_id = Column(Integer, ForeignKey('gdg_places.id'),
+                         primary_key=True, autoincrement=False)
+    descendant_id = Column(Integer, ForeignKey('gdg_places.id'),
+                           primary_key=True, autoincrement=False, index=True)
+    depth = Column(Integer, nullable=False)
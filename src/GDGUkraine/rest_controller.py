@@ -1,14 +1,17 @@
 import logging
+import math
 import re
+import time
 
-from copy import deepcopy
-from datetime import date
-from uuid import uuid4
+from datetime import date, datetime
+from itertools import islice
 
 import cherrypy
 
 from cherrypy import HTTPError
-from cherrypy.lib import file_generator
+from cherrypy.lib import cptools, file_generator
+
+from sqlalchemy import Enum
 
 from blueberrypy.util import from_collection, to_collection
 
@@ -16,26 +19,133 @@ from requests.exceptions import HTTPError as RequestsHTTPError
 
 from . import api
 from .errors import InvalidFormDataError
-from .model import User, Event, EventParticipant, Invite
+from .model import User, Event, EventParticipant, EventStats
 
+from .lib.utils import json, metrics
+from .lib.utils.columnar import to_columns
 from .lib.utils.gdrive import gdrive_upload
 from .lib.utils.mail import gmail_send_html
 from .lib.utils.table_exporter import gen_participants_xlsx
-from .lib.utils.signals import pub
+from .lib.utils.signals import notify, pub
 from .lib.utils.vcard import make_vcard, aes_encrypt
 from .lib.utils.url import url_for_class
+from .lib.utils.versions import get_version
 from .lib.forms import (
-    RegistrationForm, get_additional_fields_form_cls,
-    InputDict,
+    RegistrationForm, get_additional_fields_form_cls, compile_form,
 )
 
 
 logger = logging.getLogger(__name__)
 
+MAX_NEAREST_PLACES = 20
+MAX_GENERATED_INVITES = 1000000
+MAX_CHECK_IN_BATCH = 1000
+MAX_ROSTER_MATCHES = 20
+DEFAULT_PAGE_SIZE = 100
+# Seconds between comments, which keep idle streams alive
+STREAM_HEARTBEAT = 15
+# Seconds before a stream is ended, so its thread serves others meanwhile;
+# EventSource reconnects automatically after STREAM_RETRY milliseconds
+STREAM_LIFETIME = 300
+STREAM_RETRY = 3000
+MAX_PAGE_SIZE = 1000
+
+# Columns of participants, which may be requested or filtered by
+PARTICIPANT_FIELDS = frozenset(User.__table__.columns.keys()) - {'id'}
+PARTICIPANT_FILTERS = frozenset([
+    'hometown', 'company', 'position', 'local_gdg_id',
+])
+
+# Columns of events, which may be requested
+EVENT_FIELDS = frozenset(Event.__table__.columns.keys()) - {'id'}
+
+SCAN_TIME_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S')
+
+
+def _parse_scan_time(value):
+    """Parses ISO 8601 UTC time of a scan, missing one means now
+
+    Returns:
+        (datetime): naive UTC datetime
+    Raises:
+        ValueError: if time is malformed
+    """
+    if value is None:
+        return datetime.utcnow()
+    if not isinstance(value, str):
+        raise ValueError(value)
+
+    value = value[:-1] if value.endswith('Z') else value
+    for fmt in SCAN_TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise ValueError(value)
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _parse_event_cursor(cursor):
+    """Parses "<date>,<id>" cursor of events listing, date may be empty
+
+    Returns:
+        (tuple): date or None and id
+    Raises:
+        ValueError: if cursor is malformed
+    """
+    date_, _, id_ = cursor.partition(',')
+    return (_parse_date(date_) if date_ else None), int(id_)
+
+
+def _registration_columns(registrations):
+    """Encodes registrations with participants in columns
+
+    Participant columns are prefixed with "participant.", and its enums,
+    like t-shirt size, are dictionary-encoded.
+    """
+    reg_columns = [c.key for c in EventParticipant.__mapper__.column_attrs]
+    user_columns = [c.key for c in User.__mapper__.column_attrs]
+    enums = ['participant.' + c.key for c in User.__mapper__.column_attrs
+             if isinstance(c.columns[0].type, Enum)]
+
+    def gen_records():
+        for reg in registrations:
+            record = {key: getattr(reg, key) for key in reg_columns}
+            record['cardUrl'] = aes_encrypt(str(reg.id))
+            record.update(
+                ('participant.' + key, getattr(reg.user, key))
+                for key in user_columns
+            )
+            yield record
+
+    columns = reg_columns + ['cardUrl'] + [
+        'participant.' + key for key in user_columns]
+    return to_columns(gen_records(), columns, dictionary_encoded=enums)
+
+
+def _parse_change_cursor(cursor):
+    """Parses "<change_seq>,<id>" cursor of registration changes
+
+    Returns:
+        (tuple): change number and registration id
+    Raises:
+        ValueError: if cursor is malformed
+    """
+    change_seq, _, id_ = cursor.partition(',')
+    return int(change_seq), int(id_)
+
 
 class APIBase:
     _cp_config = {'tools.json_in.on': True}
 
+    @staticmethod
+    def _admin_place():
+        '''Returns id of place the admin is restricted to or None'''
+        return api.get_admin_place(cherrypy.request.admin_user)
+
     def create(self, **kwargs):
         raise NotImplementedError()
 
@@ -69,6 +179,39 @@ class Admin(APIBase):
                     req.admin_user['filter_place']))
         return res
 
+    @cherrypy.tools.authorize()
+    def metrics(self):
+        '''GET /api/metrics
+
+        Responds in Prometheus text format to clients accepting text/plain,
+        like Prometheus itself, and with JSON otherwise.
+        '''
+        resp = cherrypy.response
+        if 'text/plain' in cherrypy.request.headers.get('Accept', ''):
+            resp.headers['Content-Type'] = 'text/plain; version=0.0.4'
+            return metrics.exposition().encode('utf-8')
+
+        snapshot = metrics.snapshot()
+        res = {
+            kind: {
+                name: [{'labels': dict(labels), 'value': value}
+                       for labels, value in sorted(series.items())]
+                for name, series in snapshot[kind].items()
+            }
+            for kind in ('counters', 'gauges')
+        }
+        res['histograms'] = {
+            name: [{'labels': dict(labels), 'count': h['count'],
+                    'sum': h['sum'],
+                    'buckets': [{'le': None if math.isinf(le) else le,
+                                 'count': count}
+                                for le, count in h['buckets']]}
+                   for labels, h in sorted(series.items())]
+            for name, series in snapshot['histograms'].items()
+        }
+        resp.headers['Content-Type'] = 'application/json'
+        return json.dumps(res).encode('utf-8')
+
     @cherrypy.tools.json_out()
     def sign_in(self):
         # Doc:
@@ -110,6 +253,7 @@ class Admin(APIBase):
 class Participants(APIBase):
 
     @cherrypy.tools.json_out()
+    @cherrypy.tools.idempotency()
     def create(self, **kwargs):
         req = cherrypy.request
         orm_session = req.orm_session
@@ -127,13 +271,11 @@ class Participants(APIBase):
         u = req.json.get('user', {})
         fields = req.json.get('fields', {})
 
-        # Validate form data
-        regform = RegistrationForm(hidden=None, formdata=InputDict(u))
-        fieldsform_cls = get_additional_fields_form_cls(event.fields)
-        fieldsform = fieldsform_cls(InputDict(fields))
-        if not all([regform.validate(), fieldsform.validate()]):
-            errors = deepcopy(regform.errors)
-            errors.update(fieldsform.errors)
+        # Validate form data without building WTForms forms
+        errors = compile_form(RegistrationForm).validate(u)
+        errors.update(compile_form(
+            get_additional_fields_form_cls(event.fields)).validate(fields))
+        if errors:
             raise InvalidFormDataError(errors)
 
         # Registration BL
@@ -141,55 +283,59 @@ class Participants(APIBase):
 
         invitation = None
         if req.json.get('invite_code'):
-            invitation = api.find_invitation_by_code(
-                orm_session, req.json['invite_code']
+            # Invites always belong to an event (their event_id is NOT NULL)
+            invitation = api.find_event_invitation(
+                orm_session, event.id, req.json['invite_code']
             )
 
             # check if the invitation is valid
             if (
                 invitation is None or invitation.used or
-                (invitation.event and invitation.event.id != event.id) or
                 (invitation.email is not None and invitation.email != user.email)
             ):
                 raise HTTPError(403, 'Invalid invite code.')
 
-        eu = api.find_user_by_email(orm_session, user.email)
-        if eu:
-            user.id = eu.id
-            orm_session.merge(user)
-        else:
-            orm_session.add(user)
-        orm_session.flush()
-
-        eep = api.get_event_registration(orm_session, user.id, event.id)
-        ep = EventParticipant(
-            id=eep.id if eep else None,
-            event_id=event.id,
-            googler_id=user.id,
-            register_date=date.today(),
-            fields=fields,
-        )
+        user.id = api.upsert_user(
+            orm_session, {k: v for k, v in u.items() if k != 'id'})
+        if user.id is None:
+            orm_session.rollback()
+            raise HTTPError(409, 'User with such details already exists')
+
+        is_new_registration = api.upsert_registration(orm_session, {
+            'event_id': event.id,
+            'googler_id': user.id,
+            'register_date': date.today(),
+            'fields': fields,
+        })
+        if is_new_registration:
+            api.update_event_stats(orm_session, event.id, registered=1)
+
+        # Invitees are admitted regardless of max_regs
+        if is_new_registration and not api.reserve_seat(
+                orm_session, event.id, force=invitation is not None):
+            orm_session.rollback()
+            raise HTTPError(409, 'No free seats left')
 
-        if eep:
-            orm_session.merge(ep)
-        else:
-            orm_session.add(ep)
         if invitation is not None:
             invitation.email = user.email
             invitation.used = True
-            orm_session.merge(invitation)
         orm_session.commit()
 
+        if is_new_registration:
+            notify('event-delta', event.id, 'registered',
+                   {'participant': user.id})
+
         return to_collection(user, sort_keys=True)
 
     @cherrypy.tools.json_out()
     @cherrypy.tools.authorize()
     def show(self, id, **kwargs):
         id = int(id)
-        user = api.find_user_by_id(cherrypy.request.orm_session, id)
+        place = self._admin_place()
+        user = api.find_user_by_id(cherrypy.request.orm_session, id, place)
         if user:
             events = api.find_events_by_user(cherrypy.request.orm_session,
-                                             user)
+                                             user, place)
             logger.debug(events)
             u = to_collection(user, excludes=('password', 'salt'),
                               sort_keys=True)
@@ -201,14 +347,64 @@ class Participants(APIBase):
 
     @cherrypy.tools.json_out()
     @cherrypy.tools.authorize()
-    def list_all(self, **kwargs):
+    def list_all(self, after=None, limit=None, fields=None, **kwargs):
+        '''GET /api/participants
+
+        Query params:
+            after: cursor of the previous page
+            limit: page size, up to MAX_PAGE_SIZE
+            fields: comma-separated columns to return besides id
+            hometown, company, ...: filters by indexed columns
+
+        Responds with a plain list unless paginated with after or limit,
+        then it's {"items": [...], "cursor": ...}, where cursor is null on
+        the last page.
+        '''
         logger.debug('listing users')
-        users = api.get_all_users(cherrypy.request.orm_session)
-        if users:
-            return [to_collection(
+        paginated = after is not None or limit is not None
+        try:
+            after = None if after is None else int(after)
+            limit = DEFAULT_PAGE_SIZE if limit is None else int(limit)
+            assert 0 < limit <= MAX_PAGE_SIZE
+        except (ValueError, AssertionError):
+            raise HTTPError(400, 'Invalid pagination params')
+
+        if fields is not None:
+            fields = [f for f in fields.split(',') if f and f != 'id']
+            if not set(fields) <= PARTICIPANT_FIELDS:
+                raise HTTPError(400, 'Unknown fields requested')
+
+        filters = {k: v for k, v in kwargs.items()
+                   if k in PARTICIPANT_FILTERS}
+        if 'local_gdg_id' in filters:
+            try:
+                filters['local_gdg_id'] = int(filters['local_gdg_id'])
+            except ValueError:
+                raise HTTPError(400, 'Invalid local_gdg_id')
+
+        users = api.list_users(
+            cherrypy.request.orm_session,
+            after=after, limit=limit if paginated else None,
+            fields=fields, filters=filters, place=self._admin_place(),
+        )
+        if fields is None:
+            items = [to_collection(
                 u, excludes=('password', 'salt'), sort_keys=True)
                 for u in users]
-        raise HTTPError(404)
+        else:
+            # Only loaded columns, touching others would query them one by one
+            items = [{f: getattr(u, f) for f in ['id'] + fields}
+                     for u in users]
+
+        if not paginated:
+            if items:
+                return items
+            raise HTTPError(404)
+
+        return {
+            'items': items,
+            'cursor': users[-1].id if len(users) == limit else None,
+        }
 
     @cherrypy.tools.json_out()
     @cherrypy.tools.authorize()
@@ -216,7 +412,7 @@ class Participants(APIBase):
         id = int(id)
         req = cherrypy.request
         orm_session = req.orm_session
-        user = api.find_user_by_id(orm_session, id)
+        user = api.find_user_by_id(orm_session, id, self._admin_place())
         if user:
             user = from_collection(req.json, user)
             orm_session.merge(user)
@@ -230,7 +426,14 @@ class Participants(APIBase):
         id = int(id)
         req = cherrypy.request
         orm_session = req.orm_session
+        place = self._admin_place()
+        if place is not None and not api.find_user_by_id(
+                orm_session, id, place):
+            raise HTTPError(404)
+        # Registrations hold seats, which get freed
+        api.delete_user_registrations(orm_session, id)
         if not api.delete_user_by_id(orm_session, id):
+            orm_session.rollback()
             raise HTTPError(404)
         else:
             orm_session.commit()
@@ -243,41 +446,121 @@ class Events(APIBase):
     def create(self, **kwargs):
         req = cherrypy.request
         orm_session = req.orm_session
-        event = from_collection(req.json, Event())
+        # Counters are maintained by registrations only
+        event = from_collection(req.json, Event(),
+                                excludes=['seats_taken', 'change_seq'])
         orm_session.add(event)
+        orm_session.flush()
+        orm_session.add(EventStats(event_id=event.id))
         orm_session.commit()
         return to_collection(event, sort_keys=True)
 
     @cherrypy.tools.json_out()
     @cherrypy.tools.authorize()
-    def show(self, id, **kwargs):
+    def show(self, id, format=None, **kwargs):
+        '''GET /api/events/:id
+
+        Query params:
+            format: "columnar" to get registrations as one array per
+                column, see _registration_columns
+        '''
+        if format not in (None, 'columnar'):
+            raise HTTPError(400, 'Unknown format')
+
         id = int(id)
-        event = api.find_event_by_id(cherrypy.request.orm_session, id)
+        event = api.find_event_by_id(cherrypy.request.orm_session, id,
+                                     self._admin_place())
         if event:
             registrations = api.get_event_registrations(
-                cherrypy.request.orm_session, event.id)
+                cherrypy.request.orm_session, event.id, with_users=True)
             logger.debug(registrations)
             e = to_collection(event, sort_keys=True)
             e.update({'invites': [to_collection(i, sort_keys=True)
                      for i in event.invites]})
+            e['stats'] = api.get_event_stats(
+                cherrypy.request.orm_session, [event.id])[event.id]
+            if format == 'columnar':
+                e['registrations'] = _registration_columns(registrations)
+                return e
+
             e.update({'registrations': [to_collection(r, sort_keys=True)
                      for r in registrations]})
-            for r in e['registrations']:
+            for r, reg in zip(e['registrations'], registrations):
                 r.update({'cardUrl': aes_encrypt(str(r['id']))})
                 r.update({'participant': to_collection(
-                    api.find_user_by_id(cherrypy.request.orm_session,
-                                        r['googler_id']),
-                    excludes=('password', 'salt'))})
+                    reg.user, excludes=('password', 'salt'))})
             logger.debug(e)
             return e
         raise HTTPError(404)
 
     @cherrypy.tools.json_out()
     @cherrypy.tools.authorize()
-    def list_all(self, **kwargs):
-        events = api.get_all_events(cherrypy.request.orm_session)
-        return [to_collection(e, sort_keys=True)
-                for e in events] if events else []
+    def list_all(self, after=None, limit=None, fields=None, host_gdg_id=None,
+                 since=None, until=None, testing=None, **kwargs):
+        '''GET /api/events
+
+        Query params:
+            after: cursor of the previous page
+            limit: page size, up to MAX_PAGE_SIZE
+            fields: comma-separated columns to return besides id, stats
+                    are only returned if listed too
+            host_gdg_id: id of hosting place
+            since, until: date range (YYYY-MM-DD), inclusive
+            testing: true or false
+
+        Responds with a plain list unless paginated with after or limit,
+        then it's {"items": [...], "cursor": ...}, where cursor is null on
+        the last page.
+        '''
+        paginated = after is not None or limit is not None
+        try:
+            after = None if after is None else _parse_event_cursor(after)
+            limit = DEFAULT_PAGE_SIZE if limit is None else int(limit)
+            assert 0 < limit <= MAX_PAGE_SIZE
+            host_gdg_id = None if host_gdg_id is None else int(host_gdg_id)
+            since = None if since is None else _parse_date(since)
+            until = None if until is None else _parse_date(until)
+            testing = None if testing is None else {
+                'true': True, 'false': False}[testing.lower()]
+        except (ValueError, KeyError, AssertionError):
+            raise HTTPError(400, 'Invalid query params')
+
+        excludes = ()
+        with_stats = True
+        if fields is not None:
+            fields = [f for f in fields.split(',') if f and f != 'id']
+            with_stats = 'stats' in fields
+            fields = [f for f in fields if f != 'stats']
+            if not set(fields) <= EVENT_FIELDS:
+                raise HTTPError(400, 'Unknown fields requested')
+            # Serializing unloaded columns would query them one by one
+            excludes = EVENT_FIELDS - set(fields)
+
+        events = api.list_events(
+            cherrypy.request.orm_session,
+            after=after, limit=limit if paginated else None, fields=fields,
+            host_gdg_id=host_gdg_id, since=since, until=until,
+            testing=testing, place=self._admin_place(),
+        )
+        stats = {}
+        if with_stats:
+            stats = api.get_event_stats(cherrypy.request.orm_session,
+                                        [e.id for e in events])
+        items = []
+        for e in events:
+            item = to_collection(e, excludes=excludes, sort_keys=True)
+            if with_stats:
+                item['stats'] = stats[e.id]
+            items.append(item)
+        if not paginated:
+            return items
+
+        cursor = None
+        if len(events) == limit:
+            last = events[-1]
+            cursor = '{},{}'.format(
+                last.date.isoformat() if last.date else '', last.id)
+        return {'items': items, 'cursor': cursor}
 
     @cherrypy.tools.json_out()
     @cherrypy.tools.authorize()
@@ -285,12 +568,14 @@ class Events(APIBase):
         id = int(id)
         req = cherrypy.request
         orm_session = req.orm_session
-        event = api.find_event_by_id(orm_session, id)
+        event = api.find_event_by_id(orm_session, id, self._admin_place())
         logger.debug(event)
         if event:
             # Caution! crunches ahead
-            event = from_collection(req.json, event,
-                                    excludes=['fields'])  # skip jsonencoded
+            # Counters are maintained by registrations only
+            event = from_collection(
+                req.json, event,
+                excludes=['fields', 'seats_taken', 'change_seq'])
             # since 'hidden' is not implemented in the model, skip it for now
             event.fields = req.json['fields']  # and set them manually
             orm_session.merge(event)
@@ -303,6 +588,10 @@ class Events(APIBase):
         id = int(id)
         req = cherrypy.request
         orm_session = req.orm_session
+        place = self._admin_place()
+        if place is not None and not api.find_event_by_id(
+                orm_session, id, place):
+            raise HTTPError(404)
         if not api.delete_event_by_id(orm_session, id):
             raise HTTPError(404)
         else:
@@ -325,16 +614,21 @@ class Events(APIBase):
             to_email = '{full_name} <{email}>'
             email_template = 'email/card.html'
 
-            event = api.find_event_by_id(orm_session, id)
+            event = api.find_event_by_id(orm_session, id,
+                                         self._admin_place())
+            if event is None:
+                raise HTTPError(404)
 
             for user_reg in api.get_event_registrations_by_ids(
-                    orm_session, [int(_) for _ in regs]):
+                    orm_session, [int(_) for _ in regs], event.id):
 
                 u = user_reg.user
-                user_reg.accepted = True
-
-                orm_session.merge(user_reg)
+                newly_accepted = api.set_registration_flag(
+                    orm_session, user_reg, 'accepted')
                 orm_session.commit()
+                if newly_accepted:
+                    notify('event-delta', user_reg.event_id, 'approved',
+                           {'registrations': [user_reg.id]})
 
                 if send_email:  # Do send email here
                     gmail_send_html(
@@ -368,16 +662,20 @@ class Events(APIBase):
             to_email = '{full_name} <{email}>'
             email_template = 'email/confirmation.html'
 
-            event = api.find_event_by_id(orm_session, id)
+            event = api.find_event_by_id(orm_session, id,
+                                         self._admin_place())
+            if event is None:
+                raise HTTPError(404)
 
             for user_reg in api.get_event_registrations_by_ids(
-                    orm_session, [int(_) for _ in regs]):
+                    orm_session, [int(_) for _ in regs], event.id):
                 logger.debug(user_reg)
                 u = user_reg.user
 
                 secure_id = aes_encrypt(str(user_reg.id))
 
                 confirm_data = {
+                    'url': url_for_class(
                         handler='controller.Root.confirm',
                         url_args=[secure_id],
                     ),
@@ -416,8 +714,11 @@ class Events(APIBase):
             to_email = '{full_name} <{email}>'
             email_template = 'email/card.html'
 
+            event = api.find_event_by_id(orm_session, id,
+                                         self._admin_place())
             user_reg = api.get_event_registration(orm_session, user_id, id)
-            event = user_reg.event
+            if event is None or user_reg is None:
+                raise HTTPError(404)
             user = user_reg.user
 
             gmail_send_html(
@@ -446,7 +747,7 @@ class Events(APIBase):
         orm_session = req.orm_session
 
         # Retrieve event object
-        event = api.find_event_by_id(orm_session, id)
+        event = api.find_event_by_id(orm_session, id, self._admin_place())
         if event is None:
             raise HTTPError(404)
 
@@ -482,7 +783,7 @@ class Events(APIBase):
         orm_session = req.orm_session
 
         # Retrieve event object
-        event = api.find_event_by_id(orm_session, id)
+        event = api.find_event_by_id(orm_session, id, self._admin_place())
         if event is None:
             raise HTTPError(404)
 
@@ -508,40 +809,76 @@ class Events(APIBase):
 
         return {'url': gd_resp['alternateLink']}
 
-    @cherrypy.tools.json_out()
-    @cherrypy.tools.authorize()
-    def generate_invites(self, id):
+    def _issue_invites(self, id):
+        """Generates and commits invites to the event
+
+        Returns:
+            (api.InviteCodes): generated codes
+        """
         req = cherrypy.request
         orm_session = req.orm_session
         data = req.json
 
         try:
             number = data['number']
-            assert number >= 0
+            assert isinstance(number, int)
+            assert 0 <= number <= MAX_GENERATED_INVITES
         except (TypeError, KeyError, AssertionError) as e:
             # Type- or KeyError if data is None or has no 'number'
-            # AssertionError if number of invites is negative
-            logger.exception()
+            # AssertionError if number of invites is not a sane integer
+            logger.exception('Malformed invites generation request')
             raise HTTPError(400, 'Malformed request body') from e
 
-        event = api.find_event_by_id(orm_session, id)
+        event = api.find_event_by_id(orm_session, id, self._admin_place())
         if event is None:
             raise HTTPError(404)
 
-        for _ in range(number):
-            code = uuid4().hex
-            invite = Invite(code=code, event=event)
-            orm_session.add(invite)
+        invites_version = get_version(api.INVITE_CODES_VERSION)
+        codes = api.InviteCodes(number)
         try:
+            api.insert_invites(orm_session, event.id, codes)
             orm_session.commit()
         except Exception as e:
             # If here, then smth bad happened during
             # saving invites to db. We need to rollback.
             orm_session.rollback()
-            logger.exception()
+            logger.exception('Cannot save generated invites')
             raise HTTPError(500, 'Cannot save generated invites') from e
+        api.add_invite_codes(event.id, codes, invites_version)
+        return codes
+
+    @cherrypy.tools.json_out()
+    @cherrypy.tools.authorize()
+    def generate_invites(self, id):
+        self._issue_invites(id)
         return {'ok': True}
 
+    @cherrypy.tools.authorize()
+    def generate_invites_csv(self, id):
+        """Generates invites and streams their codes back as CSV
+
+        Codes are committed before the first byte is sent, so a broken
+        download never leaves the client without codes it has to know.
+        """
+        codes = self._issue_invites(id)
+
+        cherrypy.response.headers['Content-Type'] = 'text/csv; charset=utf-8'
+        cherrypy.response.headers['Content-Disposition'] = (
+            'attachment; filename={}-invites.csv'.format(id)
+        )
+        cherrypy.response.stream = True
+
+        def gen_csv():
+            yield b'code\r\n'
+            codes_iter = iter(codes)
+            while True:
+                chunk = list(islice(codes_iter, api.INVITE_CHUNK_SIZE))
+                if not chunk:
+                    break
+                yield ''.join(c + '\r\n' for c in chunk).encode('ascii')
+
+        return gen_csv()
+
     @cherrypy.tools.json_out()
     @cherrypy.tools.authorize()
     def record_visit(self, id):
@@ -550,23 +887,329 @@ class Events(APIBase):
         orm_session = req.orm_session
         reg_id = int(id)
         reg_data = api.get_event_registration_by_id(orm_session, reg_id)
-        if not reg_data:
+        # Registrations of events out of admin's place don't exist for them
+        if not reg_data or api.find_event_by_id(
+                orm_session, reg_data.event_id, self._admin_place()) is None:
             raise HTTPError(400,
                             'There is no registration record'
                             'for id={id}'.format(id=reg_id))
-        reg_data.visited = True
-        orm_session.merge(reg_data)
+        # Written after the flag, which locks the event first
+        newly_visited = api.set_registration_flag(
+            orm_session, reg_data, 'visited')
+        if reg_data.visited_at is None:
+            reg_data.visited_at = datetime.utcnow()
         orm_session.commit()
+        if newly_visited:
+            notify('event-delta', reg_data.event_id, 'checked_in',
+                   {'registrations': [reg_data.id]})
         return to_collection(reg_data, sort_keys=True)
 
+    @cherrypy.tools.json_out()
+    @cherrypy.tools.authorize()
+    def record_visits(self, id):
+        '''POST /api/events/:id/check-in/batch
+
+        Applies scans queued by offline devices. Request body:
+            {"scans": [{"registration": 42,
+                        "scanned_at": "2016-10-08T09:15:00Z"}, ...]}
+        Each scan gets a status in the same order: "checked_in",
+        "already_checked_in", "not_found" or "invalid".
+        '''
+        req = cherrypy.request
+        orm_session = req.orm_session
+
+        scans = (req.json or {}).get('scans')
+        if not isinstance(scans, list) or len(scans) > MAX_CHECK_IN_BATCH:
+            raise HTTPError(400, 'Expected a list of at most {} scans'.format(
+                MAX_CHECK_IN_BATCH))
+
+        event = api.find_event_by_id(orm_session, int(id),
+                                     self._admin_place())
+        if event is None:
+            raise HTTPError(404)
+
+        now = datetime.utcnow()
+        reg_ids = []
+        earliest = {}
+        for scan in scans:
+            try:
+                reg_id = int(scan['registration'])
+                # Device clocks might run ahead
+                scanned_at = min(_parse_scan_time(scan.get('scanned_at')),
+                                 now)
+            except (TypeError, KeyError, ValueError):
+                reg_id = None
+            else:
+                if reg_id not in earliest or scanned_at < earliest[reg_id]:
+                    earliest[reg_id] = scanned_at
+            reg_ids.append(reg_id)
+
+        checked_in = api.check_in_registrations(orm_session, event.id,
+                                                earliest)
+        api.update_event_stats(orm_session, event.id,
+                               visited=sum(checked_in.values()))
+        orm_session.commit()
+        newly_visited = sorted(i for i, new in checked_in.items() if new)
+        if newly_visited:
+            notify('event-delta', event.id, 'checked_in',
+                   {'registrations': newly_visited})
+
+        results = []
+        for scan, reg_id in zip(scans, reg_ids):
+            if reg_id is None:
+                status = 'invalid'
+            elif reg_id not in checked_in:
+                status = 'not_found'
+            elif checked_in[reg_id]:
+                status = 'checked_in'
+                # Duplicates in the same batch are reported once
+                checked_in[reg_id] = False
+            else:
+                status = 'already_checked_in'
+            results.append({
+                'registration': scan.get('registration')
+                if isinstance(scan, dict) else None,
+                'status': status,
+            })
+        return {'results': results}
+
+    @cherrypy.tools.json_out()
+    @cherrypy.tools.authorize()
+    def registrations(self, id, since=None, limit=None, **kwargs):
+        '''GET /api/events/:id/registrations[?since=<cursor>]
+
+        Returns registrations changed after the cursor, oldest change first,
+        and ids of deleted ones:
+            {"items": [...], "deleted": [7], "cursor": "118,42"}
+        Pass the cursor back to get further changes. It stays the same when
+        there are none, and fewer changes than limit mean there are no more.
+        '''
+        orm_session = cherrypy.request.orm_session
+        try:
+            event_id = int(id)
+            since_key = None if since is None else _parse_change_cursor(since)
+            limit = DEFAULT_PAGE_SIZE if limit is None else int(limit)
+            assert 0 < limit <= MAX_PAGE_SIZE
+        except (ValueError, AssertionError):
+            raise HTTPError(400, 'Invalid query params')
+
+        if api.find_event_by_id(
+                orm_session, event_id, self._admin_place()) is None:
+            raise HTTPError(404)
+
+        changes = api.get_registrations_changed_since(
+            orm_session, event_id, since_key, limit)
+        items, deleted = [], []
+        for _, reg_id, reg in changes:
+            if reg is None:
+                deleted.append(reg_id)
+                continue
+            item = to_collection(reg, sort_keys=True)
+            item['cardUrl'] = aes_encrypt(str(reg.id))
+            item['participant'] = to_collection(
+                reg.user, excludes=('password', 'salt'))
+            items.append(item)
+
+        cursor = since
+        if changes:
+            cursor = '{},{}'.format(*changes[-1][:2])
+        return {'items': items, 'deleted': deleted, 'cursor': cursor}
+
+    @cherrypy.tools.authorize()
+    def cancel_registration(self, id, reg_id, **kwargs):
+        '''DELETE /api/events/:id/registrations/:reg_id
+
+        Frees the seat taken by the registration.
+        '''
+        orm_session = cherrypy.request.orm_session
+        event_id, reg_id = int(id), int(reg_id)
+        if api.find_event_by_id(
+                orm_session, event_id, self._admin_place()) is None:
+            raise HTTPError(404)
+        registration = api.get_event_registration_by_id(orm_session, reg_id)
+        if registration is None or registration.event_id != event_id:
+            raise HTTPError(404)
+
+        if not api.delete_registration(orm_session, registration):
+            # Deleted by a concurrent request
+            raise HTTPError(404)
+        orm_session.commit()
+        notify('event-delta', event_id, 'cancelled',
+               {'registrations': [reg_id]})
+
+    @cherrypy.tools.authorize()
+    def stream(self, id, **kwargs):
+        '''GET /api/events/:id/stream
+
+        Server-Sent Events of registration changes: "registered" with
+        {"participant": id}, "approved", "confirmed", "checked_in" and
+        "cancelled" with {"registrations": [ids]}. Events missed while
+        disconnected are not replayed, so clients resync with the
+        registrations endpoint.
+        '''
+        orm_session = cherrypy.request.orm_session
+        event_id = int(id)
+        if api.find_event_by_id(
+                orm_session, event_id, self._admin_place()) is None:
+            raise HTTPError(404)
+        # Streams are long, no need to hold DB connection meanwhile
+        orm_session.close()
+
+        try:
+            subscription = pub('event-stream-subscribe', event_id)
+        except IndexError:
+            # Nobody subscribed to the channel, i.e. plugin is off
+            raise HTTPError(503, 'Streaming is disabled')
+        if subscription is None:
+            raise HTTPError(503, 'Too many streams, try again later')
+
+        # Holding the session lock for the stream lifetime would block other
+        # requests of the admin, and saving the session at the end of it
+        # could revert their changes, e.g. a logout
+        session = cherrypy.session
+        session.loaded = False
+        if session.locked:
+            session.release_lock()
+
+        resp = cherrypy.response
+        resp.headers['Content-Type'] = 'text/event-stream'
+        resp.headers['Cache-Control'] = 'no-cache'
+        # Stops nginx from buffering the stream
+        resp.headers['X-Accel-Buffering'] = 'no'
+        resp.stream = True
+
+        def gen_events():
+            deadline = time.monotonic() + STREAM_LIFETIME
+            try:
+                yield 'retry: {}\n\n'.format(STREAM_RETRY).encode('ascii')
+                while not subscription.closed and \
+                        time.monotonic() < deadline:
+                    delta = subscription.get(timeout=STREAM_HEARTBEAT)
+                    if delta is None:
+                        # Also fails fast on clients gone away
+                        yield b': heartbeat\n\n'
+                        continue
+                    kind, data = delta
+                    yield 'event: {}\ndata: {}\n\n'.format(
+                        kind, json.dumps(data),
+                    ).encode('utf-8')
+            finally:
+                subscription.close()
+
+        return gen_events()
+
+    @cherrypy.tools.json_out()
+    @cherrypy.tools.authorize()
+    def stats(self, id, **kwargs):
+        '''GET /api/events/:id/stats
+
+        Returns numbers of registered, accepted, confirmed and visited
+        participants of the event.
+        '''
+        orm_session = cherrypy.request.orm_session
+        event_id = int(id)
+        if api.find_event_by_id(
+                orm_session, event_id, self._admin_place()) is None:
+            raise HTTPError(404)
+        return api.get_event_stats(orm_session, [event_id])[event_id]
+
+    @cherrypy.tools.json_out()
+    @cherrypy.tools.authorize()
+    def recount_stats(self, id, **kwargs):
+        '''POST /api/events/:id/stats/recount
+
+        Recounts stored counters of the event from its registrations,
+        fixing any drift, and returns them like GET /api/events/:id/stats.
+        '''
+        orm_session = cherrypy.request.orm_session
+        event_id = int(id)
+        if api.find_event_by_id(
+                orm_session, event_id, self._admin_place()) is None:
+            raise HTTPError(404)
+        counts = api.recount_event_stats(orm_session, event_id)
+        orm_session.commit()
+        return counts
 
-class Places(APIBase):
     @cherrypy.tools.json_out()
+    @cherrypy.tools.authorize()
+    def aggregates(self, id, status='all', **kwargs):
+        '''GET /api/events/:id/aggregates[?status=all|approved|waiting]
+
+        Returns numbers of participants by T-shirt size, experience, english
+        level, gender and hometown.
+        '''
+        orm_session = cherrypy.request.orm_session
+        event_id = int(id)
+        if status not in api.REGISTRATION_STATUSES:
+            raise HTTPError(400, 'Invalid status')
+        if api.find_event_by_id(
+                orm_session, event_id, self._admin_place()) is None:
+            raise HTTPError(404)
+        return api.get_event_aggregates(orm_session, event_id, status)
+
+    @cherrypy.tools.authorize()
+    def roster(self, id, q=None, **kwargs):
+        '''GET /api/events/:id/roster[?q=prefix]
+
+        Returns accepted registrations for check-in or only ones, matching
+        the query by registration id, name or email prefix.
+        '''
+        orm_session = cherrypy.request.orm_session
+        event_id = int(id)
+        if api.find_event_by_id(
+                orm_session, event_id, self._admin_place()) is None:
+            raise HTTPError(404)
+
+        roster = api.get_event_roster(orm_session, event_id)
+        resp = cherrypy.response
+        resp.headers['Content-Type'] = 'application/json'
+        if q is not None:
+            return json.dumps([
+                entry._asdict()
+                for entry in roster.search(q, limit=MAX_ROSTER_MATCHES)
+            ], sort_keys=True).encode('utf-8')
+
+        resp.headers['ETag'] = roster.etag
+        # Responds with 304 if client already has the current snapshot
+        cptools.validate_etags()
+        return roster.json
+
+
+class Places(APIBase):
     def list_all(self, **kwargs):
-        places = api.get_all_gdg_places(cherrypy.request.orm_session)
-        if places:
-            return [to_collection(p, sort_keys=True) for p in places]
-        raise HTTPError(404)
+        registry = api.get_place_registry(cherrypy.request.orm_session)
+        if not registry:
+            raise HTTPError(404)
+
+        resp = cherrypy.response
+        resp.headers['Content-Type'] = 'application/json'
+        resp.headers['ETag'] = registry.etag
+        # Responds with 304 if client already has the current snapshot
+        cptools.validate_etags()
+        return registry.json
+
+    @cherrypy.tools.json_out()
+    def nearest(self, lat=None, lng=None, k=1, **kwargs):
+        try:
+            lat, lng, k = float(lat), float(lng), int(k)
+        except (TypeError, ValueError):
+            raise HTTPError(400, 'lat, lng and k must be numbers')
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise HTTPError(400, 'Coordinates are out of range')
+        if not 1 <= k <= MAX_NEAREST_PLACES:
+            raise HTTPError(400, 'k must be between 1 and {}'.format(
+                MAX_NEAREST_PLACES))
+
+        registry = api.get_place_registry(cherrypy.request.orm_session)
+        return [{
+            'id': place.id,
+            'city': place.city,
+            'name': place.name,
+            'url': place.url,
+            'lat': place.lat,
+            'lng': place.lng,
+            'distance': round(distance, 3),
+        } for distance, place in registry.nearest(lat, lng, k)]
 
 
 rest_api = cherrypy.dispatch.RoutesDispatcher()
@@ -598,6 +1241,9 @@ rest_api.connect('api_edit_event', '/events/{id}', Events, action='update',
 rest_api.connect('generate_invites', '/events/{id:\d+}/invites', Events,
                  action='generate_invites',
                  conditions={'method': ['POST']})
+rest_api.connect('generate_invites_csv', r'/events/{id:\d+}/invites.csv',
+                 Events, action='generate_invites_csv',
+                 conditions={'method': ['POST']})
 rest_api.connect('generate_report', '/events/{id:\d+}/report', Events,
                  action='generate_report',
                  conditions={'method': ['POST']})
@@ -621,12 +1267,38 @@ rest_api.connect('export_event_participants',
 
 rest_api.connect('list_places', '/places', Places, action='list_all',
                  conditions={'method': ['GET']})
+rest_api.connect('nearest_places', '/places/nearest', Places,
+                 action='nearest', conditions={'method': ['GET']})
 
 rest_api.connect('api_info', '/info', Admin, action='info',
                  conditions={'method': ['GET']})
+rest_api.connect('api_metrics', '/metrics', Admin, action='metrics',
+                 conditions={'method': ['GET']})
 rest_api.connect('sign-in', '/sign-in', Admin, action='sign_in',
                  conditions={'method': ['POST']})
 rest_api.connect('check-in',
                  r'/events/{id:\d+}/check-in', Events,
                  action='record_visit',
                  conditions={'method': ['POST']})
+rest_api.connect('event_roster', r'/events/{id:\d+}/roster', Events,
+                 action='roster', conditions={'method': ['GET']})
+rest_api.connect('event_registrations', r'/events/{id:\d+}/registrations',
+                 Events, action='registrations',
+                 conditions={'method': ['GET']})
+rest_api.connect('event_registration',
+                 r'/events/{id:\d+}/registrations/{reg_id:\d+}', Events,
+                 action='cancel_registration',
+                 conditions={'method': ['DELETE']})
+rest_api.connect('event_stream', r'/events/{id:\d+}/stream', Events,
+                 action='stream', conditions={'method': ['GET']})
+rest_api.connect('event_stats', r'/events/{id:\d+}/stats', Events,
+                 action='stats', conditions={'method': ['GET']})
+rest_api.connect('event_stats_recount', r'/events/{id:\d+}/stats/recount',
+                 Events, action='recount_stats',
+                 conditions={'method': ['POST']})
+rest_api.connect('event_aggregates', r'/events/{id:\d+}/aggregates', Events,
+                 action='aggregates', conditions={'method': ['GET']})
+rest_api.connect('batch-check-in',
+                 r'/events/{id:\d+}/check-in/batch', Events,
+                 action='record_visits',
+                 conditions={'method': ['POST']})
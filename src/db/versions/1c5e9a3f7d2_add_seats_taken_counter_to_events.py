@@ -0,0 +1,33 @@
+"""Add 'seats_taken' registrations counter to the Event model
+
+Revision ID: 1c5e9a3f7d2
+Revises: 23806f003e6
+Create Date: 2026-10-19 12:04:51.112837
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1c5e9a3f7d2'
+down_revision = '23806f003e6'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import GDGUkraine.model
+from sqlalchemy.dialects import mysql
+
+
+def upgrade():
+    op.add_column('gdg_events', sa.Column('seats_taken', mysql.INTEGER(),
+                                          nullable=False, server_default='0'))
+    # Backfill counters with already existing registrations
+    op.execute(
+        'UPDATE gdg_events SET seats_taken = ('
+        'SELECT COUNT(*) FROM gdg_events_participation '
+        'WHERE gdg_events_participation.event_id = gdg_events.id)'
+    )
+
+
+def downgrade():
+    op.drop_column('gdg_events', 'seats_taken')
@@ -0,0 +1,45 @@
+"""Add registration counters of events
+
+Revision ID: 2e4a7c1d9b3
+Revises: 3b8d6f1e2a9
+Create Date: 2026-10-19 20:07:33.518264
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2e4a7c1d9b3'
+down_revision = '3b8d6f1e2a9'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import GDGUkraine.model
+from sqlalchemy.dialects import mysql
+
+
+def upgrade():
+    op.create_table('gdg_event_stats',
+    sa.Column('event_id', mysql.INTEGER(), autoincrement=False, nullable=False),
+    sa.Column('registered', mysql.INTEGER(), server_default='0', nullable=False),
+    sa.Column('accepted', mysql.INTEGER(), server_default='0', nullable=False),
+    sa.Column('confirmed', mysql.INTEGER(), server_default='0', nullable=False),
+    sa.Column('visited', mysql.INTEGER(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['event_id'], ['gdg_events.id'], ),
+    sa.PrimaryKeyConstraint('event_id')
+    )
+    op.execute(
+        'INSERT INTO gdg_event_stats '
+        '(event_id, registered, accepted, confirmed, visited) '
+        'SELECT e.id, COUNT(p.id), '
+        'COALESCE(SUM(p.accepted IS TRUE), 0), '
+        'COALESCE(SUM(p.confirmed IS TRUE), 0), '
+        'COALESCE(SUM(p.visited IS TRUE), 0) '
+        'FROM gdg_events e '
+        'LEFT JOIN gdg_events_participation p ON p.event_id = e.id '
+        'GROUP BY e.id'
+    )
+
+
+def downgrade():
+    op.drop_table('gdg_event_stats')
@@ -0,0 +1,42 @@
+"""Add closure table of places hierarchy
+
+Revision ID: 3b8d6f1e2a9
+Revises: 5a7e2c9b1f4
+Create Date: 2026-10-19 18:42:51.203117
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3b8d6f1e2a9'
+down_revision = '5a7e2c9b1f4'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import GDGUkraine.model
+from GDGUkraine.lib.utils.hierarchy import closure_rows
+from sqlalchemy.dialects import mysql
+
+
+def upgrade():
+    closure = op.create_table('gdg_place_closure',
+    sa.Column('ancestor_id', mysql.INTEGER(), autoincrement=False, nullable=False),
+    sa.Column('descendant_id', mysql.INTEGER(), autoincrement=False, nullable=False),
+    sa.Column('depth', mysql.INTEGER(), nullable=False),
+    sa.ForeignKeyConstraint(['ancestor_id'], ['gdg_places.id'], ),
+    sa.ForeignKeyConstraint(['descendant_id'], ['gdg_places.id'], ),
+    sa.PrimaryKeyConstraint('ancestor_id', 'descendant_id')
+    )
+    op.create_index(op.f('ix_gdg_place_closure_descendant_id'), 'gdg_place_closure', ['descendant_id'], unique=False)
+
+    places = op.get_bind().execute(
+        sa.text('SELECT id, master_id FROM gdg_places')).fetchall()
+    rows = closure_rows((id_, master_id) for id_, master_id in places)
+    if rows:
+        op.bulk_insert(closure, rows)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_gdg_place_closure_descendant_id'), table_name='gdg_place_closure')
+    op.drop_table('gdg_place_closure')
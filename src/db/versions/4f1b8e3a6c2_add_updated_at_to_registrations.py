@@ -0,0 +1,34 @@
+"""Add 'updated_at' last write time to the EventParticipant model
+
+Revision ID: 4f1b8e3a6c2
+Revises: 2e4a7c1d9b3
+Create Date: 2026-10-19 21:34:12.870415
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4f1b8e3a6c2'
+down_revision = '2e4a7c1d9b3'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import GDGUkraine.model
+from sqlalchemy.dialects import mysql
+
+
+def upgrade():
+    op.add_column('gdg_events_participation',
+                  sa.Column('updated_at', mysql.DATETIME(fsp=6), nullable=True))
+    op.execute('UPDATE gdg_events_participation '
+               'SET updated_at = UTC_TIMESTAMP(6)')
+    op.create_index('ix_gdg_events_participation_event_id_updated_at',
+                    'gdg_events_participation', ['event_id', 'updated_at'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_gdg_events_participation_event_id_updated_at',
+                  table_name='gdg_events_participation')
+    op.drop_column('gdg_events_participation', 'updated_at')
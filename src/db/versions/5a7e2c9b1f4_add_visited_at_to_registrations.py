@@ -0,0 +1,27 @@
+"""Add 'visited_at' check-in time to the EventParticipant model
+
+Revision ID: 5a7e2c9b1f4
+Revises: 1c5e9a3f7d2
+Create Date: 2026-10-19 15:21:07.640193
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5a7e2c9b1f4'
+down_revision = '1c5e9a3f7d2'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import GDGUkraine.model
+from sqlalchemy.dialects import mysql
+
+
+def upgrade():
+    op.add_column('gdg_events_participation',
+                  sa.Column('visited_at', mysql.DATETIME(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('gdg_events_participation', 'visited_at')
@@ -0,0 +1,50 @@
+"""Number registration changes per event and keep tombstones of deleted ones
+
+Revision ID: 6d3a9f2c8e1
+Revises: 4f1b8e3a6c2
+Create Date: 2026-10-19 23:12:48.204517
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '6d3a9f2c8e1'
+down_revision = '4f1b8e3a6c2'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+import GDGUkraine.model
+from sqlalchemy.dialects import mysql
+
+
+def upgrade():
+    op.add_column('gdg_events',
+                  sa.Column('change_seq', mysql.INTEGER(), server_default='0',
+                            nullable=False))
+    op.add_column('gdg_events_participation',
+                  sa.Column('change_seq', mysql.INTEGER(), server_default='0',
+                            nullable=False))
+    op.create_index('ix_gdg_events_participation_event_id_change_seq',
+                    'gdg_events_participation', ['event_id', 'change_seq'],
+                    unique=False)
+    op.drop_index('ix_gdg_events_participation_event_id_updated_at',
+                  table_name='gdg_events_participation')
+    op.create_table('gdg_events_participation_tombstones',
+    sa.Column('event_id', mysql.INTEGER(), autoincrement=False, nullable=False),
+    sa.Column('change_seq', mysql.INTEGER(), autoincrement=False, nullable=False),
+    sa.Column('registration_id', mysql.INTEGER(), autoincrement=False, nullable=False),
+    sa.ForeignKeyConstraint(['event_id'], ['gdg_events.id'], ),
+    sa.PrimaryKeyConstraint('event_id', 'change_seq', 'registration_id')
+    )
+
+
+def downgrade():
+    op.drop_table('gdg_events_participation_tombstones')
+    op.create_index('ix_gdg_events_participation_event_id_updated_at',
+                    'gdg_events_participation', ['event_id', 'updated_at'],
+                    unique=False)
+    op.drop_index('ix_gdg_events_participation_event_id_change_seq',
+                  table_name='gdg_events_participation')
+    op.drop_column('gdg_events_participation', 'change_seq')
+    op.drop_column('gdg_events', 'change_seq')
@@ -3,8 +3,26 @@ try:
 except ImportError:
     import unittest
 
+import os
+import tempfile
+import threading
+
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import sessionmaker
+
 from GDGUkraine import api
-from GDGUkraine.model import Admin, Place, Event, User, EventParticipant
+from GDGUkraine.model import (
+    Admin, Place, PlaceClosure, Event, EventStats, User, EventParticipant,
+    Invite,
+)
+from GDGUkraine.model import metadata
+
+from GDGUkraine.lib.utils.hierarchy import closure_rows
+from GDGUkraine.lib.utils.versions import get_version
 
 from tests.helper import DBTestFixture, orm_session, Session
 
@@ -91,6 +109,204 @@ class APITest(DBTestFixture, unittest.TestCase):
         self.assertEquals(con.gplus_event_id, '11111111111111111')
         self.assertEquals(con.host_gdg.city, 'Gotham')
 
+    @orm_session
+    def test_list_events(self):
+        session = Session()
+        host = api.get_place_by_id(session, 1)
+        session.add_all([
+            Event(title='Day {}'.format(d), url='https://gdg.org.ua',
+                  desc='', host_gdg=host, date=date(2016, 10, d),
+                  testing=d == 9)
+            for d in (9, 8, 8)
+        ])
+        session.commit()
+
+        undated, first = api.list_events(session, limit=2)
+        self.assertIsNone(undated.date)
+        self.assertEqual(first.date, date(2016, 10, 8))
+        rest = api.list_events(session, after=(first.date, first.id))
+        self.assertEqual([e.date.day for e in rest], [8, 9])
+        self.assertGreater(rest[0].id, first.id)
+
+        session.expunge_all()
+        event, = api.list_events(session, fields=['title'], testing=True,
+                                 since=date(2016, 10, 9))
+        self.assertEqual(event.title, 'Day 9')
+        self.assertNotIn('desc', event.__dict__)
+
+    @orm_session
+    def test_admin_place_scoping(self):
+        session = Session()
+        gotham = api.get_place_by_id(session, 1)
+        arkham = Place(city='Arkham', name='Asylum', master=gotham)
+        metropolis = Place(city='Metropolis', name='Daily Planet')
+        session.add_all([arkham, metropolis])
+        session.flush()
+        carol = User(nickname='carol', name='Carol', surname='Ferris',
+                     email='carol@example.com', gender='female',
+                     local_gdg_id=arkham.id)
+        session.add_all([
+            carol,
+            Event(title='Planet Con', url='https://gdg.org.ua', desc='',
+                  host_gdg=metropolis),
+        ])
+        session.commit()
+
+        self.assertIsNone(api.get_admin_place(
+            {'filter_place': 1, 'godmode': True}))
+        self.assertEqual(api.get_admin_place(
+            {'filter_place': 1, 'godmode': False}), 1)
+
+        self.assertEqual(
+            [e.title for e in api.list_events(session, place=gotham.id)],
+            ['GDG Con'])
+        self.assertIsNone(api.find_event_by_id(session, 2, gotham.id))
+        self.assertEqual(api.list_users(session, place=metropolis.id), [])
+        self.assertEqual(
+            [u.nickname for u in api.list_users(session, place=arkham.id)],
+            ['carol'])
+        self.assertEqual(
+            {u.nickname for u in api.list_users(session, place=gotham.id)},
+            {'alice', 'bob', 'carol'})
+
+    @orm_session
+    def test_place_closure(self):
+        session = Session()
+        gotham = api.get_place_by_id(session, 1)
+        arkham = Place(city='Arkham', name='Asylum', master=gotham)
+        cell = Place(city='Arkham', name='Cell Block', master=arkham)
+        metropolis = Place(city='Metropolis', name='Daily Planet')
+        session.add_all([arkham, cell, metropolis])
+        session.commit()
+
+        def paths():
+            return {(r.ancestor_id, r.descendant_id, r.depth)
+                    for r in session.query(PlaceClosure)}
+
+        g, a, c, m = gotham.id, arkham.id, cell.id, metropolis.id
+        self.assertEqual(paths(), {
+            (g, g, 0), (a, a, 0), (c, c, 0), (m, m, 0),
+            (g, a, 1), (a, c, 1), (g, c, 2),
+        })
+
+        arkham.master = metropolis
+        session.commit()
+        self.assertEqual(paths(), {
+            (g, g, 0), (a, a, 0), (c, c, 0), (m, m, 0),
+            (m, a, 1), (a, c, 1), (m, c, 2),
+        })
+
+        session.delete(cell)
+        session.commit()
+        self.assertEqual(paths(), {
+            (g, g, 0), (a, a, 0), (m, m, 0), (m, a, 1),
+        })
+        self.assertEqual(paths(), {
+            (r['ancestor_id'], r['descendant_id'], r['depth'])
+            for r in closure_rows(session.query(Place.id, Place.master_id))
+        })
+
+        metropolis.master = arkham
+        with self.assertRaises(ValueError):
+            session.commit()
+        session.rollback()
+
+    @orm_session
+    def test_event_stats(self):
+        session = Session()
+        counts = {'registered': 2, 'accepted': 0, 'confirmed': 0,
+                  'visited': 0}
+        # Not stored yet, so counted on the fly
+        self.assertEqual(api.get_event_stats(session, [1]), {1: counts})
+        self.assertEqual(session.query(EventStats).count(), 0)
+
+        alice_reg = api.get_event_registration(session, 1, 1)
+        alice_reg.accepted = True
+        api.update_event_stats(session, 1, accepted=1)
+        session.commit()
+        counts['accepted'] = 1
+        self.assertEqual(api.get_event_stats(session, [1]), {1: counts})
+
+        api.update_event_stats(session, 1, visited=1, confirmed=0)
+        session.commit()
+        counts['visited'] = 1
+        self.assertEqual(api.get_event_stats(session, [1, 42]), {
+            1: counts,
+            42: {'registered': 0, 'accepted': 0, 'confirmed': 0,
+                 'visited': 0},
+        })
+
+        counts['visited'] = 0
+        self.assertEqual(api.recount_event_stats(session, 1), counts)
+
+    @orm_session
+    def test_set_registration_flag(self):
+        session = Session()
+        api.recount_event_stats(session, 1)
+        alice_reg = api.get_event_registration(session, 1, 1)
+        self.assertFalse(alice_reg.accepted)
+        self.assertTrue(api.set_registration_flag(session, alice_reg,
+                                                  'accepted'))
+        self.assertFalse(api.set_registration_flag(session, alice_reg,
+                                                   'accepted'))
+        session.commit()
+
+        self.assertTrue(alice_reg.accepted)
+        self.assertEqual(api.get_event_stats(session, [1])[1]['accepted'], 1)
+
+    @orm_session
+    def test_get_event_aggregates(self):
+        session = Session()
+        aggregates = api.get_event_aggregates(session, 1)
+        self.assertEqual(aggregates['gender'], [
+            {'value': 'female', 'count': 1},
+            {'value': 'male', 'count': 1},
+        ])
+        self.assertEqual(aggregates['hometown'],
+                         [{'value': None, 'count': 2}])
+        self.assertIs(api.get_event_aggregates(session, 1), aggregates)
+
+        api.get_event_registration(session, 2, 1).accepted = True
+        session.commit()
+        self.assertEqual(
+            api.get_event_aggregates(session, 1, 'approved')['gender'],
+            [{'value': 'male', 'count': 1}])
+        self.assertEqual(
+            api.get_event_aggregates(session, 1, 'waiting')['gender'],
+            [{'value': 'female', 'count': 1}])
+
+    @orm_session
+    def test_get_registrations_changed_since(self):
+        session = Session()
+        (_, _, first), (*last_key, last) = \
+            api.get_registrations_changed_since(session, 1)
+        self.assertEqual(
+            api.get_registrations_changed_since(session, 1, last_key), [])
+
+        self.assertTrue(api.set_registration_flag(session, first, 'accepted'))
+        session.commit()
+        (*first_key, changed), = api.get_registrations_changed_since(
+            session, 1, last_key)
+        self.assertIs(changed, first)
+        self.assertGreater(first_key, last_key)
+
+        api.check_in_registrations(session, 1, {last.id: datetime.utcnow()})
+        session.commit()
+        (*last_key, changed), = api.get_registrations_changed_since(
+            session, 1, first_key)
+        self.assertIs(changed, last)
+
+        # Deletions are listed too
+        self.assertTrue(api.delete_registration(session, first))
+        session.commit()
+        self.assertEqual(
+            api.get_registrations_changed_since(session, 1, last_key),
+            [(3, first.id, None)])
+        self.assertEqual(
+            [reg_id for _, reg_id, _ in
+             api.get_registrations_changed_since(session, 1, limit=2)],
+            [last.id, first.id])
+
     @orm_session
     def test_find_event_by_wrong_id(self):
         session = Session()
@@ -106,6 +322,20 @@ class APITest(DBTestFixture, unittest.TestCase):
         self.assertEqual(usrs[0].gender, 'female')
         self.assertEqual(usrs[0].surname, 'Johns')
 
+    @orm_session
+    def test_list_users(self):
+        session = Session()
+        first, = api.list_users(session, limit=1)
+        rest = api.list_users(session, after=first.id)
+        self.assertTrue(rest)
+        self.assertTrue(all(u.id > first.id for u in rest))
+
+        session.expunge_all()
+        alice, = api.list_users(session, fields=['email'],
+                                filters={'nickname': 'alice'})
+        self.assertEqual(alice.email, 'alice@wonderland.com')
+        self.assertNotIn('surname', alice.__dict__)
+
     @orm_session
     def test_get_users_by_ids(self):
         session = Session()
@@ -115,6 +345,310 @@ class APITest(DBTestFixture, unittest.TestCase):
         self.assertEqual(alice.gender, 'female')
         self.assertEqual(alice.surname, 'Johns')
 
+    @orm_session
+    def test_get_n_upcoming_events(self):
+        session = Session()
+        host = api.get_place_by_id(session, 1)
+        today = date.today()
+        session.add_all([
+            Event(title='Past', url='', desc='', host_gdg=host,
+                  date=today - timedelta(days=1)),
+            Event(title='Later', url='', desc='', host_gdg=host,
+                  date=today + timedelta(days=10),
+                  closereg=today + timedelta(days=5)),
+            Event(title='Soon', url='', desc='', host_gdg=host,
+                  date=today + timedelta(days=1), closereg=today),
+            Event(title='Testing', url='', desc='', host_gdg=host,
+                  date=today, testing=True),
+        ])
+        session.commit()
+
+        events = api.get_n_upcoming_events(session)
+        self.assertEqual([e.title for e in events], ['Soon', 'Later'])
+        self.assertEqual(events[0].host_gdg.city, 'Gotham')
+
+        events = api.get_n_upcoming_events(session, limit=1)
+        self.assertEqual([e.title for e in events], ['Soon'])
+
+        events = api.get_n_upcoming_events(session, hide_closed=True)
+        self.assertEqual([e.title for e in events], ['Later'])
+
+    @orm_session
+    def test_upcoming_events_invalidated_on_write(self):
+        session = Session()
+        self.assertEqual(api.get_n_upcoming_events(session), [])
+
+        con = api.find_event_by_id(session, 1)
+        con.date = date.today()
+        session.commit()
+
+        events = api.get_n_upcoming_events(session)
+        self.assertEqual([e.title for e in events], ['GDG Con'])
+
+    @orm_session
+    def test_reserve_seat(self):
+        session = Session()
+        con = api.find_event_by_id(session, 1)
+        con.max_regs = 1
+        session.commit()
+
+        self.assertTrue(api.reserve_seat(session, 1))
+        self.assertFalse(api.reserve_seat(session, 1))
+        self.assertTrue(api.reserve_seat(session, 1, force=True))
+        session.commit()
+
+        session.refresh(con)
+        self.assertEqual(con.seats_taken, 2)
+        self.assertFalse(con.has_spots())
+
+    @orm_session
+    def test_get_event_registrations_by_ids(self):
+        session = Session()
+        self.assertEqual(
+            len(api.get_event_registrations_by_ids(session, [1, 2])), 2)
+        self.assertEqual(
+            len(api.get_event_registrations_by_ids(session, [1, 2], 1)), 2)
+        self.assertEqual(
+            api.get_event_registrations_by_ids(session, [1, 2], 2), [])
+
+    @orm_session
+    def test_delete_registration(self):
+        session = Session()
+        con = api.find_event_by_id(session, 1)
+        con.max_regs = 1
+        self.assertTrue(api.reserve_seat(session, 1))
+        api.recount_event_stats(session, 1)
+        session.commit()
+        session.refresh(con)
+        self.assertFalse(con.has_spots())
+
+        reg = api.get_event_registration_by_id(session, 1)
+        api.delete_registration(session, reg)
+        session.commit()
+
+        session.refresh(con)
+        self.assertEqual(con.seats_taken, 0)
+        self.assertTrue(con.has_spots())
+        # Bob's registration is left
+        self.assertEqual(api.get_event_stats(session, [1])[1]['registered'],
+                         1)
+        self.assertIsNone(api.get_event_registration_by_id(session, 1))
+
+        # Never goes below zero
+        api.release_seat(session, 1)
+        session.commit()
+        session.refresh(con)
+        self.assertEqual(con.seats_taken, 0)
+
+    @orm_session
+    def test_delete_registration_fresh_flags(self):
+        session = Session()
+        api.recount_event_stats(session, 1)
+        alice_reg = api.get_event_registration(session, 1, 1)
+        self.assertFalse(alice_reg.accepted)
+
+        # Accepted by another request after the registration was loaded
+        regs = EventParticipant.__table__
+        session.execute(regs.update().where(regs.c.id == alice_reg.id)
+                        .values(accepted=True))
+        api.update_event_stats(session, 1, accepted=1)
+
+        self.assertTrue(api.delete_registration(session, alice_reg))
+        session.commit()
+        self.assertEqual(api.get_event_stats(session, [1])[1], {
+            'registered': 1, 'accepted': 0, 'confirmed': 0, 'visited': 0,
+        })
+
+    @orm_session
+    def test_update_event_stats_first_row(self):
+        session = Session()
+        carol_id = api.upsert_user(session, {
+            'name': 'Carol', 'surname': 'Smith', 'gender': 'female',
+            'email': 'carol@example.com',
+        })
+        api.upsert_registration(session, {'event_id': 1,
+                                          'googler_id': carol_id})
+        # Counted as of before the write, then the delta is added
+        api.update_event_stats(session, 1, registered=1)
+        session.commit()
+        self.assertEqual(api.get_event_stats(session, [1])[1]['registered'],
+                         3)
+        self.assertEqual(session.query(EventStats).count(), 1)
+
+    @orm_session
+    def test_upsert_user(self):
+        session = Session()
+        carol_id = api.upsert_user(session, {
+            'name': 'Carol', 'surname': 'Smith', 'gender': 'female',
+            'email': 'carol@example.com',
+        })
+        self.assertEqual(carol_id, 3)
+
+        alice_id = api.upsert_user(session, {
+            'name': 'Alicia', 'surname': 'Johns', 'gender': 'female',
+            'email': 'alice@wonderland.com',
+        })
+        self.assertEqual(alice_id, 1)
+
+        # Nickname belongs to Bob
+        self.assertIsNone(api.upsert_user(session, {
+            'name': 'Mallory', 'surname': 'Evil', 'gender': 'male',
+            'email': 'mallory@example.com', 'nickname': 'bob',
+        }))
+        session.commit()
+
+        self.assertEqual(api.find_user_by_id(session, 1).name, 'Alicia')
+        self.assertEqual(api.find_user_by_id(session, 2).email,
+                         'bob@example.com')
+
+    @orm_session
+    def test_upsert_registration(self):
+        session = Session()
+        values = {'event_id': 1, 'googler_id': 1,
+                  'register_date': date.today(), 'fields': {'a': 1}}
+        self.assertFalse(api.upsert_registration(session, values))
+
+        carol_id = api.upsert_user(session, {
+            'name': 'Carol', 'surname': 'Smith', 'gender': 'female',
+            'email': 'carol@example.com',
+        })
+        values['googler_id'] = carol_id
+        self.assertTrue(api.upsert_registration(session, values))
+        session.commit()
+
+        regs = api.get_event_registrations(session, 1)
+        self.assertEqual(len(regs), 3)
+        self.assertEqual(regs[0].fields, {'a': 1})
+
+        session.expunge_all()
+        regs = api.get_event_registrations(session, 1, with_users=True)
+        self.assertEqual(len(regs), 3)
+        for reg in regs:
+            # Loaded by the query, not lazily afterwards
+            self.assertIn('user', reg.__dict__)
+            self.assertIn('fields', reg.__dict__)
+            self.assertIn('additional_info', reg.user.__dict__)
+
+    def test_upsert_mysql(self):
+        stmt = api.Upsert(
+            User.__table__, key=['email'], update_columns=['name'],
+        ).values(email='alice@wonderland.com', name='Alice')
+        self.assertEqual(
+            str(stmt.compile(dialect=mysql.dialect())),
+            'INSERT INTO gdg_participants (name, email) VALUES (%s, %s) '
+            'ON DUPLICATE KEY UPDATE '
+            'name = IF(email = VALUES(email), VALUES(name), name), '
+            'id = IF(email = VALUES(email), LAST_INSERT_ID(id), '
+            'id + LAST_INSERT_ID(0))',
+        )
+
+    @orm_session
+    def test_find_event_invitation(self):
+        session = Session()
+        session.add(Invite(code='a' * 32, event_id=1))
+        session.commit()
+
+        self.assertEqual(
+            api.find_event_invitation(session, 1, 'a' * 32).code, 'a' * 32)
+        self.assertIsNone(api.find_event_invitation(session, 1, 'b' * 32))
+        self.assertIsNone(api.find_event_invitation(session, 2, 'a' * 32))
+
+        # Using invites keeps filters
+        invitation = api.find_event_invitation(session, 1, 'a' * 32)
+        invitation.used = True
+        session.commit()
+        invite_filter = api.get_invite_filter(session, 1)
+        self.assertIs(api.get_invite_filter(session, 1), invite_filter)
+
+        # Codes committed by this process get into the filter right away
+        version = get_version(api.INVITE_CODES_VERSION)
+        session.add(Invite(code='c' * 32, event_id=1))
+        session.commit()
+        api.add_invite_codes(1, ['c' * 32], version)
+        self.assertIn('c' * 32, api.get_invite_filter(session, 1))
+
+    @orm_session
+    def test_find_event_invitation_stale_filter(self):
+        session = Session()
+        session.add(Invite(code='a' * 32, event_id=1))
+        session.commit()
+        self.assertNotIn('d' * 32, api.get_invite_filter(session, 1))
+
+        # Issued by another process, which didn't bump the local stamp
+        session.execute(Invite.__table__.insert(),
+                        [{'code': 'd' * 32, 'event_id': 1, 'used': False}])
+        session.commit()
+
+        with mock.patch('GDGUkraine.api.get_shared_version',
+                        return_value='shared'):
+            self.assertIsNone(api.find_event_invitation(session, 1, 'd' * 32))
+
+        # Without shared stamps the filter can't be trusted
+        self.assertEqual(
+            api.find_event_invitation(session, 1, 'd' * 32).code, 'd' * 32)
+        self.assertIn('d' * 32, api.get_invite_filter(session, 1))
+        self.assertIsNone(api.find_event_invitation(session, 2, 'd' * 32))
+
+    @orm_session
+    def test_insert_invites(self):
+        session = Session()
+        codes = api.InviteCodes(2500)
+        self.assertEqual(len(codes), 2500)
+        self.assertEqual(list(codes), list(codes))
+
+        self.assertEqual(
+            api.insert_invites(session, 1, codes, chunk_size=1000), 2500)
+        version = get_version(api.INVITE_CODES_VERSION)
+        session.commit()
+        self.assertNotEqual(get_version(api.INVITE_CODES_VERSION), version)
+
+        stored = {code for code, in session.query(Invite.code)
+                  .filter(Invite.event_id == 1)}
+        self.assertEqual(stored, set(codes))
+        self.assertEqual(len(stored), 2500)
+
+    @orm_session
+    def test_check_in_registrations(self):
+        session = Session()
+        morning = datetime(2016, 10, 8, 9, 0)
+        noon = datetime(2016, 10, 8, 12, 0)
+
+        self.assertEqual(
+            api.check_in_registrations(session, 1, {1: noon, 100: noon}),
+            {1: True})
+        session.commit()
+
+        # Earlier scans synced later win, repeated ones change nothing
+        self.assertEqual(
+            api.check_in_registrations(session, 1, {1: morning, 2: noon}),
+            {1: False, 2: True})
+        self.assertEqual(api.check_in_registrations(session, 2, {1: noon}),
+                         {})
+        session.commit()
+
+        alice, bob = api.get_event_registrations_by_ids(session, [1, 2])
+        self.assertTrue(alice.visited and bob.visited)
+        self.assertEqual(alice.visited_at, morning)
+        self.assertEqual(bob.visited_at, noon)
+
+    @orm_session
+    def test_get_event_roster(self):
+        session = Session()
+        alice = api.get_event_registration_by_id(session, 1)
+        alice.accepted = True
+        session.commit()
+
+        roster = api.get_event_roster(session, 1)
+        self.assertEqual([e.id for e in roster.entries], [1])
+        self.assertFalse(roster.entries[0].visited)
+        self.assertIs(api.get_event_roster(session, 1), roster)
+
+        api.check_in_registrations(session, 1, {1: datetime(2016, 10, 8)})
+        session.commit()
+        roster = api.get_event_roster(session, 1)
+        self.assertTrue(roster.entries[0].visited)
+        self.assertEqual([e.id for e in roster.search('alice')], [1])
+
     # def test_get_event_registrations_by_ids(session, reg_ids):
     # def test_get_event_registration_by_id(session, reg_id):
     # def test_get_all_gdg_places(session, filtered=False):
@@ -127,3 +661,59 @@ class APITest(DBTestFixture, unittest.TestCase):
     # def test_get_event_registration(session, uid, eid):
     # def test_get_event_registrations(session, event_id):
     # def test_find_invitation_by_code(session, code):
+
+
+class SeatReservationConcurrencyTest(unittest.TestCase):
+    """Hammers reserve_seat from many threads through a file-based DB"""
+
+    CLIENTS = 40
+    MAX_REGS = 10
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        self.engine = create_engine(
+            'sqlite:///{}'.format(self.db_path),
+            connect_args={'timeout': 30, 'check_same_thread': False},
+        )
+        metadata.create_all(self.engine)
+        self.Session = sessionmaker(self.engine)
+
+        session = self.Session()
+        session.add(Event(title='Hot', url='', desc='', max_regs=self.MAX_REGS,
+                          host_gdg=Place(city='Gotham')))
+        session.commit()
+        session.close()
+
+    def tearDown(self):
+        self.engine.dispose()
+        os.remove(self.db_path)
+
+    def test_no_oversubscription(self):
+        results = []
+        barrier = threading.Barrier(self.CLIENTS)
+
+        def register():
+            session = self.Session()
+            try:
+                barrier.wait()
+                taken = api.reserve_seat(session, 1)
+                session.commit()
+                results.append(taken)
+            finally:
+                session.close()
+
+        threads = [threading.Thread(target=register)
+                   for _ in range(self.CLIENTS)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(results), self.CLIENTS)
+        self.assertEqual(results.count(True), self.MAX_REGS)
+
+        session = self.Session()
+        self.assertEqual(session.query(Event).get(1).seats_taken,
+                         self.MAX_REGS)
+        session.close()
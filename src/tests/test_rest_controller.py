@@ -1,10 +1,23 @@
+import json
+
+import cherrypy
+
+from cherrypy.lib.httputil import HeaderElement
+
 from GDGUkraine.lib.testing import TestCase, mock_session, user_session_factory
+from GDGUkraine.lib.utils.vcard import aes_decrypt
 from GDGUkraine.model import Admin, Place, Event, User, EventParticipant
 from GDGUkraine.model import metadata
 
 from tests.helper import orm_session, Session
 
 
+def content_type(headers):
+    """Parses Content-Type header, which gets reformatted by encode tool"""
+    element = HeaderElement.from_str(dict(headers)['Content-Type'])
+    return element.value, element.params
+
+
 @orm_session
 def populate_db():
     session = Session()
@@ -45,6 +58,330 @@ class EventRESTAPITest(TestCase):
                                                       payload={})
         self.assertStatus(200)
 
+    def test_record_visits(self):
+        with mock_session(session=user_session_factory()):
+            status, headers, json_res = self.postJSON(
+                '/api/events/1/check-in/batch', payload={'scans': [
+                    {'registration': 1, 'scanned_at': '2016-10-08T09:15:00Z'},
+                    {'registration': 1},
+                    {'registration': 42},
+                    {'registration': 'x'},
+                ]})
+        self.assertStatus(200)
+        self.assertEqual(
+            [r['status'] for r in json_res['results']],
+            ['checked_in', 'already_checked_in', 'not_found', 'invalid'])
+
+    def test_roster(self):
+        with mock_session(session=user_session_factory()):
+            self.getJSON('/api/events/1/roster')
+            self.assertStatus(200)
+            self.assertEqual(self.json_result, [])
+            etag = self.assertHeader('ETag')
+
+            self.getPage('/api/events/1/roster',
+                         headers=[('If-None-Match', etag)])
+            self.assertStatus(304)
+
+            self.getJSON('/api/events/1/roster?q=alice')
+            self.assertStatus(200)
+            self.assertEqual(self.json_result, [])
+
+    def test_list_all_paginated(self):
+        with mock_session(session=user_session_factory()):
+            self.getJSON('/api/events?limit=1&fields=title&testing=false')
+            self.assertStatus(200)
+            self.assertEqual(self.json_result, {
+                'items': [{'id': 1, 'title': 'GDG Con'}],
+                'cursor': ',1',
+            })
+
+            self.getJSON('/api/events?limit=1&fields=stats')
+            self.assertStatus(200)
+            self.assertEqual(self.json_result['items'], [{
+                'id': 1,
+                'stats': {'registered': 1, 'accepted': 0, 'confirmed': 0,
+                          'visited': 0},
+            }])
+
+            self.getJSON('/api/events?limit=1&after=,1')
+            self.assertStatus(200)
+            self.assertEqual(self.json_result, {'items': [], 'cursor': None})
+
+            self.getJSON('/api/events?since=yesterday')
+            self.assertStatus(400)
+
+    def test_place_scoping(self):
+        regional = user_session_factory({'admin_user': {
+            'email': 'regional@gdg.org.ua', 'filter_place': 42,
+            'godmode': False,
+        }})
+        with mock_session(session=regional):
+            self.getJSON('/api/events')
+            self.assertStatus(200)
+            self.assertEqual(self.json_result, [])
+
+            self.getJSON('/api/events/1')
+            self.assertStatus(404)
+
+    def test_foreign_registrations(self):
+        session = Session()
+        gdg_host = session.query(Place).get(1)
+        other_host = Place(city='Metropolis', name='Supervillains', show='1')
+        other_conf = Event(title='Other Con', url='https://gdg.org.ua',
+                           desc='Some event', host_gdg=other_host,
+                           gplus_event_id='22222222222222222')
+        bob = User(nickname='bob', name='Bob', surname='Smith',
+                   email='bob@example.com', gender='male')
+        foreign_reg = EventParticipant(user=bob, event=other_conf)
+        session.add_all([other_host, other_conf, bob, foreign_reg])
+        session.commit()
+        foreign_reg_id, place_id = foreign_reg.id, gdg_host.id
+        session.close()
+
+        regional = user_session_factory({'admin_user': {
+            'email': 'regional@gdg.org.ua', 'filter_place': place_id,
+            'godmode': False,
+        }})
+        with mock_session(session=regional):
+            self.postJSON('/api/events/1/approve',
+                          payload={'registrations': [foreign_reg_id]})
+            self.assertStatus(200)
+            self.postJSON('/api/events/{}/check-in'.format(foreign_reg_id),
+                          payload={})
+            self.assertStatus(400)
+
+        session = Session()
+        foreign_reg = session.query(EventParticipant).get(foreign_reg_id)
+        self.assertFalse(foreign_reg.accepted)
+        self.assertFalse(foreign_reg.visited)
+        session.close()
+
+    def test_stats(self):
+        with mock_session(session=user_session_factory()):
+            self.getJSON('/api/events/1/stats')
+            self.assertStatus(200)
+            self.assertEqual(self.json_result, {
+                'registered': 1, 'accepted': 0, 'confirmed': 0,
+                'visited': 0,
+            })
+
+            self.postJSON('/api/events/1/check-in', payload={})
+            self.getJSON('/api/events/1/stats')
+            self.assertEqual(self.json_result['visited'], 1)
+
+            # Checking in twice counts once
+            self.postJSON('/api/events/1/check-in', payload={})
+            self.postJSON('/api/events/1/stats/recount', payload={})
+            self.assertStatus(200)
+            self.assertEqual(self.json_result['visited'], 1)
+
+    def test_show_columnar(self):
+        with mock_session(session=user_session_factory()):
+            self.getJSON('/api/events/1')
+            self.assertStatus(200)
+            reg, = self.json_result['registrations']
+
+            self.getJSON('/api/events/1?format=columnar')
+            self.assertStatus(200)
+            regs = self.json_result['registrations']
+            self.assertEqual(regs['count'], 1)
+            self.assertEqual(regs['columns']['id'], [reg['id']])
+            # Encrypted with random IVs, so only plaintexts match
+            self.assertEqual(
+                [aes_decrypt(url) for url in regs['columns']['cardUrl']],
+                [aes_decrypt(reg['cardUrl'])])
+            self.assertEqual(regs['columns']['participant.nickname'],
+                             ['alice'])
+            self.assertEqual(regs['columns']['participant.gender'], [0])
+            self.assertEqual(regs['dictionaries']['participant.gender'],
+                             ['female'])
+
+            self.getJSON('/api/events/1?format=csv')
+            self.assertStatus(400)
+
+    def test_cancel_registration(self):
+        with mock_session(session=user_session_factory()):
+            self.getPage('/api/events/1/registrations/42', method='DELETE')
+            self.assertStatus(404)
+
+            self.getPage('/api/events/1/registrations/1', method='DELETE')
+            self.assertStatus(200)
+            self.getJSON('/api/events/1/stats')
+            self.assertEqual(self.json_result['registered'], 0)
+
+    def test_aggregates(self):
+        with mock_session(session=user_session_factory()):
+            self.getJSON('/api/events/1/aggregates?status=approved')
+            self.assertStatus(200)
+            self.assertEqual(self.json_result['gender'], [])
+
+            self.getJSON('/api/events/1/aggregates')
+            self.assertEqual(self.json_result['gender'],
+                             [{'value': 'female', 'count': 1}])
+
+            self.getJSON('/api/events/1/aggregates?status=rejected')
+            self.assertStatus(400)
+
+    def test_registrations_since(self):
+        with mock_session(session=user_session_factory()):
+            self.getJSON('/api/events/1/registrations')
+            self.assertStatus(200)
+            reg, = self.json_result['items']
+            self.assertEqual(reg['participant']['nickname'], 'alice')
+            cursor = self.json_result['cursor']
+
+            self.getJSON('/api/events/1/registrations?since=' + cursor)
+            self.assertEqual(self.json_result,
+                             {'items': [], 'deleted': [], 'cursor': cursor})
+
+            self.postJSON('/api/events/1/check-in', payload={})
+            self.getJSON('/api/events/1/registrations?since=' + cursor)
+            reg, = self.json_result['items']
+            self.assertIs(reg['visited'], True)
+            cursor = self.json_result['cursor']
+
+            self.getPage('/api/events/1/registrations/1', method='DELETE')
+            self.assertStatus(200)
+            self.getJSON('/api/events/1/registrations?since=' + cursor)
+            self.assertEqual(self.json_result['items'], [])
+            self.assertEqual(self.json_result['deleted'], [1])
+
+            self.getJSON('/api/events/1/registrations?since=yesterday')
+            self.assertStatus(400)
+
+    def test_generate_invites_csv(self):
+        body = json.dumps({'number': 3})
+        with mock_session(session=user_session_factory()):
+            self.getPage('/api/events/1/invites.csv', method='POST',
+                         body=body, headers=[
+                             ('Content-Length', str(len(body))),
+                             ('Content-Type', 'application/json'),
+                         ])
+        self.assertStatus(200)
+        self.assertEqual(content_type(self.headers),
+                         ('text/csv', {'charset': 'utf-8'}))
+
+        header, *codes = self.body.decode('ascii').splitlines()
+        self.assertEqual(header, 'code')
+        self.assertEqual(len(set(codes)), 3)
+
+        session = Session()
+        self.assertEqual(
+            {i.code for i in session.query(Event).get(1).invites}, set(codes))
+        session.close()
+
+
+class ParticipantsRESTAPITest(TestCase):
+    @orm_session
+    def setUp(self):
+        metadata.create_all()
+        populate_db()
+
+    @orm_session
+    def tearDown(self):
+        metadata.drop_all()
+
+    def post_registration(self, payload):
+        body = json.dumps(payload)
+        return self.getPage('/api/participants', method='POST', body=body,
+                            headers=[
+                                ('Content-Length', str(len(body))),
+                                ('Content-Type', 'application/json'),
+                                ('Idempotency-Key', 'f1d2d2f924e9'),
+                            ])
+
+    def test_create_idempotency(self):
+        self.post_registration({'event': 'nope'})
+        self.assertStatus(400)
+        self.assertNoHeader('Idempotent-Replayed')
+
+        self.post_registration({'event': 'nope'})
+        self.assertStatus(400)
+        self.assertHeader('Idempotent-Replayed', 'true')
+
+        self.post_registration({'event': 'other'})
+        self.assertStatus(422)
+
+    def test_list_all_paginated(self):
+        with mock_session(session=user_session_factory()):
+            self.getJSON('/api/participants?limit=1&fields=name,email')
+            self.assertStatus(200)
+            self.assertEqual(self.json_result, {
+                'items': [{'id': 1, 'name': 'Alice',
+                           'email': 'alice@wonderland.com'}],
+                'cursor': 1,
+            })
+
+            self.getJSON('/api/participants?limit=1&after=1')
+            self.assertStatus(200)
+            self.assertEqual(self.json_result, {'items': [], 'cursor': None})
+
+            self.getJSON('/api/participants?fields=password')
+            self.assertStatus(400)
+
+
+class PlacesRESTAPITest(TestCase):
+    @orm_session
+    def setUp(self):
+        metadata.create_all()
+        populate_db()
+
+    @orm_session
+    def tearDown(self):
+        metadata.drop_all()
+
+    def test_list_places_etag(self):
+        self.getJSON('/api/places')
+        self.assertStatus(200)
+        self.assertEqual(self.json_result[0]['city'], 'Gotham')
+        etag = self.assertHeader('ETag')
+
+        self.getPage('/api/places', headers=[('If-None-Match', etag)])
+        self.assertStatus(304)
+
+    def test_nearest_places_validation(self):
+        self.getPage('/api/places/nearest?lat=91&lng=30')
+        self.assertStatus(400)
+        self.getPage('/api/places/nearest?lat=50&lng=30&k=0')
+        self.assertStatus(400)
+
+    def test_nearest_places_ratelimit(self):
+        cherrypy.config['ratelimit'] = {
+            'nearest_places': [{'per': 'ip', 'rate': 0.01, 'burst': 2}],
+        }
+        try:
+            for _ in range(2):
+                self.getPage('/api/places/nearest?lat=50&lng=30')
+                self.assertStatus(200)
+            self.getPage('/api/places/nearest?lat=50&lng=30')
+            self.assertStatus(429)
+            self.assertHeader('Retry-After', '100')
+        finally:
+            del cherrypy.config['ratelimit']
+            cherrypy.tools.ratelimit.limiter.clear()
+
+        with mock_session(session=user_session_factory()):
+            self.getJSON('/api/metrics')
+        self.assertStatus(200)
+        self.assertIn({'labels': {'result': 'rejected',
+                                  'route': 'nearest_places'},
+                       'value': 1},
+                      self.json_result['counters']['ratelimit_requests_total'])
+
+        with mock_session(session=user_session_factory()):
+            self.getPage('/api/metrics',
+                         headers=[('Accept', 'text/plain;version=0.0.4')])
+        self.assertStatus(200)
+        media_type, params = content_type(self.headers)
+        self.assertEqual(media_type, 'text/plain')
+        self.assertEqual(params['version'], '0.0.4')
+        self.assertInBody('# TYPE http_handler_seconds histogram')
+        self.assertInBody('http_handler_seconds_count{route="nearest_places"}')
+        self.assertInBody(
+            'ratelimit_requests_total{result="rejected",'
+            'route="nearest_places"} 1')
+
 
 # class UserRESTAPITest(TestCase):
 #     @orm_session
@@ -3,14 +3,37 @@ try:
 except ImportError:
     import unittest
 
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+
+from datetime import date
+from types import SimpleNamespace
+
 import cherrypy
 
+from jinja2 import DictLoader, Environment
 from openpyxl import load_workbook
 
 from GDGUkraine.lib.testing import TestCase
+from GDGUkraine.lib.plugins.streams import EventStreamsPlugin
+from GDGUkraine.lib.tools.ratelimit import TokenBucketLimiter, _SUBJECTS
+from GDGUkraine.model import Place
+from GDGUkraine.lib.utils import metrics, timing
+from GDGUkraine.lib.utils.assets import build_assets, is_fingerprinted
+from GDGUkraine.lib.utils.bloom import BloomFilter
+from GDGUkraine.lib.utils.columnar import to_columns
+from GDGUkraine.lib.utils.fragment_cache import FragmentCacheExtension
+from GDGUkraine.lib.utils.geo import KDTree, haversine
+from GDGUkraine.lib.utils.places import PlaceRegistry
+from GDGUkraine.lib.utils.roster import Roster, hash_email
 from GDGUkraine.lib.utils.table_exporter import TableExporter
 from GDGUkraine.lib.utils.url import base_url, url_for
 from GDGUkraine.lib.utils.vcard import pad
+from GDGUkraine.lib.utils.versions import bump_version
 
 
 class UtilTest(TestCase):
@@ -113,6 +136,63 @@ class TableExporterTest(unittest.TestCase):
                     self.assertEqual(entry[col_num].value, getter(test_entry))
 
 
+class MetricsTest(unittest.TestCase):
+    def setUp(self):
+        # Other tests may have recorded metrics already
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_histogram(self):
+        for value in (0.003, 0.01, 20):
+            metrics.observe('handler_seconds', value, buckets=(0.005, 0.01),
+                            route='show')
+        histogram = metrics.snapshot()['histograms']['handler_seconds'][
+            (('route', 'show'),)]
+        self.assertEqual(histogram['buckets'],
+                         [(0.005, 1), (0.01, 2), (float('inf'), 3)])
+        self.assertEqual(histogram['count'], 3)
+        self.assertAlmostEqual(histogram['sum'], 20.013)
+
+    def test_exposition(self):
+        metrics.inc('requests_total', route='say "hi"')
+        metrics.set_gauge('streams', 2)
+        metrics.observe('handler_seconds', 0.5, buckets=(1,), route='show')
+        self.assertEqual(metrics.exposition(), '\n'.join([
+            '# TYPE requests_total counter',
+            'requests_total{route="say \\"hi\\""} 1',
+            '# TYPE streams gauge',
+            'streams 2',
+            '# TYPE handler_seconds histogram',
+            'handler_seconds_bucket{route="show",le="1"} 1',
+            'handler_seconds_bucket{route="show",le="+Inf"} 1',
+            'handler_seconds_sum{route="show"} 0.5',
+            'handler_seconds_count{route="show"} 1',
+            '',
+        ]))
+
+
+class TimingTest(unittest.TestCase):
+    def tearDown(self):
+        del cherrypy.serving.request.timings
+
+    def test_template_timing(self):
+        env = Environment(loader=DictLoader({'hi.html': 'Hi {{ name }}'}),
+                          extensions=[timing.TimingExtension])
+        template = env.get_template('hi.html')
+
+        timing.start()
+        self.assertEqual(template.render(name='GDG'), 'Hi GDG')
+        calls, seconds = cherrypy.serving.request.timings['template']
+        self.assertEqual(calls, 1)
+        self.assertGreater(seconds, 0)
+
+        with timing.timed('google_api'):
+            pass
+        self.assertEqual(cherrypy.serving.request.timings['google_api'][0], 1)
+
+
 class VCardTest(unittest.TestCase):
     testset = [
             (b'asfssad', b'asfssad\0\0\0\0\0\0\0\0\0'),
@@ -132,3 +212,309 @@ class VCardTest(unittest.TestCase):
             with self.subTest(test_type='negative', inp=inp):
                 with self.assertRaises(AssertionError):
                     pad(inp)
+
+
+class FragmentCacheTest(unittest.TestCase):
+    template = ("{% for i in items %}"
+                "{% cache ('item', i) %}{{ i }}{{ render(i) }}{% endcache %}"
+                "{% endfor %}")
+
+    def setUp(self):
+        self.rendered = []
+        env = Environment(loader=DictLoader({'items.html': self.template}),
+                          extensions=[FragmentCacheExtension])
+        self.tmpl = env.get_template('items.html')
+
+    def render(self, items):
+        return self.tmpl.render(items=items,
+                                render=lambda i: self.rendered.append(i) or '')
+
+    def test_fragment_rendered_once(self):
+        self.assertEqual(self.render([1, 2, 1]), '121')
+        self.assertEqual(self.render([2, 1]), '21')
+        self.assertEqual(self.rendered, [1, 2])
+
+    def test_fragment_invalidated_by_model_version(self):
+        self.render([1])
+        bump_version('Event')
+        self.render([1])
+        self.assertEqual(self.rendered, [1, 1])
+
+
+class AssetsBuildTest(unittest.TestCase):
+    def setUp(self):
+        self.static_dir = tempfile.TemporaryDirectory()
+        os.mkdir(os.path.join(self.static_dir.name, 'css'))
+        with open(os.path.join(self.static_dir.name, 'css', 'a.css'), 'w') as f:
+            f.write('body { color: red; }\n' * 100)
+
+    def tearDown(self):
+        self.static_dir.cleanup()
+
+    def test_build_assets(self):
+        manifest = build_assets(self.static_dir.name, ['css'])
+        out_path = manifest['css/a.css']
+        self.assertTrue(is_fingerprinted(out_path))
+        self.assertTrue(os.path.isfile(
+            os.path.join(self.static_dir.name, out_path + '.gz')))
+
+        # Rebuild must not fingerprint its own outputs
+        self.assertEqual(build_assets(self.static_dir.name, ['css']),
+                         manifest)
+
+
+class PlaceRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = PlaceRegistry([
+            Place(id=1, city='Kyiv', name='GDG Kyiv', url='https://kyiv',
+                  geo='50.45,30.52', show='1'),
+            Place(id=2, city='Kyiv', name='Kyiv Women', url='',
+                  geo='50.45,30.52', show='0', master_id=1),
+            Place(id=3, city='Kyiv', name='Kyiv Students', url='',
+                  geo='', show='1', master_id=2),
+        ])
+
+    def test_markers(self):
+        self.assertEqual(self.registry.markers, ({
+            'name': 'GDG Kyiv', 'lat': 50.45, 'lng': 30.52,
+            'url': 'https://kyiv',
+        },))
+
+    def test_json(self):
+        places = json.loads(self.registry.json.decode('utf-8'))
+        self.assertEqual([p['id'] for p in places], [1, 2, 3])
+        self.assertEqual(places[0]['geo'], '50.45,30.52')
+        self.assertEqual(self.registry.etag, '"{}"'.format(
+            hashlib.sha1(self.registry.json).hexdigest()))
+
+
+class GeoTest(unittest.TestCase):
+    CITIES = [
+        (50.4501, 30.5234, 'Kyiv'),
+        (49.8397, 24.0297, 'Lviv'),
+        (49.9935, 36.2304, 'Kharkiv'),
+        (46.4825, 30.7233, 'Odesa'),
+        (48.4647, 35.0462, 'Dnipro'),
+        (48.6208, 22.2879, 'Uzhhorod'),
+        (51.4982, 31.2893, 'Chernihiv'),
+    ]
+
+    def test_haversine(self):
+        self.assertAlmostEqual(haversine(50.4501, 30.5234, 49.8397, 24.0297),
+                               467.5, delta=1)
+        self.assertEqual(haversine(10, 20, 10, 20), 0)
+
+    def test_nearest_cities(self):
+        tree = KDTree(self.CITIES)
+        # Somewhere near Brovary
+        self.assertEqual(
+            [city for _, city in tree.nearest(50.51, 30.80, k=2)],
+            ['Kyiv', 'Chernihiv'],
+        )
+        # Mukachevo
+        (distance, city), = tree.nearest(48.4392, 22.7178)
+        self.assertEqual(city, 'Uzhhorod')
+        self.assertLess(distance, 50)
+
+        self.assertEqual(len(tree.nearest(0, 0, k=100)), len(self.CITIES))
+        self.assertEqual(KDTree([]).nearest(0, 0), [])
+
+    def test_antimeridian(self):
+        tree = KDTree([(0, 179.9, 'east'), (0, 170, 'far east'),
+                       (0, -170, 'far west')])
+        (_, city), = tree.nearest(0, -179.9)
+        self.assertEqual(city, 'east')
+
+    def test_matches_brute_force(self):
+        rnd = random.Random(42)
+        points = [(rnd.uniform(-90, 90), rnd.uniform(-180, 180), i)
+                  for i in range(1000)]
+        tree = KDTree(points)
+        for _ in range(100):
+            lat, lng = rnd.uniform(-90, 90), rnd.uniform(-180, 180)
+            expected = sorted(
+                points, key=lambda p: haversine(lat, lng, p[0], p[1]))[:5]
+            self.assertEqual([item for _, item in tree.nearest(lat, lng, 5)],
+                             [item for _, _, item in expected])
+
+
+class BloomFilterTest(unittest.TestCase):
+    def test_false_positive_rate(self):
+        rnd = random.Random(42)
+        codes = BloomFilter(capacity=1000, error_rate=0.01)
+        issued = ['{:032x}'.format(rnd.getrandbits(128)) for _ in range(1000)]
+        codes.update(issued)
+
+        self.assertEqual(len(codes), 1000)
+        self.assertTrue(all(code in codes for code in issued))
+        false_positives = sum(
+            '{:032x}'.format(rnd.getrandbits(128)) in codes
+            for _ in range(10000))
+        self.assertLess(false_positives, 200)
+        self.assertLess(codes.false_positive_rate(), 0.02)
+
+
+class ColumnarTest(unittest.TestCase):
+    def test_to_columns(self):
+        records = [
+            {'id': 1, 'size': 'm', 'date': date(2016, 10, 8)},
+            {'id': 2, 'size': None, 'date': None},
+            {'id': 3, 'size': 'xl', 'date': date(2016, 10, 9)},
+            {'id': 4, 'size': 'm', 'date': None},
+        ]
+        self.assertEqual(
+            to_columns(iter(records), ['id', 'size', 'date'], ['size']),
+            {
+                'count': 4,
+                'columns': {
+                    'id': [1, 2, 3, 4],
+                    'size': [0, None, 1, 0],
+                    'date': ['2016-10-08', None, '2016-10-09', None],
+                },
+                'dictionaries': {'size': ['m', 'xl']},
+            })
+
+    def test_empty(self):
+        self.assertEqual(to_columns([], ['id'], ['id']), {
+            'count': 0, 'columns': {'id': []}, 'dictionaries': {'id': []},
+        })
+
+
+class RosterTest(unittest.TestCase):
+    def setUp(self):
+        self.roster = Roster([
+            (3, 'Bob', 'Williams', 'bob@example.com', False, False),
+            (1, 'Alice', 'Johns', 'Alice@Wonderland.com', True, True),
+            (12, 'Alicia', 'Keys', 'keys@example.com', True, False),
+        ])
+
+    def search(self, query):
+        return [entry.id for entry in self.roster.search(query)]
+
+    def test_search(self):
+        self.assertEqual(self.search('ali'), [1, 12])
+        self.assertEqual(self.search('  Alice  J'), [1])
+        self.assertEqual(self.search('johns alice'), [1])
+        self.assertEqual(self.search('alice@'), [1])
+        self.assertEqual(self.search('1'), [1, 12])
+        self.assertEqual(self.search('example.com'), [])
+        self.assertEqual(self.search(''), [])
+
+    def test_snapshot(self):
+        alice = self.roster.entries[0]
+        self.assertEqual(alice.email_hash, hash_email('alice@wonderland.com'))
+        self.assertTrue(alice.visited)
+        self.assertNotIn(b'wonderland', self.roster.json)
+        self.assertEqual(
+            [e['id'] for e in json.loads(self.roster.json.decode('utf-8'))],
+            [1, 12, 3])
+        self.assertEqual(self.roster.etag, Roster(reversed([
+            (3, 'Bob', 'Williams', 'bob@example.com', False, False),
+            (1, 'Alice', 'Johns', 'Alice@Wonderland.com', True, True),
+            (12, 'Alicia', 'Keys', 'keys@example.com', True, False),
+        ])).etag)
+
+    def test_large_roster_lookup(self):
+        rnd = random.Random(42)
+        names = ['Olena', 'Taras', 'Iryna', 'Andrii', 'Oksana', 'Dmytro']
+        roster = Roster(
+            (i, rnd.choice(names), 'Surname{}'.format(i),
+             'user{}@example.com'.format(i), True, False)
+            for i in range(5000)
+        )
+        started = time.perf_counter()
+        for query in ('ta', 'surname42', 'user4999@', '4999', 'olena surn'):
+            self.assertTrue(roster.search(query))
+        self.assertLess((time.perf_counter() - started) / 5, 0.01)
+
+
+class TokenBucketLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.limiter = TokenBucketLimiter(maxsize=2, clock=lambda: self.now)
+
+    def test_burst_and_refill(self):
+        for _ in range(3):
+            self.assertEqual(self.limiter.consume('a', rate=0.5, burst=3), 0)
+        self.assertEqual(self.limiter.consume('a', rate=0.5, burst=3), 2)
+
+        self.now = 1.0
+        self.assertEqual(self.limiter.consume('a', rate=0.5, burst=3), 1)
+        self.now = 2.0
+        self.assertEqual(self.limiter.consume('a', rate=0.5, burst=3), 0)
+
+        # Buckets never hold more than burst tokens
+        self.now = 100.0
+        for _ in range(3):
+            self.assertEqual(self.limiter.consume('a', rate=0.5, burst=3), 0)
+        self.assertGreater(self.limiter.consume('a', rate=0.5, burst=3), 0)
+
+    def test_independent_keys(self):
+        self.assertEqual(self.limiter.consume('a', rate=1, burst=1), 0)
+        self.assertGreater(self.limiter.consume('a', rate=1, burst=1), 0)
+        self.assertEqual(self.limiter.consume('b', rate=1, burst=1), 0)
+
+        # Least recently used bucket gets dropped
+        self.assertEqual(self.limiter.consume('c', rate=1, burst=1), 0)
+        self.assertEqual(self.limiter.consume('a', rate=1, burst=1), 0)
+
+    def test_attendee_subject(self):
+        def request(payload):
+            return SimpleNamespace(remote=SimpleNamespace(ip='10.0.0.1'),
+                                   json=payload, params={})
+
+        attendee = _SUBJECTS['attendee']
+        self.assertEqual(
+            attendee(request({'user': {'email': ' Alice@Example.com'}})),
+            ('10.0.0.1', 'alice@example.com'))
+        self.assertNotEqual(
+            attendee(request({'user': {'email': 'alice@example.com'}})),
+            attendee(request({'user': {'email': 'bob@example.com'}})))
+        self.assertIsNone(attendee(request({'user': {}})))
+        self.assertIsNone(attendee(request(None)))
+
+
+class EventStreamsPluginTest(unittest.TestCase):
+    def setUp(self):
+        self.plugin = EventStreamsPlugin(cherrypy.engine)
+        self.plugin.max_streams = 3
+        self.plugin.max_streams_per_event = 2
+        self.plugin.queue_size = 2
+
+    def test_publish(self):
+        first = self.plugin.add_subscription(1)
+        second = self.plugin.add_subscription(1)
+        other = self.plugin.add_subscription(2)
+
+        self.plugin.publish(1, 'registered', {'participant': 5})
+        self.assertEqual(first.get(timeout=0),
+                         ('registered', {'participant': 5}))
+        self.assertEqual(second.get(timeout=0),
+                         ('registered', {'participant': 5}))
+        self.assertIsNone(other.get(timeout=0))
+
+    def test_limits(self):
+        first = self.plugin.add_subscription(1)
+        self.plugin.add_subscription(1)
+        self.assertIsNone(self.plugin.add_subscription(1))
+        self.plugin.add_subscription(2)
+        self.assertIsNone(self.plugin.add_subscription(3))
+
+        # Closing frees the slot
+        first.close()
+        self.plugin.add_subscription(1)
+
+    def test_slow_consumer(self):
+        subscription = self.plugin.add_subscription(1)
+        for i in range(3):
+            self.plugin.publish(1, 'checked_in', {'registrations': [i]})
+
+        self.assertTrue(subscription.closed)
+        self.assertEqual(subscription.get(timeout=0),
+                         ('checked_in', {'registrations': [0]}))
+        self.assertEqual(subscription.get(timeout=0),
+                         ('checked_in', {'registrations': [1]}))
+        self.assertIsNone(subscription.get(timeout=0))
+        # Closed subscriptions don't take slots
+        for event_id in (2, 3, 4):
+            self.plugin.add_subscription(event_id)
@@ -1,6 +1,7 @@
 import unittest
 from GDGUkraine.lib.forms import (
-    RegistrationForm, InputDict,
+    RegistrationForm, InputDict, get_additional_fields_form_cls,
+    compile_form,
 )
 
 
@@ -161,3 +162,70 @@ class ValidatorsTests(unittest.TestCase):
         form = RegistrationForm(['position', 'company'])
         self.assertIsNone(form.position)
         self.assertIsNone(form.company)
+
+    def test_additional_fields_form_cls_cache(self):
+        definitions = [
+            {'name': 'laptop', 'title': 'Laptop', 'type': 'checkbox'},
+            {'name': 'os', 'title': 'OS', 'type': 'select',
+             'options': ['Linux', 'macOS'], 'allow_custom': True},
+        ]
+        form_cls = get_additional_fields_form_cls(definitions)
+        self.assertIs(
+            get_additional_fields_form_cls([dict(d) for d in definitions]),
+            form_cls)
+
+        definitions[1]['options'].append('Windows')
+        self.assertIsNot(get_additional_fields_form_cls(definitions),
+                         form_cls)
+
+        form = form_cls(InputDict({'laptop': 'y', 'os': 'BeOS'}))
+        self.assertTrue(form.validate())
+
+    def test_compiled_form_parity(self):
+        """Compiled validators report exactly what WTForms does"""
+        valid = {
+            'email': 'user@example.com',
+            'gender': 'male',
+            'gplus': '1000000000042',
+            'hometown': 'Exampleville',
+            'name': 'John',
+            'surname': 'Doe',
+            'english_knowledge': 'intermediate',
+            'experience_level': 'newbie',
+            't_shirt_size': 'm',
+        }
+        testsuite = [
+            valid,
+            {},
+            dict(valid, name='   ', surname='x' * 36, email='user@'),
+            dict(valid, www='   ', phone='0' * 21, gender='robot'),
+            dict(valid, www='ftp:/example', t_shirt_size='XXXL'),
+            dict(valid, www='http://example.com', nickname=['a', 'b']),
+        ]
+        compiled = compile_form(RegistrationForm)
+        for data in testsuite:
+            form = RegistrationForm(None, InputDict(data))
+            form.validate()
+            self.assertEqual(compiled.validate(data), form.errors)
+
+        form_cls = get_additional_fields_form_cls([
+            {'name': 'laptop', 'title': 'Laptop', 'type': 'checkbox'},
+            {'name': 'os', 'title': 'OS', 'type': 'select',
+             'options': ['Linux', 'macOS'], 'multiple': True,
+             'allow_custom': True},
+            {'name': 'lang', 'title': 'Language', 'type': 'select',
+             'options': ['Python', 'Go']},
+            {'name': 'team', 'title': 'Team', 'type': 'text',
+             'required': True},
+        ])
+        testsuite = [
+            {},
+            {'laptop': 'false', 'os': ['Linux', 'BeOS'], 'lang': 'Go',
+             'team': 'Core'},
+            {'laptop': 'y', 'os': ['BeOS', 'Plan 9'], 'lang': 'Rust'},
+        ]
+        for data in testsuite:
+            form = form_cls(InputDict(data))
+            form.validate()
+            self.assertEqual(compile_form(form_cls).validate(data),
+                             form.errors)